@@ -1,5 +1,13 @@
+from pydantic import BaseModel, model_validator
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional
+
+
+class ReceiptBackendConfig(BaseModel):
+    name: str
+    url: str
+    api_key: Optional[str] = None  # None: use GEMINI_API_KEY, "": send no key
 
 
 class Settings(BaseSettings):
@@ -9,15 +17,121 @@ class Settings(BaseSettings):
     supabase_service_role_key: str
     supabase_jwt_secret: str
 
+    # Database backend: "supabase" or "fake" (in-process stand-in for load tests)
+    db_backend: str = "supabase"
+    fake_db_latency_ms: float = 0.0
+
     # Gemini
     gemini_api_key: str = ""
 
+    # Receipt parser backends in priority order (empty: Gemini 2.5 Flash only).
+    # With several, slow scans are hedged to the next backend past its p95.
+    receipt_backends: list[ReceiptBackendConfig] = []
+    receipt_hedge_enabled: bool = True
+    receipt_hedge_min_samples: int = 20
+    receipt_hedge_default_delay_s: float = 10.0
+    # Per-backend circuit breaker: opens when at least the failure rate of the
+    # last calls failed or took longer than the slow-call threshold, fails
+    # scans fast for the open period, then lets one probe call through
+    receipt_breaker_enabled: bool = True
+    receipt_breaker_window: int = 20
+    receipt_breaker_min_calls: int = 10
+    receipt_breaker_failure_rate: float = 0.5
+    receipt_breaker_slow_call_s: float = 20.0
+    receipt_breaker_open_s: float = 30.0
+    # Use the model's JSON response schema with compact parallel-array rows
+    receipt_structured_output: bool = False
+
+    # Receipt image storage: "supabase" (Storage buckets) or "local" (files under
+    # STORAGE_LOCAL_DIR behind signed URLs, for tests and development)
+    storage_backend: str = "supabase"
+    storage_receipt_bucket: str = "receipts"
+    storage_thumbnail_bucket: str = "receipt-thumbnails"  # Publicly readable
+    storage_upload_url_ttl_s: float = 600.0
+    storage_local_dir: str = "storage"
+    storage_local_base_url: str = "http://localhost:8000"
+    # Signs local storage URLs; its own key, so it rotates apart from the JWT secret
+    storage_signing_secret: str = ""
+
+    # Background receipt thumbnails for the expense list
+    thumbnail_max_px: int = 320
+    thumbnail_quality: int = 70
+    thumbnail_queue_size: int = 256
+
+    # Idempotency-Key responses are replayable for this long
+    idempotency_ttl_hours: float = 24.0
+
+    # Receipt scan admission control. The concurrency cap counts model calls,
+    # so each strip of a tiled receipt and each hedge takes a slot. Each batch
+    # image costs one token, so a full batch must fit in the burst.
+    scan_rate_per_minute: float = 10.0
+    scan_burst: int = 20
+    scan_max_concurrency: int = 8
+    scan_max_queue: int = 16
+    scan_batch_max_files: int = 20
+    scan_batch_concurrency: int = 5
+    # Reverse proxies (IPs or CIDRs) whose X-Forwarded-For is believed when
+    # rate-limiting anonymous clients; empty: use the connecting address
+    trusted_proxies: list[str] = []
+
+    # Tall receipts (height/width >= min aspect) are scanned as overlapping strips
+    scan_tiling_enabled: bool = True
+    scan_tile_min_aspect: float = 2.5
+    scan_tile_overlap: float = 0.15
+    scan_tile_max_strips: int = 6
+
+    # User search: first pages of hot prefixes are cached per worker
+    user_search_cache_ttl_s: float = 30.0
+    user_search_cache_size: int = 1024
+
+    # Personal balances (GET /api/auth/me/balances), cached per user until a
+    # change in one of their groups
+    balances_cache_ttl_s: float = 300.0
+    balances_cache_size: int = 4096
+
+    # Realtime group events (SSE). Set a Redis URL to share events across workers.
+    events_queue_size: int = 100
+    events_heartbeat_s: float = 15.0
+    events_redis_url: Optional[str] = None
+
+    # Bulk import: expenses written per import_expenses call, longest NDJSON line
+    import_chunk_size: int = 500
+    import_max_line_bytes: int = 1024 * 1024
+
+    # Response compression: gzip, or brotli when installed (pip install brotli).
+    # Smaller responses are sent as they are; -1 turns compression off.
+    compression_min_bytes: int = 1024
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4
+
+    # Profiling (off unless admin IDs or a sample rate are configured)
+    profile_admin_ids: list[str] = []
+    profile_sample_rate: float = 0.0
+    profile_dir: str = "profiles"
+    profile_max_files: int = 100  # Oldest profiles are deleted past this
+
+    # Startup: warm DB/Gemini connections in the lifespan hook, warn past the budget
+    warmup_on_startup: bool = False
+    startup_import_budget_ms: float = 1000.0
+
     # App
     app_env: str = "development"
     app_debug: bool = True
 
     model_config = {"env_file": ".env", "env_file_encoding": "utf-8"}
 
+    @model_validator(mode="after")
+    def _check_scan_limits(self) -> "Settings":
+        if self.scan_batch_max_files > self.scan_burst:
+            raise ValueError("SCAN_BATCH_MAX_FILES must not be larger than SCAN_BURST")
+        return self
+
+    @model_validator(mode="after")
+    def _check_storage_signing_secret(self) -> "Settings":
+        if self.storage_backend == "local" and not self.storage_signing_secret:
+            raise ValueError("STORAGE_SIGNING_SECRET is required with STORAGE_BACKEND=local")
+        return self
+
 
 @lru_cache
 def get_settings() -> Settings:
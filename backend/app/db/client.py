@@ -1,14 +1,101 @@
-from supabase import create_client, Client
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
+
 from app.config import get_settings
+from app.services.metrics import record_db_query
+from app.startup import timed_import
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+    from app.db.fake import FakeDatabase
+
+
+class _TimedQuery:
+    """Proxy for a PostgREST request builder that times ``execute()``."""
+
+    __slots__ = ("_builder", "_table")
+
+    def __init__(self, builder, table: str):
+        self._builder = builder
+        self._table = table
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if hasattr(result, "execute"):
+                return _TimedQuery(result, self._table)
+            return result
+
+        return call
+
+    def execute(self):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            response = self._builder.execute()
+            outcome = "ok"
+            return response
+        finally:
+            record_db_query(self._table, time.perf_counter() - start, outcome)
+
+
+class InstrumentedClient:
+    """Wrap a Supabase client so every query is counted and timed."""
 
+    def __init__(self, client: "Client"):
+        self._client = client
 
-def get_supabase_client() -> Client:
+    def table(self, table_name: str) -> _TimedQuery:
+        return _TimedQuery(self._client.table(table_name), table_name)
+
+    from_ = table
+
+    def rpc(self, fn: str, params: Optional[dict] = None) -> _TimedQuery:
+        return _TimedQuery(self._client.rpc(fn, params or {}), f"rpc:{fn}")
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+
+@lru_cache
+def get_fake_database() -> "FakeDatabase":
+    """Shared in-memory store used when DB_BACKEND=fake."""
+    # Imported here so production never loads the in-memory database
+    from app.db.fake import FakeDatabase
+
+    settings = get_settings()
+    return FakeDatabase(latency=settings.fake_db_latency_ms / 1000)
+
+
+@lru_cache
+def _create_client(url: str, key: str) -> "Client":
+    """Create one client per key and reuse it (and its HTTP connection pool)."""
+    # supabase pulls in most of its dependency tree; import it on first use
+    supabase = timed_import("supabase")
+    return InstrumentedClient(supabase.create_client(url, key))
+
+
+def get_supabase_client() -> "Client":
     """Get Supabase client with anon key (respects RLS)."""
     settings = get_settings()
-    return create_client(settings.supabase_url, settings.supabase_anon_key)
+    if settings.db_backend == "fake":
+        from app.db.fake import FakeClient
+
+        return InstrumentedClient(FakeClient(get_fake_database()))
+    return _create_client(settings.supabase_url, settings.supabase_anon_key)
 
 
-def get_supabase_admin() -> Client:
+def get_supabase_admin() -> "Client":
     """Get Supabase client with service role key (bypasses RLS)."""
     settings = get_settings()
-    return create_client(settings.supabase_url, settings.supabase_service_role_key)
+    if settings.db_backend == "fake":
+        from app.db.fake import FakeClient
+
+        return InstrumentedClient(FakeClient(get_fake_database()))
+    return _create_client(settings.supabase_url, settings.supabase_service_role_key)
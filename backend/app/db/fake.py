@@ -0,0 +1,1013 @@
+"""In-process stand-in for the Supabase/PostgREST query builder.
+
+Implements the subset of supabase-py the routers use (``table().select()
+.eq().in_().or_().order().insert().upsert().update().delete().execute()`` plus
+embedded selects such as ``item_assignments(*)``) on top of in-memory
+tables, so the API can be exercised and load-tested without a live Supabase
+project. Deletes cascade along ``FOREIGN_KEYS`` like the real schema, and
+``rpc()`` calls and row triggers run Python ports of the SQL functions
+(``RPC_FUNCTIONS``, ``TRIGGERS``).
+
+Every ``execute()`` counts as one round trip and can be delayed by a fixed
+latency to approximate a remote PostgREST. Like the real sync client, the
+delay blocks the calling thread.
+"""
+import copy
+import math
+import operator
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Optional
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _api_error(code: str, message: str) -> Exception:
+    # postgrest is heavy to import; only pay for it when an error is raised
+    from postgrest.exceptions import APIError
+
+    return APIError({"code": code, "message": message})
+
+
+# Column defaults applied on insert (mirrors supabase/migration.sql)
+TABLE_DEFAULTS: dict[str, dict[str, Any]] = {
+    "users": {"display_name": "", "avatar_url": None, "created_at": _now},
+    "groups": {"created_at": _now},
+    "group_members": {"role": "member", "net_balance": 0, "joined_at": _now},
+    "group_summaries": {
+        "expense_count": 0,
+        "total_spent": 0,
+        "unpaid_settlement_count": 0,
+        "unpaid_amount": 0,
+        "updated_at": _now,
+    },
+    "expenses": {
+        "version": 1,
+        "description": "",
+        "total_amount": 0,
+        "tax_amount": 0,
+        "tip_amount": 0,
+        "receipt_image_url": None,
+        "receipt_image_key": None,
+        "receipt_thumbnail_url": None,
+        "status": "pending",
+        "created_at": _now,
+        "settlements_version": None,
+    },
+    "receipt_items": {
+        "quantity": 1,
+        "unit_price": 0,
+        "total_price": 0,
+        "created_at": _now,
+    },
+    "item_assignments": {"created_at": _now},
+    "settlements": {"is_paid": False, "expense_version": 1, "created_at": _now},
+    "idempotency_keys": {
+        "request_hash": "",
+        "status_code": None,
+        "response": None,
+        "created_at": _now,
+    },
+}
+
+# table -> {referenced table: foreign key column}
+FOREIGN_KEYS: dict[str, dict[str, str]] = {
+    "groups": {"users": "created_by"},
+    "group_members": {"groups": "group_id", "users": "user_id"},
+    "group_summaries": {"groups": "group_id"},
+    "expenses": {"groups": "group_id", "users": "created_by"},
+    "receipt_items": {"expenses": "expense_id"},
+    "item_assignments": {"receipt_items": "receipt_item_id", "users": "user_id"},
+    "settlements": {"expenses": "expense_id"},
+}
+
+UNIQUE_CONSTRAINTS: dict[str, list[tuple[str, ...]]] = {
+    "users": [("email",)],
+    "group_members": [("group_id", "user_id")],
+    "group_summaries": [("group_id",)],
+    "item_assignments": [("receipt_item_id", "user_id")],
+}
+
+
+@dataclass
+class FakeResponse:
+    data: list[dict]
+    count: Optional[int] = None
+
+
+@dataclass
+class _Embed:
+    alias: str
+    table: str
+    hint: Optional[str]
+    columns: list
+
+
+def _split_top_level(columns: str) -> list[str]:
+    """Split a select list on commas that are not inside parentheses."""
+    parts, depth, current = [], 0, []
+    for ch in columns:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(ch)
+    if "".join(current).strip():
+        parts.append("".join(current).strip())
+    return parts
+
+
+def _parse_columns(columns: str) -> list:
+    """Parse a PostgREST select list into column names and embeds."""
+    parsed: list = []
+    for part in _split_top_level(columns or "*"):
+        if "(" not in part:
+            parsed.append(part)
+            continue
+        head, inner = part.split("(", 1)
+        inner = inner.rsplit(")", 1)[0]
+        alias, _, target = head.partition(":")
+        if not target:
+            alias, target = head, head
+        table, _, hint = target.partition("!")
+        parsed.append(
+            _Embed(
+                alias=alias.strip(),
+                table=table.strip(),
+                hint=hint.strip() or None,
+                columns=_parse_columns(inner),
+            )
+        )
+    return parsed
+
+
+_OPERATORS: dict[str, Callable[[Any, Any], bool]] = {
+    "eq": operator.eq,
+    "neq": operator.ne,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+}
+
+
+def _condition(column: str, op: str, raw: str) -> Callable[[dict], bool]:
+    value = raw[1:-1] if len(raw) > 1 and raw[0] == raw[-1] == '"' else raw
+    compare = _OPERATORS[op]
+
+    def check(row: dict) -> bool:
+        current = row.get(column)
+        if current is None:
+            return False
+        if isinstance(current, bool):
+            return compare(current, value == "true")
+        if isinstance(current, (int, float)):
+            return compare(current, float(value))
+        return compare(current, value)
+
+    return check
+
+
+def _parse_logic(expr: str, combine: Callable) -> Callable[[dict], bool]:
+    """Compile a PostgREST ``or``/``and`` filter body into a row predicate."""
+    conditions = []
+    for part in _split_top_level(expr):
+        if part.startswith(("and(", "or(")):
+            head, inner = part.split("(", 1)
+            conditions.append(_parse_logic(inner[:-1], all if head == "and" else any))
+        else:
+            column, op, value = part.split(".", 2)
+            conditions.append(_condition(column, op, value))
+    return lambda row: combine(c(row) for c in conditions)
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+class FakeDatabase:
+    """In-memory tables shared by every FakeClient."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.round_trips = 0
+        self.tables: dict[str, list[dict]] = {}
+        self._unique: dict[str, dict[tuple[str, ...], set]] = {}
+        self._lock = threading.Lock()
+        # Mirrors the snapsplit.skip_summaries setting used by bulk imports
+        self.skip_summaries = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.tables.clear()
+            self._unique.clear()
+            self.round_trips = 0
+
+    def rows(self, table: str) -> list[dict]:
+        return self.tables.setdefault(table, [])
+
+    def seed(self, table: str, rows: list[dict]) -> list[dict]:
+        """Insert rows directly, without counting a round trip."""
+        with self._lock:
+            return self._insert(table, rows)
+
+    def _insert(self, table: str, rows: list[dict]) -> list[dict]:
+        stored = self.rows(table)
+        new_rows = []
+        for row in rows:
+            full = {"id": str(uuid.uuid4())}
+            for column, default in TABLE_DEFAULTS.get(table, {}).items():
+                full[column] = default() if callable(default) else default
+            full.update({k: _normalize(v) for k, v in row.items()})
+            new_rows.append(full)
+
+        indexes = self._unique_indexes(table)
+        pending: dict[tuple[str, ...], set] = {columns: set() for columns in indexes}
+        for row in new_rows:
+            for columns, seen in indexes.items():
+                key = tuple(row.get(c) for c in columns)
+                if key in seen or key in pending[columns]:
+                    raise _api_error(
+                        "23505",
+                        f'duplicate key value violates unique constraint on {table} ({", ".join(columns)})',
+                    )
+                pending[columns].add(key)
+        for columns, keys in pending.items():
+            indexes[columns].update(keys)
+
+        stored.extend(new_rows)
+        for row in new_rows:
+            self._fire(table, None, row)
+        return new_rows
+
+    def _fire(self, table: str, old: Optional[dict], new: Optional[dict]) -> None:
+        for fn in TRIGGERS.get(table, ()):
+            fn(self, old, new)
+
+    def _cascade(self, table: str, ids: set) -> None:
+        """Apply ON DELETE CASCADE to rows referencing the deleted ``ids``."""
+        for child, references in FOREIGN_KEYS.items():
+            for referenced, fk in references.items():
+                if referenced != table or child not in self.tables:
+                    continue
+                rows = self.tables[child]
+                removed = {r["id"] for r in rows if r.get(fk) in ids}
+                for row in rows:
+                    if row["id"] in removed:
+                        self._fire(child, row, None)
+                if removed:
+                    self.tables[child] = [r for r in rows if r["id"] not in removed]
+                    self._unique.pop(child, None)
+                    self._cascade(child, removed)
+
+    def _unique_indexes(self, table: str) -> dict[tuple[str, ...], set]:
+        """Hash indexes for the table's unique constraints, built on demand."""
+        if table not in self._unique:
+            self._unique[table] = {
+                columns: {tuple(r.get(c) for c in columns) for r in self.rows(table)}
+                for columns in [("id",)] + UNIQUE_CONSTRAINTS.get(table, [])
+            }
+        return self._unique[table]
+
+    def _embed(self, table: str, row: dict, embed: _Embed) -> Any:
+        # Many-to-one: this table holds the foreign key
+        fk = embed.hint or FOREIGN_KEYS.get(table, {}).get(embed.table)
+        if fk and fk in row:
+            for target in self.rows(embed.table):
+                if target["id"] == row[fk]:
+                    return self._project(embed.table, target, embed.columns)
+            return None
+
+        # One-to-many: the embedded table references this one
+        fk = embed.hint or FOREIGN_KEYS.get(embed.table, {}).get(table)
+        if fk is None:
+            raise _api_error(
+                "PGRST200",
+                f"Could not find a relationship between '{table}' and '{embed.table}'",
+            )
+        children = [
+            self._project(embed.table, child, embed.columns)
+            for child in self.rows(embed.table)
+            if child.get(fk) == row["id"]
+        ]
+        # A unique foreign key makes it one-to-one, embedded as an object
+        if (fk,) in UNIQUE_CONSTRAINTS.get(embed.table, []):
+            return children[0] if children else None
+        return children
+
+    def _project(self, table: str, row: dict, columns: list) -> dict:
+        out: dict = {}
+        for column in columns:
+            if isinstance(column, _Embed):
+                out[column.alias] = self._embed(table, row, column)
+            elif column == "*":
+                out.update(copy.deepcopy(row))
+            else:
+                alias, _, name = column.partition(":")
+                if not name:
+                    alias = name = column
+                out[alias.strip()] = copy.deepcopy(row.get(name.strip()))
+        return out
+
+
+class FakeQuery:
+    """Chainable query builder mirroring postgrest's request builders."""
+
+    def __init__(self, db: FakeDatabase, table: str):
+        self._db = db
+        self._table = table
+        self._method = "select"
+        self._columns = "*"
+        self._count: Optional[str] = None
+        self._payload: Any = None
+        self._filters: list = []
+        self._order: list[tuple[str, bool]] = []
+        self._limit: Optional[int] = None
+        self._offset = 0
+
+    # -- Methods ---------------------------------------------------------------
+
+    def select(self, *columns: str, count: Optional[str] = None) -> "FakeQuery":
+        self._method = "select"
+        self._columns = ",".join(columns) or "*"
+        self._count = count
+        return self
+
+    def insert(self, json: Any, **_: Any) -> "FakeQuery":
+        self._method = "insert"
+        self._payload = json if isinstance(json, list) else [json]
+        return self
+
+    def upsert(self, json: Any, on_conflict: str = "id", **_: Any) -> "FakeQuery":
+        self._method = "upsert"
+        self._payload = json if isinstance(json, list) else [json]
+        self._on_conflict = tuple(c.strip() for c in on_conflict.split(","))
+        return self
+
+    def update(self, json: dict, **_: Any) -> "FakeQuery":
+        self._method = "update"
+        self._payload = json
+        return self
+
+    def delete(self, **_: Any) -> "FakeQuery":
+        self._method = "delete"
+        return self
+
+    # -- Filters ---------------------------------------------------------------
+
+    def eq(self, column: str, value: Any) -> "FakeQuery":
+        value = _normalize(value)
+        self._filters.append(lambda r: r.get(column) == value)
+        return self
+
+    def neq(self, column: str, value: Any) -> "FakeQuery":
+        value = _normalize(value)
+        self._filters.append(lambda r: r.get(column) != value)
+        return self
+
+    def in_(self, column: str, values: list) -> "FakeQuery":
+        values = {_normalize(v) for v in values}
+        self._filters.append(lambda r: r.get(column) in values)
+        return self
+
+    def or_(self, filters: str, **_: Any) -> "FakeQuery":
+        """PostgREST logic tree, e.g. ``a.gt.1,and(a.eq.1,b.gt."x")``."""
+        self._filters.append(_parse_logic(filters, any))
+        return self
+
+    # -- Modifiers -------------------------------------------------------------
+
+    def order(self, column: str, desc: bool = False, **_: Any) -> "FakeQuery":
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size: int) -> "FakeQuery":
+        self._limit = size
+        return self
+
+    def range(self, start: int, end: int) -> "FakeQuery":
+        self._offset = start
+        self._limit = end - start + 1
+        return self
+
+    # -- Execution -------------------------------------------------------------
+
+    def _matches(self, row: dict) -> bool:
+        return all(f(row) for f in self._filters)
+
+    def execute(self) -> FakeResponse:
+        db = self._db
+        if db.latency:
+            time.sleep(db.latency)
+
+        with db._lock:
+            db.round_trips += 1
+            rows = db.rows(self._table)
+
+            if self._method == "insert":
+                return FakeResponse(data=copy.deepcopy(db._insert(self._table, self._payload)))
+
+            if self._method == "upsert":
+                by_key = {tuple(r.get(c) for c in self._on_conflict): r for r in rows}
+                written, new_rows = [], []
+                for payload in self._payload:
+                    values = {k: _normalize(v) for k, v in payload.items()}
+                    row = by_key.get(tuple(values.get(c) for c in self._on_conflict))
+                    if row is None:
+                        new_rows.append(values)
+                    else:
+                        old = copy.deepcopy(row)
+                        row.update(values)
+                        db._fire(self._table, old, row)
+                        written.append(copy.deepcopy(row))
+                db._unique.pop(self._table, None)
+                written.extend(copy.deepcopy(db._insert(self._table, new_rows)))
+                return FakeResponse(data=written)
+
+            if self._method == "update":
+                updated = []
+                values = {k: _normalize(v) for k, v in self._payload.items()}
+                for row in rows:
+                    if self._matches(row):
+                        old = copy.deepcopy(row)
+                        row.update(values)
+                        db._fire(self._table, old, row)
+                        updated.append(copy.deepcopy(row))
+                if updated:
+                    db._unique.pop(self._table, None)
+                return FakeResponse(data=updated)
+
+            if self._method == "delete":
+                deleted = [r for r in rows if self._matches(r)]
+                for row in deleted:
+                    db._fire(self._table, row, None)
+                db.tables[self._table] = [r for r in rows if not self._matches(r)]
+                if deleted:
+                    db._unique.pop(self._table, None)
+                    db._cascade(self._table, {r["id"] for r in deleted})
+                return FakeResponse(data=deleted)
+
+            selected = [r for r in rows if self._matches(r)]
+            for column, desc in reversed(self._order):
+                selected.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+            total = len(selected)
+            end = None if self._limit is None else self._offset + self._limit
+            selected = selected[self._offset:end]
+
+            columns = _parse_columns(self._columns)
+            data = [db._project(self._table, row, columns) for row in selected]
+            return FakeResponse(data=data, count=total if self._count else None)
+
+
+# -- SQL functions -------------------------------------------------------------
+# Python ports of the functions in supabase/migration.sql. Each runs under the
+# database lock, so like the real function it is one atomic round trip.
+
+RPC_FUNCTIONS: dict[str, Callable[[FakeDatabase, dict], Any]] = {}
+
+
+def rpc_function(name: str):
+    def register(fn):
+        RPC_FUNCTIONS[name] = fn
+        return fn
+
+    return register
+
+
+@rpc_function("settle_up")
+def _settle_up(db: FakeDatabase, params: dict) -> list[dict]:
+    pair = {params["p_user_a"], params["p_user_b"]}
+    group_id = params.get("p_group_id")
+    expenses = {
+        e["id"]: e
+        for e in db.rows("expenses")
+        if group_id is None or e["group_id"] == group_id
+    }
+    settlements = db.rows("settlements")
+    paid = []
+    for s in settlements:
+        if (
+            not s["is_paid"]
+            and s["expense_id"] in expenses
+            and {s["from_user_id"], s["to_user_id"]} == pair
+        ):
+            old = copy.deepcopy(s)
+            s["is_paid"] = True
+            db._fire("settlements", old, s)
+            paid.append(s)
+
+    for expense_id in {s["expense_id"] for s in paid}:
+        if all(s["is_paid"] for s in settlements if s["expense_id"] == expense_id):
+            expenses[expense_id]["status"] = "settled"
+    return paid
+
+
+def _trigrams(text: str) -> set[str]:
+    """pg_trgm's trigrams: per alphanumeric word, padded with two leading and one trailing space."""
+    grams = set()
+    for word in re.findall(r"[^\W_]+", text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _similarity(a: str, b: str) -> float:
+    ga, gb = _trigrams(a), _trigrams(b)
+    return len(ga & gb) / len(ga | gb) if ga and gb else 0.0
+
+
+@rpc_function("search_users")
+def _search_users(db: FakeDatabase, params: dict) -> list[dict]:
+    query = params["p_query"].lower()
+    after = params.get("p_after_rank")
+    hits = []
+    for user in db.rows("users"):
+        name = user["display_name"].lower()
+        if name.startswith(query) or user["email"].lower().startswith(query):
+            rank = 1.0
+        elif len(query) >= 3 and _similarity(name, query) >= 0.3:
+            rank = _similarity(name, query)
+        else:
+            continue
+        key = (-rank, name, user["id"])
+        if after is not None and key <= (-after, params["p_after_name"], params["p_after_id"]):
+            continue
+        row = {
+            "id": user["id"],
+            "display_name": user["display_name"],
+            "avatar_url": user["avatar_url"],
+            "rank": rank,
+        }
+        hits.append((key, row))
+    hits.sort(key=lambda h: h[0])
+    return [row for _, row in hits[: params.get("p_limit", 20)]]
+
+
+# -- Triggers ------------------------------------------------------------------
+# Row triggers as fn(db, old, new): old is None on insert, new is None on
+# delete. Delete triggers fire while the row is still present, like the
+# BEFORE DELETE trigger on expenses.
+
+TRIGGERS: dict[str, list[Callable[[FakeDatabase, Optional[dict], Optional[dict]], None]]] = {}
+
+
+def trigger(table: str):
+    def register(fn):
+        TRIGGERS.setdefault(table, []).append(fn)
+        return fn
+
+    return register
+
+
+def _find(db: FakeDatabase, table: str, column: str, value: Any) -> Optional[dict]:
+    return next((r for r in db.rows(table) if r[column] == value), None)
+
+
+def _add(row: Optional[dict], **deltas: float) -> None:
+    if row is not None:
+        for column, delta in deltas.items():
+            row[column] = round(row[column] + delta, 2)
+
+
+@trigger("groups")
+def _groups_summary(db: FakeDatabase, old: Optional[dict], new: Optional[dict]) -> None:
+    if old is None and _find(db, "group_summaries", "group_id", new["id"]) is None:
+        db._insert("group_summaries", [{"group_id": new["id"]}])
+
+
+def _apply_settlement_summary(db: FakeDatabase, settlement: dict, sign: int) -> None:
+    if settlement["is_paid"]:
+        return
+    expense = _find(db, "expenses", "id", settlement["expense_id"])
+    if expense is None:
+        return
+    amount = sign * settlement["amount"]
+    _add(
+        _find(db, "group_summaries", "group_id", expense["group_id"]),
+        unpaid_settlement_count=sign,
+        unpaid_amount=amount,
+    )
+    for member in db.rows("group_members"):
+        if member["group_id"] == expense["group_id"]:
+            if member["user_id"] == settlement["to_user_id"]:
+                _add(member, net_balance=amount)
+            elif member["user_id"] == settlement["from_user_id"]:
+                _add(member, net_balance=-amount)
+
+
+@trigger("expenses")
+def _expenses_summary(db: FakeDatabase, old: Optional[dict], new: Optional[dict]) -> None:
+    if db.skip_summaries:
+        return
+    moved = (
+        old is None
+        or new is None
+        or (old["group_id"], old["total_amount"]) != (new["group_id"], new["total_amount"])
+    )
+    if not moved:
+        return
+    if old is not None:
+        _add(
+            _find(db, "group_summaries", "group_id", old["group_id"]),
+            expense_count=-1,
+            total_spent=-old["total_amount"],
+        )
+    if new is None:
+        for settlement in db.rows("settlements"):
+            if settlement["expense_id"] == old["id"]:
+                _apply_settlement_summary(db, settlement, -1)
+    else:
+        _add(
+            _find(db, "group_summaries", "group_id", new["group_id"]),
+            expense_count=1,
+            total_spent=new["total_amount"],
+        )
+
+
+@trigger("settlements")
+def _settlements_summary(db: FakeDatabase, old: Optional[dict], new: Optional[dict]) -> None:
+    if db.skip_summaries:
+        return
+    if old is not None:
+        _apply_settlement_summary(db, old, -1)
+    if new is not None:
+        _apply_settlement_summary(db, new, 1)
+
+
+@rpc_function("refresh_group_summary")
+def _refresh_group_summary(db: FakeDatabase, params: dict) -> None:
+    group_id = params["p_group_id"]
+    expenses = {e["id"]: e for e in db.rows("expenses") if e["group_id"] == group_id}
+    unpaid = [
+        s for s in db.rows("settlements") if s["expense_id"] in expenses and not s["is_paid"]
+    ]
+    summary = _find(db, "group_summaries", "group_id", group_id)
+    if summary is None:
+        summary = db._insert("group_summaries", [{"group_id": group_id}])[0]
+    summary.update(
+        expense_count=len(expenses),
+        total_spent=round(sum(e["total_amount"] for e in expenses.values()), 2),
+        unpaid_settlement_count=len(unpaid),
+        unpaid_amount=round(sum(s["amount"] for s in unpaid), 2),
+    )
+    for member in db.rows("group_members"):
+        if member["group_id"] == group_id:
+            member["net_balance"] = round(
+                sum(s["amount"] for s in unpaid if s["to_user_id"] == member["user_id"])
+                - sum(s["amount"] for s in unpaid if s["from_user_id"] == member["user_id"]),
+                2,
+            )
+
+
+@rpc_function("import_expenses")
+def _import_expenses(db: FakeDatabase, params: dict) -> int:
+    tables = ("expenses", "receipt_items", "item_assignments", "settlements")
+    snapshot = {t: copy.deepcopy(db.rows(t)) for t in tables}
+    db.skip_summaries = True
+    try:
+        for table, key in zip(tables, ("p_expenses", "p_items", "p_assignments", "p_settlements")):
+            db._insert(table, params[key])
+    except Exception:
+        # Roll back the whole chunk, like the real function's transaction
+        db.tables.update(snapshot)
+        for table in tables:
+            db._unique.pop(table, None)
+        raise
+    finally:
+        db.skip_summaries = False
+    return len(params["p_expenses"])
+
+
+@rpc_function("user_balances")
+def _user_balances(db: FakeDatabase, params: dict) -> list[dict]:
+    user_id = params["p_user_id"]
+    groups = {
+        m["group_id"]: _find(db, "groups", "id", m["group_id"])
+        for m in db.rows("group_members")
+        if m["user_id"] == user_id
+    }
+    expenses = {e["id"]: e for e in db.rows("expenses") if e["group_id"] in groups}
+    by_expense: dict[str, list[dict]] = {}
+    for s in db.rows("settlements"):
+        by_expense.setdefault(s["expense_id"], []).append(s)
+
+    debts = []  # (group_id, from, to, amount)
+    for expense_id, expense in expenses.items():
+        settlements = by_expense.get(expense_id, [])
+        if any(s["expense_version"] == expense["version"] for s in settlements):
+            debts += [
+                (expense["group_id"], s["from_user_id"], s["to_user_id"], s["amount"])
+                for s in settlements
+                if not s["is_paid"]
+                and s["expense_version"] == expense["version"]
+                and user_id in (s["from_user_id"], s["to_user_id"])
+            ]
+            continue
+
+        # Settlements missing or stale: shares owed to the payer, net of payments
+        items = [i for i in db.rows("receipt_items") if i["expense_id"] == expense_id]
+        base: dict[str, float] = {}
+        for item in items:
+            assignees = [
+                a["user_id"] for a in db.rows("item_assignments") if a["receipt_item_id"] == item["id"]
+            ]
+            for assignee in assignees:
+                base[assignee] = base.get(assignee, 0) + item["total_price"] / len(assignees)
+        total_base = sum(base.values())
+        overhead = expense["tax_amount"] + expense["tip_amount"]
+        payer = expense["created_by"]
+        for debtor, share in base.items():
+            if debtor == payer or user_id not in (debtor, payer):
+                continue
+            total = round(share + (share / total_base * overhead if total_base else 0), 2)
+            paid = sum(
+                s["amount"] if s["from_user_id"] == debtor else -s["amount"]
+                for s in settlements
+                if s["is_paid"] and {s["from_user_id"], s["to_user_id"]} <= {debtor, payer}
+            )
+            debts.append((expense["group_id"], debtor, payer, total - paid))
+
+    pairs: dict[tuple[str, str], float] = {}
+    for group_id, debtor, creditor, amount in debts:
+        other = creditor if debtor == user_id else debtor
+        signed = amount if creditor == user_id else -amount
+        pairs[(group_id, other)] = pairs.get((group_id, other), 0) + signed
+
+    rows = []
+    for group_id, group in groups.items():
+        matched = [
+            (other, amount)
+            for (g, other), amount in pairs.items()
+            if g == group_id and abs(amount) >= 0.01
+        ]
+        for other, amount in matched or [(None, 0)]:
+            user = _find(db, "users", "id", other) if other else None
+            rows.append(
+                {
+                    "group_id": group_id,
+                    "group_name": group["name"] if group else None,
+                    "counterparty_id": other,
+                    "counterparty_name": user.get("display_name") if user else None,
+                    "amount": round(amount, 2),
+                }
+            )
+    return rows
+
+
+def _round_float_2(x: float) -> float:
+    """Port of round_float_2, which rounds like ``round(x, 2)``."""
+    if abs(x) < 0.004:
+        return 0 * x
+    if abs(x) >= 2**52:
+        return x
+    shift = min(62, 54 - math.floor(math.log2(abs(x))))
+    d = 1 << shift
+    n = abs(int(x * d)) * 100
+    q, r = divmod(n, d)
+    if 2 * r > d or (2 * r == d and q % 2 == 1):
+        q += 1
+    return math.copysign(float(Decimal(q) / 100), x)
+
+
+def _created_order(row: dict) -> tuple:
+    return row["created_at"], row["id"]
+
+
+@rpc_function("generate_settlements")
+def _generate_settlements(db: FakeDatabase, params: dict) -> list[dict]:
+    expense = _find(db, "expenses", "id", params["p_expense_id"])
+    if expense is None:
+        raise _api_error("P0002", "Expense not found")
+    if not any(
+        m["group_id"] == expense["group_id"] and m["user_id"] == params["p_user_id"]
+        for m in db.rows("group_members")
+    ):
+        raise _api_error("42501", "Not a member of this group")
+
+    existing = sorted(
+        (s for s in db.rows("settlements") if s["expense_id"] == expense["id"]),
+        key=_created_order,
+    )
+    if expense["settlements_version"] == expense["version"]:
+        return existing
+
+    items = sorted(
+        (i for i in db.rows("receipt_items") if i["expense_id"] == expense["id"]),
+        key=_created_order,
+    )
+    base: dict[str, float] = {}
+    for item in items:
+        assignees = [
+            a["user_id"]
+            for a in sorted(db.rows("item_assignments"), key=_created_order)
+            if a["receipt_item_id"] == item["id"]
+        ]
+        if not assignees:
+            continue
+        per_person = float(item["total_price"]) / len(assignees)
+        for uid in assignees:
+            base[uid] = base.get(uid, 0.0) + per_person
+    total_base = 0.0
+    for share in base.values():
+        total_base += share
+
+    balances: dict[str, float] = {}
+    for uid, share in base.items():
+        proportion = share / total_base if total_base > 0 else 0.0
+        balances[uid] = 0 - _round_float_2(
+            share
+            + float(expense["tax_amount"]) * proportion
+            + float(expense["tip_amount"]) * proportion
+        )
+    payer = expense["created_by"]
+    balances[payer] = balances.get(payer, 0.0) + float(expense["total_amount"])
+
+    for s in existing:
+        if not s["is_paid"]:
+            db._fire("settlements", s, None)
+    db.tables["settlements"] = [
+        s for s in db.rows("settlements") if s["expense_id"] != expense["id"] or s["is_paid"]
+    ]
+    db._unique.pop("settlements", None)
+    kept = [s for s in existing if s["is_paid"]]
+    for s in kept:
+        old = copy.deepcopy(s)
+        s["expense_version"] = expense["version"]
+        db._fire("settlements", old, s)
+        for uid in (s["from_user_id"], s["to_user_id"]):
+            balances.setdefault(uid, 0.0)
+        balances[s["from_user_id"]] += float(s["amount"])
+        balances[s["to_user_id"]] -= float(s["amount"])
+
+    debtors = sorted(
+        ((uid, -b, n) for n, (uid, b) in enumerate(balances.items()) if b < -0.01),
+        key=lambda d: (-d[1], d[2]),
+    )
+    creditors = sorted(
+        ((uid, b, n) for n, (uid, b) in enumerate(balances.items()) if b > 0.01),
+        key=lambda c: (-c[1], c[2]),
+    )
+    debts = [d[1] for d in debtors]
+    credits = [c[1] for c in creditors]
+    created = []
+    i = j = 0
+    while i < len(debtors) and j < len(creditors):
+        transfer = _round_float_2(min(debts[i], credits[j]))
+        if transfer > 0.01:
+            created += db._insert(
+                "settlements",
+                [
+                    {
+                        "expense_id": expense["id"],
+                        "from_user_id": debtors[i][0],
+                        "to_user_id": creditors[j][0],
+                        "amount": transfer,
+                        "is_paid": False,
+                        "expense_version": expense["version"],
+                    }
+                ],
+            )
+        debts[i] = _round_float_2(debts[i] - transfer)
+        credits[j] = _round_float_2(credits[j] - transfer)
+        if debts[i] < 0.01:
+            i += 1
+        if credits[j] < 0.01:
+            j += 1
+
+    expense["settlements_version"] = expense["version"]
+    if created:
+        expense["status"] = "pending"
+    return kept + created
+
+
+def _delete_where(db: FakeDatabase, table: str, match: Callable[[dict], bool]) -> None:
+    deleted = [r for r in db.rows(table) if match(r)]
+    for row in deleted:
+        db._fire(table, row, None)
+    db.tables[table] = [r for r in db.rows(table) if not match(r)]
+    if deleted:
+        db._unique.pop(table, None)
+        db._cascade(table, {r["id"] for r in deleted})
+
+
+@rpc_function("apply_expense_update")
+def _apply_expense_update(db: FakeDatabase, params: dict) -> list[dict]:
+    expense_id = params["p_expense_id"]
+    expense = _find(db, "expenses", "id", expense_id)
+    if expense is None or expense["version"] != params["p_version"]:
+        raise _api_error("40001", "Expense was modified by someone else")
+
+    snapshot = copy.deepcopy(db.tables)
+    try:
+        old = copy.deepcopy(expense)
+        expense.update(params["p_fields"], version=expense["version"] + 1)
+        db._fire("expenses", old, expense)
+
+        removed = set(params["p_removed_items"])
+        _delete_where(
+            db, "receipt_items", lambda r: r["id"] in removed and r["expense_id"] == expense_id
+        )
+        updates = {u["id"]: u for u in params["p_updated_items"]}
+        for item in db.rows("receipt_items"):
+            if item["id"] in updates and item["expense_id"] == expense_id:
+                old = copy.deepcopy(item)
+                item.update({k: v for k, v in updates[item["id"]].items() if k != "id"})
+                db._fire("receipt_items", old, item)
+        items = {i["id"] for i in db.rows("receipt_items") if i["expense_id"] == expense_id}
+        deletes = set(params["p_assignment_deletes"])
+        _delete_where(
+            db,
+            "item_assignments",
+            lambda a: a["id"] in deletes and a["receipt_item_id"] in items,
+        )
+        db._insert(
+            "receipt_items",
+            [{**item, "expense_id": expense_id} for item in params["p_added_items"]],
+        )
+        db._insert("item_assignments", params["p_assignment_inserts"])
+        _generate_settlements(db, {"p_expense_id": expense_id, "p_user_id": params["p_user_id"]})
+    except Exception:
+        # Roll back everything, like the real function's transaction
+        db.tables.clear()
+        db.tables.update(snapshot)
+        db._unique.clear()
+        raise
+    return [expense]
+
+
+@rpc_function("create_expense")
+def _create_expense(db: FakeDatabase, params: dict) -> list[dict]:
+    user_id = params["p_user_id"]
+    snapshot = copy.deepcopy(db.tables)
+    try:
+        expense = db._insert(
+            "expenses",
+            [{**params["p_expense"], "created_by": user_id, "status": "pending"}],
+        )[0]
+        db._insert(
+            "receipt_items", [{**item, "expense_id": expense["id"]} for item in params["p_items"]]
+        )
+        db._insert("item_assignments", params["p_assignments"])
+        _generate_settlements(db, {"p_expense_id": expense["id"], "p_user_id": user_id})
+        if params.get("p_idempotency_key") is not None:
+            claim = _find(db, "idempotency_keys", "id", params["p_idempotency_key"])
+            if claim is not None:
+                claim.update(status_code=201, response=copy.deepcopy(expense))
+    except Exception:
+        # Roll back everything, like the real function's transaction
+        db.tables.clear()
+        db.tables.update(snapshot)
+        db._unique.clear()
+        raise
+    return [expense]
+
+
+class FakeRpc:
+    """Pending call to a function in ``RPC_FUNCTIONS``."""
+
+    def __init__(self, db: FakeDatabase, fn: str, params: dict):
+        self._db = db
+        self._fn = fn
+        self._params = {k: _normalize(v) for k, v in params.items()}
+
+    def execute(self) -> FakeResponse:
+        db = self._db
+        if db.latency:
+            time.sleep(db.latency)
+
+        with db._lock:
+            db.round_trips += 1
+            if self._fn not in RPC_FUNCTIONS:
+                raise _api_error(
+                    "PGRST202", f"Could not find the function public.{self._fn}"
+                )
+            data = RPC_FUNCTIONS[self._fn](db, self._params)
+            return FakeResponse(data=copy.deepcopy(data))
+
+
+@dataclass
+class FakeClient:
+    """Drop-in for supabase.Client limited to table access and RPC."""
+
+    db: FakeDatabase = field(default_factory=FakeDatabase)
+
+    def table(self, table_name: str) -> FakeQuery:
+        return FakeQuery(self.db, table_name)
+
+    from_ = table
+
+    def rpc(self, fn: str, params: Optional[dict] = None) -> FakeRpc:
+        return FakeRpc(self.db, fn, params or {})
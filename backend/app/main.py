@@ -1,12 +1,64 @@
+import time
+
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+
+from app.startup import timed_import
+
+timed_import("fastapi")
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+
+from app.config import get_settings
+from app.middleware.compression import CompressionMiddleware
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.profiling import ProfilingMiddleware
+from app.services.events import start_event_bridge
+from app.services.metrics import REGISTRY
+from app.services.receipt_backends import close_http_client
+from app.services.thumbnails import get_thumbnail_worker
+from app.startup import log_startup_report, warm_up
+
+# Routers are timed individually so the startup report shows which one is heavy
+auth = timed_import("app.routers.auth")
+groups = timed_import("app.routers.groups")
+receipts = timed_import("app.routers.receipts")
+expenses = timed_import("app.routers.expenses")
+settlements = timed_import("app.routers.settlements")
+users = timed_import("app.routers.users")
+
+_import_seconds = time.perf_counter() - _import_started
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    # Fail fast on missing configuration instead of on the first request
+    settings = get_settings()
+    if settings.warmup_on_startup:
+        await warm_up()
+    log_startup_report(
+        _import_seconds + time.perf_counter() - started,
+        settings.startup_import_budget_ms,
+    )
+    bridge = await start_event_bridge()
+    thumbnails = get_thumbnail_worker()
+    thumbnails.start()
+    yield
+    await thumbnails.close()
+    if bridge is not None:
+        await bridge.close()
+    await close_http_client()
 
-from app.routers import auth, groups, receipts, expenses, settlements
 
 app = FastAPI(
     title="SnapSplit API",
     description="Split receipts fairly with AI-powered receipt scanning",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -16,12 +68,16 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth.router, prefix="/api/auth", tags=["Auth"])
 app.include_router(groups.router, prefix="/api/groups", tags=["Groups"])
 app.include_router(receipts.router, prefix="/api/receipt", tags=["Receipts"])
 app.include_router(expenses.router, prefix="/api/expenses", tags=["Expenses"])
 app.include_router(settlements.router, prefix="/api/settlements", tags=["Settlements"])
+app.include_router(users.router, prefix="/api/users", tags=["Users"])
 
 
 @app.get("/")
@@ -32,3 +88,10 @@ async def root():
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
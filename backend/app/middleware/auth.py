@@ -8,12 +8,9 @@ from app.config import get_settings
 security = HTTPBearer()
 
 
-async def get_current_user_id(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-) -> UUID:
-    """Validate Supabase JWT and extract user ID."""
+def decode_user_id(token: str) -> UUID:
+    """Validate a Supabase JWT and return its subject."""
     settings = get_settings()
-    token = credentials.credentials
 
     try:
         payload = jwt.decode(
@@ -34,3 +31,10 @@ async def get_current_user_id(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Invalid token: {str(e)}",
         )
+
+
+async def get_current_user_id(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> UUID:
+    """Validate Supabase JWT and extract user ID."""
+    return decode_user_id(credentials.credentials)
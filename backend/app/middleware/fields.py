@@ -0,0 +1,60 @@
+from typing import Callable, Iterable, Optional
+
+from fastapi import HTTPException, Query, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def field_selection(model: type[BaseModel]) -> Callable[..., Optional[list[str]]]:
+    """Dependency parsing ``?fields=a,b`` against the top-level fields of ``model``.
+
+    Resolves to None when the parameter is absent, meaning every field.
+    """
+    allowed = list(model.model_fields)
+
+    def dependency(
+        fields: Optional[str] = Query(
+            None,
+            description=f"Comma-separated fields to return: {', '.join(allowed)}",
+        ),
+    ) -> Optional[list[str]]:
+        if fields is None:
+            return None
+        names = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+        unknown = [n for n in names if n not in model.model_fields]
+        if not names or unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(unknown)}" if unknown else "No fields given",
+            )
+        return names
+
+    return dependency
+
+
+def wants(fields: Optional[list[str]], name: str) -> bool:
+    return fields is None or name in fields
+
+
+def select_list(
+    fields: Optional[list[str]], columns: Iterable[str], always: Iterable[str] = ()
+) -> str:
+    """PostgREST select list: the requested ``columns`` plus those the handler needs."""
+    if fields is None:
+        return "*"
+    columns = set(columns)
+    return ", ".join(dict.fromkeys([*always, *(f for f in fields if f in columns)]))
+
+
+def project(data, fields: Optional[list[str]]):
+    """Trim rows to the requested fields.
+
+    The partial rows would not validate against the endpoint's response
+    model, so they are returned as a ready-made response instead.
+    """
+    if fields is None:
+        return data
+    if isinstance(data, list):
+        return JSONResponse(jsonable_encoder([{f: row.get(f) for f in fields} for row in data]))
+    return JSONResponse(jsonable_encoder({f: data.get(f) for f in fields}))
@@ -0,0 +1,63 @@
+import time
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.metrics import (
+    DB_ROUND_TRIPS,
+    HTTP_IN_FLIGHT,
+    HTTP_LATENCY,
+    HTTP_REQUESTS,
+    start_round_trip_count,
+)
+
+
+def _route_label(scope: Scope) -> str:
+    """Use the matched route template so path parameters don't explode cardinality.
+
+    Matched here, before the request is routed, so the in-flight gauge can
+    carry the same label. A route that only matches the path (wrong method)
+    counts, as it does for the router.
+    """
+    partial = None
+    for route in getattr(scope["app"], "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", None) or "unmatched"
+        if match == Match.PARTIAL and partial is None:
+            partial = route
+    return getattr(partial, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Record per-route latency, status codes, in-flight requests and DB round trips."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        route = _route_label(scope)
+        round_trips = start_round_trip_count()
+        HTTP_IN_FLIGHT.inc(method=method, route=route)
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec(method=method, route=route)
+            HTTP_REQUESTS.inc(method=method, route=route, status=str(status_code))
+            HTTP_LATENCY.observe(duration, method=method, route=route)
+            DB_ROUND_TRIPS.observe(round_trips[0], route=route)
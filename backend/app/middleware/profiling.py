@@ -0,0 +1,172 @@
+import asyncio
+import cProfile
+import random
+import sys
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import get_settings
+from app.middleware.auth import decode_user_id
+
+PROFILE_HEADER = "x-profile"
+MODES = ("cprofile", "sample")
+SUFFIXES = (".pstats", ".folded")
+
+
+class StackSampler:
+    """Sample one thread's stack on a timer and count collapsed stacks.
+
+    The output is the "folded" format understood by flamegraph.pl and
+    speedscope: one ``frame;frame;frame count`` line per unique stack.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{Path(code.co_filename).name}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfilingMiddleware:
+    """Profile a single request on demand.
+
+    Admins listed in ``PROFILE_ADMIN_IDS`` send ``X-Profile: cprofile`` (pstats
+    output) or ``X-Profile: sample`` (collapsed stacks for flamegraphs).
+    ``PROFILE_SAMPLE_RATE`` additionally profiles a random fraction of all
+    requests with cProfile. Profiles are written to ``PROFILE_DIR``, which
+    keeps the newest ``PROFILE_MAX_FILES``. Admins get the file name back in
+    the ``X-Profile-Id`` response header; sampled requests don't.
+
+    Only one request is profiled at a time. Profilers see the whole event
+    loop thread, so concurrent requests may show up in the same profile.
+    When neither setting is configured the middleware is a pass-through.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._busy = threading.Lock()
+
+    def _mode_for(self, scope: Scope) -> tuple[Optional[str], bool]:
+        """The profiling mode, and whether an admin asked for it."""
+        settings = get_settings()
+        headers = Headers(scope=scope)
+        requested = headers.get(PROFILE_HEADER)
+        if requested and settings.profile_admin_ids:
+            scheme, _, token = headers.get("authorization", "").partition(" ")
+            try:
+                user_id = decode_user_id(token) if scheme.lower() == "bearer" else None
+            except HTTPException:
+                user_id = None
+            if user_id is not None and str(user_id) in settings.profile_admin_ids:
+                return (requested if requested in MODES else "cprofile"), True
+        if settings.profile_sample_rate and random.random() < settings.profile_sample_rate:
+            return "cprofile", False
+        return None, False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        settings = get_settings()
+        enabled = settings.profile_admin_ids or settings.profile_sample_rate
+        if not enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        mode, requested = self._mode_for(scope)
+        if mode is None or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self._profile(mode, requested, scope, receive, send)
+        finally:
+            self._busy.release()
+
+    async def _profile(
+        self, mode: str, requested: bool, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        suffix = ".pstats" if mode == "cprofile" else ".folded"
+        path_slug = scope["path"].strip("/").replace("/", "_") or "root"
+        profile_id = (
+            f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+            f"-{scope['method']}-{path_slug}{suffix}"
+        )
+
+        async def send_wrapper(message: Message) -> None:
+            if requested and message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode())
+                ]
+            await send(message)
+
+        profiler = None
+        sampler = None
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            sampler = StackSampler(threading.get_ident())
+            sampler.start()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            else:
+                sampler.stop()
+            settings = get_settings()
+            await asyncio.to_thread(
+                _save,
+                Path(settings.profile_dir) / profile_id,
+                profiler,
+                sampler,
+                settings.profile_max_files,
+            )
+
+
+def _save(
+    path: Path,
+    profiler: Optional[cProfile.Profile],
+    sampler: Optional[StackSampler],
+    max_files: int,
+) -> None:
+    """Write one profile, then delete the oldest beyond ``max_files``."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if profiler is not None:
+        profiler.dump_stats(path)
+    else:
+        path.write_text(sampler.folded())
+
+    # Profile ids start with the time, so names sort oldest first
+    profiles = sorted(p for p in path.parent.iterdir() if p.suffix in SUFFIXES)
+    for old in profiles[: max(len(profiles) - max_files, 0)]:
+        old.unlink(missing_ok=True)
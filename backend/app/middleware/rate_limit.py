@@ -0,0 +1,79 @@
+import ipaddress
+import math
+from functools import lru_cache
+
+from fastapi import HTTPException, Request, status
+
+from app.config import get_settings
+from app.middleware.auth import decode_user_id
+from app.services.admission import TokenBucketLimiter
+from app.services.metrics import ADMISSION_REJECTIONS
+
+
+@lru_cache
+def get_scan_rate_limiter() -> TokenBucketLimiter:
+    settings = get_settings()
+    return TokenBucketLimiter(
+        rate=settings.scan_rate_per_minute / 60, burst=settings.scan_burst
+    )
+
+
+@lru_cache
+def _proxy_networks(proxies: tuple[str, ...]) -> tuple:
+    return tuple(ipaddress.ip_network(p, strict=False) for p in proxies)
+
+
+def _is_trusted_proxy(host: str) -> bool:
+    networks = _proxy_networks(tuple(get_settings().trusted_proxies))
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def client_ip(request: Request) -> str:
+    """The address of the peer, or of the client behind our own proxies.
+
+    X-Forwarded-For is only read when the peer is in TRUSTED_PROXIES. Each
+    proxy appends the address it received the request from, so the list is
+    walked from the right, skipping our proxies. The first other address is
+    the client. Anything to its left was sent by the client and can be
+    spoofed.
+    """
+    host = request.client.host if request.client else "unknown"
+    if not _is_trusted_proxy(host):
+        return host
+    hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",")]
+    for hop in reversed([h for h in hops if h]):
+        if not _is_trusted_proxy(hop):
+            return hop
+        host = hop
+    return host
+
+
+def client_key(request: Request) -> str:
+    """Rate-limit by user when a valid token is sent, otherwise by client IP."""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            return f"user:{decode_user_id(token)}"
+        except HTTPException:
+            pass
+    return f"ip:{client_ip(request)}"
+
+
+def check_scan_rate(request: Request, cost: int = 1) -> None:
+    """Charge ``cost`` scans to the caller; 429 once their token bucket is empty."""
+    wait = get_scan_rate_limiter().acquire(client_key(request), cost)
+    if wait:
+        ADMISSION_REJECTIONS.inc(reason="rate_limit")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many receipt scans, slow down",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
+        )
+
+
+async def rate_limit_scans(request: Request) -> None:
+    check_scan_rate(request)
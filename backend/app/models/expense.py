@@ -1,7 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from uuid import UUID
-from typing import Optional
+from typing import Literal, Optional
 from enum import Enum
 
 
@@ -49,9 +49,57 @@ class ExpenseCreate(BaseModel):
     tax_amount: float = 0.0
     tip_amount: float = 0.0
     receipt_image_url: Optional[str] = None
+    # Key returned by POST /api/receipt/uploads; a thumbnail is made in the background
+    receipt_image_key: Optional[str] = None
     items: list[ReceiptItemCreate] = []
 
 
+class ExpenseImport(ExpenseCreate):
+    """One line of a bulk import; ``group_id`` defaults to the import's group."""
+    paid_by: Optional[UUID] = None  # Defaults to the importing user
+    created_at: Optional[datetime] = None
+    settled: bool = False  # Settlements are imported as already paid
+
+
+class ImportLineError(BaseModel):
+    line: int
+    error: str
+
+
+class ImportResult(BaseModel):
+    imported: int
+    failed: int
+    # The first invalid lines, in order; ``failed`` counts all of them
+    errors: list[ImportLineError] = []
+    # Set when the upload was cut short (e.g. an oversized line)
+    aborted: Optional[str] = None
+
+
+class ReceiptItemUpdate(BaseModel):
+    """Changes to an existing item; omitted fields are left as they are.
+
+    ``assigned_user_ids``, when given, is the complete new assignment list.
+    """
+    id: UUID
+    item_name: Optional[str] = None
+    quantity: Optional[int] = None
+    unit_price: Optional[float] = None
+    total_price: Optional[float] = None
+    assigned_user_ids: Optional[list[UUID]] = None
+
+
+class ExpenseUpdate(BaseModel):
+    description: Optional[str] = None
+    total_amount: Optional[float] = None
+    tax_amount: Optional[float] = None
+    tip_amount: Optional[float] = None
+    # Rejects the edit with 409 if the expense has moved past this version
+    expected_version: Optional[int] = None
+    items_added: list[ReceiptItemCreate] = []
+    items_updated: list[ReceiptItemUpdate] = []
+    items_removed: list[UUID] = []
+
+
 class ExpenseOut(BaseModel):
     id: UUID
     group_id: UUID
@@ -61,7 +109,10 @@ class ExpenseOut(BaseModel):
     tax_amount: float
     tip_amount: float
     receipt_image_url: Optional[str] = None
+    receipt_image_key: Optional[str] = None
+    receipt_thumbnail_url: Optional[str] = None
     status: ExpenseStatus
+    version: int = 1
     created_at: datetime
 
 
@@ -76,12 +127,48 @@ class SettlementOut(BaseModel):
     to_user_id: UUID
     amount: float
     is_paid: bool
+    expense_version: int = 1
     created_at: datetime
 
 
+class SettleUpRequest(BaseModel):
+    user_id: UUID  # The other person; the caller is always one side
+    group_id: Optional[UUID] = None
+
+
+class TransferCost(BaseModel):
+    from_user_id: UUID
+    to_user_id: UUID
+    cost: float = Field(ge=0)  # Per unit of money sent; 1 when not given
+
+
+class SettlementPlanRequest(BaseModel):
+    mode: Literal["greedy", "min_cost_flow"] = "min_cost_flow"
+    # user -> the only people who may pay them (min_cost_flow only)
+    allowed_payers: dict[UUID, list[UUID]] = {}
+    costs: list[TransferCost] = []
+
+
+class PlannedTransfer(BaseModel):
+    from_user_id: UUID
+    to_user_id: UUID
+    amount: float
+
+
+class SettlementPlan(BaseModel):
+    mode: str
+    transfers: list[PlannedTransfer] = []
+
+
 class UserShare(BaseModel):
     user_id: UUID
     base_share: float
     tax_share: float
     tip_share: float
     total: float
+
+
+class ExpenseUpdateResult(BaseModel):
+    expense: ExpenseOut
+    # Only users whose share changed; users left with nothing have zero totals
+    changed_shares: list[UserShare] = []
@@ -21,6 +21,19 @@ class GroupOut(BaseModel):
     created_at: datetime
 
 
+class GroupSummary(BaseModel):
+    expense_count: int = 0
+    total_spent: float = 0.0
+    unpaid_settlement_count: int = 0
+    unpaid_amount: float = 0.0
+    # Unpaid settlements owed to (+) or by (-) the requesting user
+    my_balance: float = 0.0
+
+
+class GroupWithSummary(GroupOut):
+    summary: GroupSummary = GroupSummary()
+
+
 class GroupDetail(GroupOut):
     members: list["GroupMemberOut"] = []
 
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import Optional
+from datetime import datetime
+from typing import Literal, Optional
 
 
 class ParsedReceiptItem(BaseModel):
@@ -12,3 +13,27 @@ class ReceiptScanResponse(BaseModel):
     items: list[ParsedReceiptItem]
     raw_text: Optional[str] = None
     confidence: Optional[float] = None
+
+
+class BatchScanResult(BaseModel):
+    index: int
+    filename: Optional[str] = None
+    items: list[ParsedReceiptItem] = []
+    error: Optional[str] = None
+
+
+class BatchScanResponse(BaseModel):
+    results: list[BatchScanResult]
+
+
+class UploadRequest(BaseModel):
+    content_type: Literal["image/jpeg", "image/png", "image/webp", "image/heic"]
+
+
+class UploadTicket(BaseModel):
+    """Where and how to upload one receipt image, then refer to it by ``key``."""
+    key: str
+    url: str
+    method: str = "PUT"
+    headers: dict[str, str] = {}
+    expires_at: datetime
@@ -18,3 +18,37 @@ class UserOut(UserBase):
 class UserUpdate(BaseModel):
     display_name: Optional[str] = None
     avatar_url: Optional[str] = None
+
+
+class UserSearchHit(BaseModel):
+    id: UUID
+    display_name: str
+    avatar_url: Optional[str] = None
+
+
+class UserSearchResult(BaseModel):
+    results: list[UserSearchHit] = []
+    # Pass back as ``cursor`` for the next page; None on the last page
+    next_cursor: Optional[str] = None
+
+
+class CounterpartyBalance(BaseModel):
+    user_id: UUID
+    display_name: Optional[str] = None
+    # Positive: they owe you; negative: you owe them
+    amount: float
+
+
+class GroupBalance(BaseModel):
+    group_id: UUID
+    name: str
+    amount: float = 0.0
+    counterparties: list[CounterpartyBalance] = []
+
+
+class BalanceSummary(BaseModel):
+    you_owe: float = 0.0
+    you_are_owed: float = 0.0
+    # Per person, netted across groups
+    people: list[CounterpartyBalance] = []
+    groups: list[GroupBalance] = []
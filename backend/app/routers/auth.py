@@ -3,7 +3,8 @@ from uuid import UUID
 
 from app.middleware.auth import get_current_user_id
 from app.db.client import get_supabase_admin
-from app.models.user import UserOut, UserUpdate
+from app.models.user import BalanceSummary, UserOut, UserUpdate
+from app.services.balances import get_balance_cache, summarize
 
 router = APIRouter()
 
@@ -20,6 +21,26 @@ async def get_me(user_id: UUID = Depends(get_current_user_id)):
     return result.data[0]
 
 
+@router.get("/me/balances", response_model=BalanceSummary)
+async def get_my_balances(user_id: UUID = Depends(get_current_user_id)):
+    """What the current user owes and is owed, per group and per person.
+
+    One aggregate query over settlements and, for expenses whose settlements
+    haven't been generated yet, item shares. Cached until one of the user's
+    groups changes.
+    """
+    cache = get_balance_cache()
+    summary = cache.get(str(user_id))
+    if summary is not None:
+        return summary
+
+    db = get_supabase_admin()
+    result = db.rpc("user_balances", {"p_user_id": str(user_id)}).execute()
+    summary = summarize(result.data)
+    cache.set(str(user_id), summary)
+    return summary
+
+
 @router.put("/me", response_model=UserOut)
 async def update_me(
     updates: UserUpdate,
@@ -1,27 +1,88 @@
-from fastapi import APIRouter, Depends, HTTPException
-from uuid import UUID
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import JSONResponse
+from typing import Optional
+from uuid import UUID, uuid4
 
+from app.config import get_settings
 from app.middleware.auth import get_current_user_id
+from app.middleware.fields import field_selection, project, select_list, wants
 from app.db.client import get_supabase_admin
 from app.models.expense import (
     ExpenseCreate,
     ExpenseOut,
     ExpenseDetail,
+    ExpenseUpdate,
+    ExpenseUpdateResult,
     UserShare,
 )
+from app.services import idempotency
+from app.services.events import get_event_hub
 from app.services.splitter import calculate_shares
+from app.services.storage import is_upload_key
+from app.services.thumbnails import get_thumbnail_worker
 
 router = APIRouter()
 
+EXPENSE_FIELDS = {"description", "total_amount", "tax_amount", "tip_amount"}
+ITEM_FIELDS = {"item_name", "quantity", "unit_price", "total_price"}
+NEW_EXPENSE_FIELDS = EXPENSE_FIELDS | {"group_id", "receipt_image_url", "receipt_image_key"}
+EXPENSE_COLUMNS = set(ExpenseOut.model_fields)
+
 
 @router.post("", response_model=ExpenseOut, status_code=201)
 async def create_expense(
     expense: ExpenseCreate,
     user_id: UUID = Depends(get_current_user_id),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
-    """Create an expense with receipt items and assignments."""
+    """Create an expense with receipt items and assignments.
+
+    With an ``Idempotency-Key`` header, retries of the same request return
+    the original response instead of creating a duplicate expense.
+    """
     db = get_supabase_admin()
 
+    if not idempotency_key:
+        return _create_expense(db, expense, user_id)
+
+    key = f"POST /api/expenses:{user_id}:{idempotency_key}"
+    fingerprint = idempotency.request_fingerprint(expense.model_dump(mode="json"))
+    record = idempotency.claim(
+        db, key, fingerprint, get_settings().idempotency_ttl_hours * 3600
+    )
+    if record is not None:
+        if record["request_hash"] != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used for a different request",
+            )
+        if record["response"] is None:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still in progress",
+            )
+        # The stored response is the expense row, sent as response_model would
+        return JSONResponse(
+            ExpenseOut.model_validate(record["response"]).model_dump(mode="json"),
+            status_code=record["status_code"],
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    from postgrest.exceptions import APIError
+
+    try:
+        return _create_expense(db, expense, user_id, key)
+    except (HTTPException, APIError):
+        # Rejected, or rolled back by the database: nothing was written, so
+        # free the key for a retry. On any other error the write may have
+        # committed, so the key stays claimed rather than risk a duplicate.
+        idempotency.release(db, key)
+        raise
+
+
+def _create_expense(
+    db, expense: ExpenseCreate, user_id: UUID, idempotency_key: Optional[str] = None
+) -> dict:
     # Verify user is in the group
     membership = (
         db.table("group_members")
@@ -33,68 +94,195 @@ async def create_expense(
     if not membership.data:
         raise HTTPException(status_code=403, detail="Not a member of this group")
 
-    # Create expense
-    expense_result = (
-        db.table("expenses")
-        .insert(
+    if expense.receipt_image_key and not is_upload_key(expense.receipt_image_key, user_id):
+        raise HTTPException(status_code=400, detail="Unknown receipt_image_key")
+
+    # Ids are assigned here so the assignments go in the same call
+    items: list[dict] = []
+    assignments: list[dict] = []
+    for item in expense.items:
+        row = {"id": str(uuid4()), **item.model_dump(include=ITEM_FIELDS)}
+        user_ids = list(dict.fromkeys(str(u) for u in item.assigned_user_ids))
+        assignments += [{"receipt_item_id": row["id"], "user_id": u} for u in user_ids]
+        items.append(row)
+
+    # One transaction: the expense, its items, assignments and settlements,
+    # and the Idempotency-Key response, so a failure leaves nothing behind
+    created = db.rpc(
+        "create_expense",
+        {
+            "p_user_id": str(user_id),
+            "p_expense": expense.model_dump(mode="json", include=NEW_EXPENSE_FIELDS),
+            "p_items": items,
+            "p_assignments": assignments,
+            "p_idempotency_key": idempotency_key,
+        },
+    ).execute()
+    expense_data = created.data[0]
+    expense_id = expense_data["id"]
+
+    if expense.receipt_image_key:
+        get_thumbnail_worker().submit(expense_id, expense.receipt_image_key)
+    get_event_hub().publish(expense.group_id, "expense.created", expense_data)
+    return expense_data
+
+
+def _shares_by_user(items: list[dict], expense_data: dict) -> dict[str, UserShare]:
+    shares = calculate_shares(
+        items=[
             {
-                "group_id": str(expense.group_id),
-                "created_by": str(user_id),
-                "description": expense.description,
-                "total_amount": expense.total_amount,
-                "tax_amount": expense.tax_amount,
-                "tip_amount": expense.tip_amount,
-                "receipt_image_url": expense.receipt_image_url,
-                "status": "pending",
+                "total_price": item["total_price"],
+                "assigned_user_ids": [a["user_id"] for a in item["item_assignments"]],
             }
-        )
-        .execute()
+            for item in items
+        ],
+        tax_amount=expense_data["tax_amount"],
+        tip_amount=expense_data["tip_amount"],
     )
+    return {str(s.user_id): s for s in shares}
+
 
+@router.patch("/{expense_id}", response_model=ExpenseUpdateResult)
+async def update_expense(
+    expense_id: UUID,
+    changes: ExpenseUpdate,
+    user_id: UUID = Depends(get_current_user_id),
+):
+    """Edit an expense's fields, items and assignments.
+
+    The current items are diffed against the requested changes, and only the
+    rows that differ are written, in one ``apply_expense_update`` call. That
+    call bumps the expense version and regenerates the settlements in the
+    same transaction. Only the shares that changed are returned.
+    """
+    db = get_supabase_admin()
+
+    expense_result = (
+        db.table("expenses").select("*").eq("id", str(expense_id)).execute()
+    )
     if not expense_result.data:
-        raise HTTPException(status_code=500, detail="Failed to create expense")
+        raise HTTPException(status_code=404, detail="Expense not found")
 
     expense_data = expense_result.data[0]
-    expense_id = expense_data["id"]
 
-    # Create receipt items and assignments
-    for item in expense.items:
-        item_result = (
-            db.table("receipt_items")
-            .insert(
-                {
-                    "expense_id": expense_id,
-                    "item_name": item.item_name,
-                    "quantity": item.quantity,
-                    "unit_price": item.unit_price,
-                    "total_price": item.total_price,
-                }
-            )
-            .execute()
-        )
+    membership = (
+        db.table("group_members")
+        .select("id")
+        .eq("group_id", expense_data["group_id"])
+        .eq("user_id", str(user_id))
+        .execute()
+    )
+    if not membership.data:
+        raise HTTPException(status_code=403, detail="Not a member of this group")
+
+    version = expense_data["version"]
+    if changes.expected_version is not None and changes.expected_version != version:
+        raise HTTPException(status_code=409, detail="Expense was modified by someone else")
+
+    items_result = (
+        db.table("receipt_items")
+        .select("*, item_assignments(id, user_id)")
+        .eq("expense_id", str(expense_id))
+        .execute()
+    )
+    items = {item["id"]: item for item in items_result.data}
+
+    removed_ids = {str(i) for i in changes.items_removed}
+    touched_ids = {str(u.id) for u in changes.items_updated}
+    if not (removed_ids | touched_ids) <= items.keys():
+        raise HTTPException(status_code=404, detail="Item not found in this expense")
+    if removed_ids & touched_ids:
+        raise HTTPException(status_code=422, detail="Cannot update and remove the same item")
+
+    old_shares = _shares_by_user(list(items.values()), expense_data)
 
-        if item_result.data and item.assigned_user_ids:
-            item_id = item_result.data[0]["id"]
-            assignments = [
-                {"receipt_item_id": item_id, "user_id": str(uid)}
-                for uid in item.assigned_user_ids
+    # Work out the item and assignment rows that actually change
+    item_updates: list[dict] = []
+    assignment_inserts: list[dict] = []
+    assignment_deletes: list[str] = []
+    for update in changes.items_updated:
+        item = items[str(update.id)]
+        fields = update.model_dump(include=ITEM_FIELDS, exclude_none=True)
+        if any(item[k] != v for k, v in fields.items()):
+            item.update(fields)
+            item_updates.append({k: item[k] for k in ITEM_FIELDS | {"id"}})
+
+        if update.assigned_user_ids is not None:
+            current = {a["user_id"]: a["id"] for a in item["item_assignments"]}
+            wanted = list(dict.fromkeys(str(u) for u in update.assigned_user_ids))
+            assignment_inserts += [
+                {"receipt_item_id": item["id"], "user_id": u}
+                for u in wanted
+                if u not in current
             ]
-            db.table("item_assignments").insert(assignments).execute()
+            assignment_deletes += [a_id for u, a_id in current.items() if u not in wanted]
+            item["item_assignments"] = [{"user_id": u} for u in wanted]
 
-    return expense_data
+    for item_id in removed_ids:
+        del items[item_id]
+
+    # Ids are assigned here so the new items' assignments go in the same call
+    items_added: list[dict] = []
+    for item in changes.items_added:
+        row = {"id": str(uuid4()), **item.model_dump(include=ITEM_FIELDS)}
+        user_ids = list(dict.fromkeys(str(u) for u in item.assigned_user_ids))
+        assignment_inserts += [{"receipt_item_id": row["id"], "user_id": u} for u in user_ids]
+        items_added.append(row)
+        items[row["id"]] = {**row, "item_assignments": [{"user_id": u} for u in user_ids]}
+
+    from postgrest.exceptions import APIError
+
+    # One transaction: the version bump, conditioned on the version read
+    # above, and every row write, or nothing if another edit got in first
+    try:
+        bumped = db.rpc(
+            "apply_expense_update",
+            {
+                "p_expense_id": str(expense_id),
+                "p_user_id": str(user_id),
+                "p_version": version,
+                "p_fields": changes.model_dump(include=EXPENSE_FIELDS, exclude_none=True),
+                "p_removed_items": sorted(removed_ids),
+                "p_updated_items": item_updates,
+                "p_added_items": items_added,
+                "p_assignment_deletes": assignment_deletes,
+                "p_assignment_inserts": assignment_inserts,
+            },
+        ).execute()
+    except APIError as e:
+        if e.code == "40001":
+            raise HTTPException(status_code=409, detail="Expense was modified by someone else")
+        raise
+    expense_data = bumped.data[0]
+
+    new_shares = _shares_by_user(list(items.values()), expense_data)
+    changed = [s for uid, s in new_shares.items() if old_shares.get(uid) != s]
+    changed += [
+        UserShare(user_id=uid, base_share=0, tax_share=0, tip_share=0, total=0)
+        for uid in old_shares.keys() - new_shares.keys()
+    ]
+    get_event_hub().publish(expense_data["group_id"], "expense.updated", expense_data)
+    return {"expense": expense_data, "changed_shares": changed}
 
 
 @router.get("/{expense_id}", response_model=ExpenseDetail)
 async def get_expense(
     expense_id: UUID,
+    fields: Optional[list[str]] = Depends(field_selection(ExpenseDetail)),
     user_id: UUID = Depends(get_current_user_id),
 ):
-    """Get expense details including items and assignments."""
+    """Get expense details including items and assignments.
+
+    With ``fields``, only those columns are read, and items only if listed.
+    """
     db = get_supabase_admin()
 
     # Fetch expense
     expense_result = (
-        db.table("expenses").select("*").eq("id", str(expense_id)).execute()
+        db.table("expenses")
+        .select(select_list(fields, EXPENSE_COLUMNS, always=["group_id"]))
+        .eq("id", str(expense_id))
+        .execute()
     )
 
     if not expense_result.data:
@@ -113,6 +301,9 @@ async def get_expense(
     if not membership.data:
         raise HTTPException(status_code=403, detail="Not a member of this group")
 
+    if not wants(fields, "items"):
+        return project(expense_data, fields)
+
     # Fetch items with assignments
     items_result = (
         db.table("receipt_items")
@@ -128,7 +319,7 @@ async def get_expense(
         items.append(item_data)
 
     expense_data["items"] = items
-    return expense_data
+    return project(expense_data, fields)
 
 
 @router.get("/{expense_id}/shares", response_model=list[UserShare])
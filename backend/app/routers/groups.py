@@ -1,18 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException
+import csv
+import io
+import json
+from typing import Iterator, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from uuid import UUID
 
+from app.config import get_settings
 from app.middleware.auth import get_current_user_id
+from app.middleware.fields import field_selection, project, select_list, wants
 from app.db.client import get_supabase_admin
 from app.models.group import (
     GroupCreate,
     GroupOut,
+    GroupWithSummary,
     GroupDetail,
     GroupMemberOut,
     AddMemberRequest,
 )
+from app.models.expense import ImportResult
+from app.services.bulk_import import run_import
+from app.services.events import Subscription, get_event_hub
 
 router = APIRouter()
 
+GROUP_COLUMNS = set(GroupOut.model_fields)
+
+# Expenses fetched per export query (each with its items and settlements)
+EXPORT_PAGE_SIZE = 200
+# Flush the export buffer to the client once it holds this much
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_COLUMNS = [
+    "record",
+    "id",
+    "expense_id",
+    "receipt_item_id",
+    "created_at",
+    "created_by",
+    "description",
+    "total_amount",
+    "tax_amount",
+    "tip_amount",
+    "status",
+    "item_name",
+    "quantity",
+    "unit_price",
+    "total_price",
+    "user_id",
+    "from_user_id",
+    "to_user_id",
+    "amount",
+    "is_paid",
+]
+
 
 @router.post("", response_model=GroupOut, status_code=201)
 async def create_group(
@@ -46,42 +87,49 @@ async def create_group(
     return group_data
 
 
-@router.get("", response_model=list[GroupOut])
-async def list_groups(user_id: UUID = Depends(get_current_user_id)):
-    """List all groups the current user is a member of."""
+@router.get("", response_model=list[GroupWithSummary])
+async def list_groups(
+    fields: Optional[list[str]] = Depends(field_selection(GroupWithSummary)),
+    user_id: UUID = Depends(get_current_user_id),
+):
+    """List all groups the current user is a member of, with dashboard totals.
+
+    The totals come from ``group_summaries`` and ``group_members.net_balance``,
+    which triggers keep current, so this is one query however long each
+    group's history is. ``fields`` limits the columns read and returned.
+    """
     db = get_supabase_admin()
 
-    # Get group IDs where user is a member
+    columns = select_list(fields, GROUP_COLUMNS, always=["created_at"])
+    if wants(fields, "summary"):
+        columns += ", group_summaries(*)"
     memberships = (
         db.table("group_members")
-        .select("group_id")
+        .select(f"net_balance, groups({columns})")
         .eq("user_id", str(user_id))
         .execute()
     )
 
-    if not memberships.data:
-        return []
-
-    group_ids = [m["group_id"] for m in memberships.data]
-
-    # Fetch the groups
-    result = (
-        db.table("groups")
-        .select("*")
-        .in_("id", group_ids)
-        .order("created_at", desc=True)
-        .execute()
-    )
+    groups = []
+    for m in memberships.data:
+        group = m["groups"]
+        group["summary"] = {
+            **(group.pop("group_summaries", None) or {}),
+            "my_balance": m["net_balance"],
+        }
+        groups.append(group)
 
-    return result.data
+    groups.sort(key=lambda g: g["created_at"], reverse=True)
+    return project(groups, fields)
 
 
 @router.get("/{group_id}", response_model=GroupDetail)
 async def get_group(
     group_id: UUID,
+    fields: Optional[list[str]] = Depends(field_selection(GroupDetail)),
     user_id: UUID = Depends(get_current_user_id),
 ):
-    """Get group details including members."""
+    """Get group details including members (skipped unless in ``fields``, if given)."""
     db = get_supabase_admin()
 
     # Verify user is a member
@@ -98,12 +146,19 @@ async def get_group(
 
     # Fetch group
     group_result = (
-        db.table("groups").select("*").eq("id", str(group_id)).execute()
+        db.table("groups")
+        .select(select_list(fields, GROUP_COLUMNS))
+        .eq("id", str(group_id))
+        .execute()
     )
 
     if not group_result.data:
         raise HTTPException(status_code=404, detail="Group not found")
 
+    group_data = group_result.data[0]
+    if not wants(fields, "members"):
+        return project(group_data, fields)
+
     # Fetch members with user info
     members_result = (
         db.table("group_members")
@@ -112,7 +167,6 @@ async def get_group(
         .execute()
     )
 
-    group_data = group_result.data[0]
     members = []
     for m in members_result.data:
         member = {**m}
@@ -120,7 +174,7 @@ async def get_group(
         members.append(member)
 
     group_data["members"] = members
-    return group_data
+    return project(group_data, fields)
 
 
 @router.post("/{group_id}/members", response_model=GroupMemberOut, status_code=201)
@@ -172,6 +226,7 @@ async def add_member(
     if not result.data:
         raise HTTPException(status_code=500, detail="Failed to add member")
 
+    get_event_hub().publish(group_id, "member.added", result.data[0])
     return result.data[0]
 
 
@@ -207,3 +262,204 @@ async def remove_member(
     db.table("group_members").delete().eq("group_id", str(group_id)).eq(
         "user_id", str(member_user_id)
     ).execute()
+
+    get_event_hub().publish(group_id, "member.removed", {"user_id": str(member_user_id)})
+
+
+async def _event_stream(subscription: Subscription, heartbeat: float):
+    """Format a subscription as server-sent events."""
+    hub = get_event_hub()
+    try:
+        # Tells the client it is connected and should refetch once to catch up
+        yield "retry: 3000\nevent: ready\ndata: {}\n\n"
+        while True:
+            event = await subscription.next_event(heartbeat)
+            if event is None:
+                yield ": ping\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+            if subscription.closed:
+                return
+            if event["type"] == "member.removed" and event["data"]["user_id"] == subscription.user_id:
+                return
+    finally:
+        hub.unsubscribe(subscription)
+
+
+@router.get("/{group_id}/events")
+async def group_events(
+    group_id: UUID,
+    user_id: UUID = Depends(get_current_user_id),
+):
+    """Stream the group's changes as server-sent events.
+
+    Emits ``expense.created``, ``expense.updated``, ``member.added``,
+    ``member.removed``, ``settlement.paid``, ``settlements.settled``,
+    ``import.progress`` and ``import.finished`` after the write commits, plus
+    a comment heartbeat while idle. Membership is checked once on connect; an
+    open stream costs no further database queries.
+    """
+    db = get_supabase_admin()
+
+    membership = (
+        db.table("group_members")
+        .select("id")
+        .eq("group_id", str(group_id))
+        .eq("user_id", str(user_id))
+        .execute()
+    )
+    if not membership.data:
+        raise HTTPException(status_code=403, detail="Not a member of this group")
+
+    # Subscribe before responding so nothing published in between is missed
+    subscription = get_event_hub().subscribe(str(group_id), str(user_id))
+    return StreamingResponse(
+        _event_stream(subscription, get_settings().events_heartbeat_s),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _export_records(db, group_id: UUID) -> Iterator[dict]:
+    """Yield the group's ledger as flat records, one page of expenses at a time.
+
+    Pages are keyset-paginated on (created_at, id), so each query is an index
+    range scan and nothing before the current page stays in memory.
+    """
+    after = None
+    while True:
+        query = (
+            db.table("expenses")
+            .select("*, receipt_items(*, item_assignments(user_id)), settlements(*)")
+            .eq("group_id", str(group_id))
+            .order("created_at")
+            .order("id")
+            .limit(EXPORT_PAGE_SIZE)
+        )
+        if after is not None:
+            created_at, expense_id = after
+            query = query.or_(
+                f'created_at.gt."{created_at}",'
+                f'and(created_at.eq."{created_at}",id.gt.{expense_id})'
+            )
+        page = query.execute().data
+
+        for expense in page:
+            items = expense.pop("receipt_items")
+            settlements = expense.pop("settlements")
+            yield {"record": "expense", **expense}
+            for item in items:
+                assignments = item.pop("item_assignments")
+                yield {"record": "item", **item}
+                for assignment in assignments:
+                    yield {
+                        "record": "assignment",
+                        "expense_id": expense["id"],
+                        "receipt_item_id": item["id"],
+                        "user_id": assignment["user_id"],
+                    }
+            for settlement in settlements:
+                yield {"record": "settlement", **settlement}
+
+        if len(page) < EXPORT_PAGE_SIZE:
+            return
+        after = (page[-1]["created_at"], page[-1]["id"])
+
+
+def _drain(buffer: io.StringIO) -> str:
+    chunk = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return chunk
+
+
+def _export_stream(db, group_id: UUID, fmt: str) -> Iterator[str]:
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.DictWriter(buffer, EXPORT_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        write = writer.writerow
+        # Send the header before the first query so the download starts at once
+        yield _drain(buffer)
+    else:
+        def write(record: dict) -> None:
+            buffer.write(json.dumps(record, default=str) + "\n")
+
+    for record in _export_records(db, group_id):
+        write(record)
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+@router.get("/{group_id}/export")
+async def export_group(
+    group_id: UUID,
+    fmt: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    user_id: UUID = Depends(get_current_user_id),
+):
+    """Stream the group's expenses, items, assignments and settlements.
+
+    ``format=csv`` (default) writes one table with a ``record`` column;
+    ``format=ndjson`` writes one JSON object per line. Memory use is bounded
+    by one page of expenses however large the group is.
+    """
+    db = get_supabase_admin()
+
+    membership = (
+        db.table("group_members")
+        .select("id")
+        .eq("group_id", str(group_id))
+        .eq("user_id", str(user_id))
+        .execute()
+    )
+    if not membership.data:
+        raise HTTPException(status_code=403, detail="Not a member of this group")
+
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    # A sync generator: Starlette iterates it in a worker thread, so the
+    # blocking page queries don't stall the event loop
+    return StreamingResponse(
+        _export_stream(db, group_id, fmt),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="group-{group_id}.{fmt}"'
+        },
+    )
+
+
+@router.post("/{group_id}/import", response_model=ImportResult)
+async def import_expenses(
+    group_id: UUID,
+    request: Request,
+    user_id: UUID = Depends(get_current_user_id),
+):
+    """Import historical expenses from an NDJSON body, one expense per line.
+
+    Each line is an expense as accepted by ``POST /api/expenses``, plus
+    optional ``paid_by``, ``created_at`` and ``settled``. Invalid lines are
+    skipped and reported; valid ones are written in transactional chunks.
+    Progress is published as ``import.progress`` on the group's event stream.
+    """
+    db = get_supabase_admin()
+
+    members = (
+        db.table("group_members")
+        .select("user_id")
+        .eq("group_id", str(group_id))
+        .execute()
+    )
+    member_ids = {m["user_id"] for m in members.data}
+    if str(user_id) not in member_ids:
+        raise HTTPException(status_code=403, detail="Not a member of this group")
+
+    settings = get_settings()
+    return await run_import(
+        db,
+        group_id,
+        user_id,
+        member_ids,
+        request.stream(),
+        chunk_size=settings.import_chunk_size,
+        max_line_bytes=settings.import_max_line_bytes,
+    )
@@ -1,31 +1,216 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+import asyncio
+import math
+import mimetypes
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from uuid import UUID
 
-from app.models.receipt import ReceiptScanResponse
+from fastapi import APIRouter, Depends, Form, Request, Response, UploadFile, File, HTTPException
+
+from app.config import get_settings
+from app.middleware.auth import get_current_user_id
+from app.middleware.rate_limit import check_scan_rate, rate_limit_scans
+from app.models.receipt import (
+    BatchScanResponse,
+    BatchScanResult,
+    ParsedReceiptItem,
+    ReceiptScanResponse,
+    UploadRequest,
+    UploadTicket,
+)
+from app.services.admission import QueueFullError
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.metrics import ADMISSION_REJECTIONS
+from app.services.receipt_backends import check_available
 from app.services.receipt_parser import parse_receipt_image
+from app.services.storage import (
+    IMAGE_EXTENSIONS,
+    LocalStorage,
+    StorageError,
+    get_receipt_storage,
+    get_storage,
+    is_upload_key,
+)
 
 router = APIRouter()
 
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+
+async def _scan(image_bytes: bytes) -> list[ParsedReceiptItem]:
+    """Parse one image; each model call it makes takes a concurrency slot."""
+    # Don't queue for a slot when the upstream is known to be down
+    check_available()
+    return await parse_receipt_image(image_bytes)
+
+
+async def _read_upload(key: str) -> bytes:
+    if not is_upload_key(key):
+        raise HTTPException(status_code=400, detail="Invalid storage_key")
+    try:
+        return await asyncio.to_thread(get_receipt_storage().download, key)
+    except StorageError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+
+@router.post("/uploads", response_model=UploadTicket, status_code=201)
+async def create_upload(
+    request: UploadRequest,
+    user_id: UUID = Depends(get_current_user_id),
+):
+    """Get a signed URL to upload one receipt image straight to storage.
+
+    ``PUT`` the image to ``url`` with ``headers``, then pass ``key`` as
+    ``storage_key`` to ``/scan`` or as ``receipt_image_key`` when creating
+    the expense.
+    """
+    settings = get_settings()
+    key = f"uploads/{user_id}/{uuid.uuid4().hex}.{IMAGE_EXTENSIONS[request.content_type]}"
+    ttl = settings.storage_upload_url_ttl_s
+    ticket = await asyncio.to_thread(
+        get_receipt_storage().create_upload_url, key, request.content_type, ttl
+    )
+    return UploadTicket(
+        key=key,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=ttl),
+        **ticket,
+    )
+
+
+def _local_storage(
+    bucket: str, method: str, key: str, expires: int, signature: str
+) -> LocalStorage:
+    settings = get_settings()
+    if settings.storage_backend != "local" or bucket not in (
+        settings.storage_receipt_bucket,
+        settings.storage_thumbnail_bucket,
+    ):
+        raise HTTPException(status_code=404, detail="Not found")
+    storage = get_storage(bucket)
+    if not storage.verify(method, key, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+    return storage
+
+
+@router.put("/storage/{bucket}/{key:path}", status_code=204, include_in_schema=False)
+async def local_storage_put(
+    bucket: str, key: str, request: Request, expires: int, signature: str
+):
+    """Signed upload target for the local storage stand-in."""
+    storage = _local_storage(bucket, "PUT", key, expires, signature)
+    data = await request.body()
+    if len(data) > MAX_IMAGE_BYTES:
+        raise HTTPException(status_code=413, detail="Image too large (max 10MB)")
+    await asyncio.to_thread(storage.upload, key, data, request.headers.get("content-type", ""))
+
+
+@router.get("/storage/{bucket}/{key:path}", include_in_schema=False)
+async def local_storage_get(bucket: str, key: str, expires: int, signature: str):
+    """Signed downloads for the local storage stand-in."""
+    storage = _local_storage(bucket, "GET", key, expires, signature)
+    try:
+        data = await asyncio.to_thread(storage.download, key)
+    except StorageError:
+        raise HTTPException(status_code=404, detail="Not found")
+    return Response(data, media_type=mimetypes.guess_type(key)[0])
 
-@router.post("/scan", response_model=ReceiptScanResponse)
+
+@router.post(
+    "/scan",
+    response_model=ReceiptScanResponse,
+    dependencies=[Depends(rate_limit_scans)],
+)
 async def scan_receipt(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    storage_key: Optional[str] = Form(None),
 ):
     # TODO: Re-enable auth once login flow is built
     # user_id: UUID = Depends(get_current_user_id)
-    """Upload a receipt image and get parsed line items."""
-    if not file.content_type or not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
+    """Parse a receipt image into line items.
+
+    Send the image as ``file``, or upload it first (``POST /uploads``) and
+    send its ``storage_key``; the image is then read from storage.
+    """
+    if (file is None) == (storage_key is None):
+        raise HTTPException(status_code=400, detail="Send either file or storage_key")
 
-    # Read image bytes (limit to 10MB)
-    image_bytes = await file.read()
-    if len(image_bytes) > 10 * 1024 * 1024:
+    if storage_key is not None:
+        image_bytes = await _read_upload(storage_key)
+    else:
+        if not file.content_type or not file.content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail="File must be an image")
+        # Read image bytes (limit to 10MB)
+        image_bytes = await file.read()
+    if len(image_bytes) > MAX_IMAGE_BYTES:
         raise HTTPException(status_code=400, detail="Image too large (max 10MB)")
 
     try:
-        items = await parse_receipt_image(image_bytes)
+        items = await _scan(image_bytes)
+    except QueueFullError as e:
+        ADMISSION_REJECTIONS.inc(reason="queue_full")
+        raise HTTPException(
+            status_code=429,
+            detail="Receipt scanner is busy, try again shortly",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Receipt scanner is temporarily unavailable",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to parse receipt: {str(e)}"
         )
 
     return ReceiptScanResponse(items=items)
+
+
+@router.post("/scan/batch", response_model=BatchScanResponse)
+async def scan_receipts_batch(
+    request: Request,
+    files: list[UploadFile] = File(...),
+):
+    """Upload several receipt images and parse them concurrently.
+
+    Each image gets its own result; a failure on one image does not fail the batch.
+    """
+    settings = get_settings()
+    # Settings keep this at or below the burst, so a full batch can be charged
+    if len(files) > settings.scan_batch_max_files:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many images (max {settings.scan_batch_max_files})",
+        )
+    check_scan_rate(request, cost=len(files))
+
+    # Bound this batch's fan-out so it can't flood the global scan queue
+    batch_limit = asyncio.Semaphore(settings.scan_batch_concurrency)
+
+    async def scan_one(index: int, file: UploadFile) -> BatchScanResult:
+        result = BatchScanResult(index=index, filename=file.filename)
+        if not file.content_type or not file.content_type.startswith("image/"):
+            result.error = "File must be an image"
+            return result
+
+        image_bytes = await file.read()
+        if len(image_bytes) > MAX_IMAGE_BYTES:
+            result.error = "Image too large (max 10MB)"
+            return result
+
+        try:
+            async with batch_limit:
+                result.items = await _scan(image_bytes)
+        except QueueFullError:
+            ADMISSION_REJECTIONS.inc(reason="queue_full")
+            result.error = "Receipt scanner is busy, try again shortly"
+        except CircuitOpenError:
+            result.error = "Receipt scanner is temporarily unavailable"
+        except Exception as e:
+            result.error = f"Failed to parse receipt: {str(e)}"
+        return result
+
+    results = await asyncio.gather(*(scan_one(i, f) for i, f in enumerate(files)))
+    return BatchScanResponse(results=results)
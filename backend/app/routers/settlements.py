@@ -1,108 +1,228 @@
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException
 from uuid import UUID
 
 from app.middleware.auth import get_current_user_id
+from app.middleware.fields import field_selection, project, select_list
 from app.db.client import get_supabase_admin
-from app.models.expense import SettlementOut
-from app.services.splitter import calculate_shares
-from app.services.debt_simplifier import simplify_debts, calculate_balances
+from app.models.expense import (
+    PlannedTransfer,
+    SettlementOut,
+    SettlementPlan,
+    SettlementPlanRequest,
+    SettleUpRequest,
+)
+from app.services.events import get_event_hub
+from app.services.debt_optimizer import InfeasibleSettlement, optimize_debts
+from app.services.debt_simplifier import Debt, simplify_debts
 
 router = APIRouter()
 
+SETTLEMENT_COLUMNS = set(SettlementOut.model_fields)
+
+
+def _fetch_settlements(db, expense_id: UUID, columns: str = "*") -> Optional[dict]:
+    """An expense's versions and its settlements, in one select; None if missing."""
+    result = (
+        db.table("expenses")
+        .select(f"version, settlements_version, settlements({columns})")
+        .eq("id", str(expense_id))
+        .execute()
+    )
+    return result.data[0] if result.data else None
+
+
+def _is_current(expense: Optional[dict]) -> bool:
+    """Settlements were generated for this version, even if none were needed."""
+    return expense is not None and expense["settlements_version"] == expense["version"]
+
 
 @router.get(
     "/expense/{expense_id}", response_model=list[SettlementOut]
 )
 async def get_settlements(
     expense_id: UUID,
+    fields: Optional[list[str]] = Depends(field_selection(SettlementOut)),
     user_id: UUID = Depends(get_current_user_id),
 ):
-    """Get or calculate settlements for an expense."""
+    """Get or calculate settlements for an expense.
+
+    Settlements are stamped with the expense version they were derived from
+    and are returned as they are while it still matches. Once the expense
+    has been edited they are regenerated on the next read: unpaid ones are
+    replaced, and amounts already paid are kept and netted out of the new
+    debts (an overpayment becomes a refund). ``fields`` limits the columns
+    read and returned.
+    """
     db = get_supabase_admin()
 
-    # Check for existing settlements
-    existing = (
-        db.table("settlements")
-        .select("*")
-        .eq("expense_id", str(expense_id))
-        .execute()
-    )
+    columns = select_list(fields, SETTLEMENT_COLUMNS)
+    expense = _fetch_settlements(db, expense_id, columns)
+    if _is_current(expense):
+        return project(expense["settlements"], fields)
 
-    if existing.data:
-        return existing.data
+    settlements = _generate_settlements(db, expense_id, user_id)
+    return project(settlements, fields)
 
-    # Calculate settlements from scratch
-    expense_result = (
-        db.table("expenses").select("*").eq("id", str(expense_id)).execute()
-    )
-    if not expense_result.data:
-        raise HTTPException(status_code=404, detail="Expense not found")
 
-    expense_data = expense_result.data[0]
+def _generate_settlements(db, expense_id: UUID, user_id: UUID) -> list[dict]:
+    """Derive settlements for the expense's current version and store them.
+
+    One ``generate_settlements`` call does the whole job under a per-expense
+    advisory lock, so concurrent readers get the same rows back.
+    """
+    from postgrest.exceptions import APIError
+
+    try:
+        result = db.rpc(
+            "generate_settlements",
+            {"p_expense_id": str(expense_id), "p_user_id": str(user_id)},
+        ).execute()
+    except APIError as e:
+        if e.code == "P0002":
+            raise HTTPException(status_code=404, detail="Expense not found")
+        if e.code == "42501":
+            raise HTTPException(status_code=403, detail="Not a member of this group")
+        raise
+    return result.data
+
+
+@router.post("/group/{group_id}/plan", response_model=SettlementPlan)
+async def plan_group_settlements(
+    group_id: UUID,
+    request: SettlementPlanRequest,
+    user_id: UUID = Depends(get_current_user_id),
+):
+    """Suggest transfers that settle every unpaid debt in a group at once.
+
+    Works from the group's current unpaid settlements and changes nothing.
+    ``greedy`` nets everyone's balance and pays the largest debtor to the
+    largest creditor, whoever they are. ``min_cost_flow`` only has people pay
+    someone they already owe or are owed by, cheapest route first by
+    ``costs``, and honours ``allowed_payers``; 422 if those make it
+    impossible.
+    """
+    db = get_supabase_admin()
 
-    # Verify membership
     membership = (
         db.table("group_members")
         .select("id")
-        .eq("group_id", expense_data["group_id"])
+        .eq("group_id", str(group_id))
         .eq("user_id", str(user_id))
         .execute()
     )
     if not membership.data:
         raise HTTPException(status_code=403, detail="Not a member of this group")
 
-    # Fetch items with assignments
-    items_result = (
-        db.table("receipt_items")
-        .select("*, item_assignments(user_id)")
-        .eq("expense_id", str(expense_id))
-        .execute()
+    expenses = (
+        db.table("expenses").select("id, version").eq("group_id", str(group_id)).execute()
     )
-
-    items_for_calc = []
-    for item in items_result.data:
-        assignments = item.get("item_assignments", [])
-        items_for_calc.append(
-            {
-                "total_price": item["total_price"],
-                "assigned_user_ids": [a["user_id"] for a in assignments],
-            }
+    versions = {e["id"]: e["version"] for e in expenses.data}
+    debts = []
+    if versions:
+        unpaid = (
+            db.table("settlements")
+            .select("expense_id, from_user_id, to_user_id, amount, expense_version")
+            .in_("expense_id", list(versions))
+            .eq("is_paid", False)
+            .execute()
         )
+        debts = [
+            Debt(from_user=row["from_user_id"], to_user=row["to_user_id"], amount=row["amount"])
+            for row in unpaid.data
+            if row["expense_version"] == versions[row["expense_id"]]
+        ]
 
-    # Calculate shares
-    shares = calculate_shares(
-        items=items_for_calc,
-        tax_amount=expense_data["tax_amount"],
-        tip_amount=expense_data["tip_amount"],
-    )
+    if request.mode == "greedy":
+        balances: dict[str, float] = {}
+        for d in debts:
+            balances[d.from_user] = balances.get(d.from_user, 0) - d.amount
+            balances[d.to_user] = balances.get(d.to_user, 0) + d.amount
+        transfers = simplify_debts(balances)
+    else:
+        costs = {
+            (str(c.from_user_id), str(c.to_user_id)): c.cost for c in request.costs
+        }
+        allowed = {
+            str(payee): {str(p) for p in payers}
+            for payee, payers in request.allowed_payers.items()
+        }
+        try:
+            transfers = optimize_debts(
+                debts,
+                cost=lambda payer, payee: costs.get((payer, payee), 1.0),
+                allowed_payers=allowed,
+            )
+        except InfeasibleSettlement as e:
+            raise HTTPException(status_code=422, detail=str(e))
 
-    # Calculate balances and simplify debts
-    share_dicts = [{"user_id": str(s.user_id), "total": s.total} for s in shares]
-    balances = calculate_balances(
-        user_shares=share_dicts,
-        payer_id=expense_data["created_by"],
-        total_amount=expense_data["total_amount"],
+    return SettlementPlan(
+        mode=request.mode,
+        transfers=[
+            PlannedTransfer(from_user_id=d.from_user, to_user_id=d.to_user, amount=d.amount)
+            for d in transfers
+        ],
     )
 
-    debts = simplify_debts(balances)
 
-    # Save settlements to DB
-    settlement_rows = [
+@router.post("/settle-up", response_model=list[SettlementOut])
+async def settle_up(
+    request: SettleUpRequest,
+    user_id: UUID = Depends(get_current_user_id),
+):
+    """Mark every unpaid settlement between the caller and another user as paid.
+
+    Runs as one ``settle_up`` database call, which also marks expenses whose
+    settlements are now all paid as ``settled``. Returns the settlements
+    that were paid.
+    """
+    db = get_supabase_admin()
+
+    if request.user_id == user_id:
+        raise HTTPException(status_code=422, detail="Cannot settle up with yourself")
+
+    if request.group_id is not None:
+        membership = (
+            db.table("group_members")
+            .select("id")
+            .eq("group_id", str(request.group_id))
+            .eq("user_id", str(user_id))
+            .execute()
+        )
+        if not membership.data:
+            raise HTTPException(status_code=403, detail="Not a member of this group")
+
+    result = db.rpc(
+        "settle_up",
         {
-            "expense_id": str(expense_id),
-            "from_user_id": str(d.from_user),
-            "to_user_id": str(d.to_user),
-            "amount": d.amount,
-            "is_paid": False,
-        }
-        for d in debts
-    ]
+            "p_user_a": str(user_id),
+            "p_user_b": str(request.user_id),
+            "p_group_id": str(request.group_id) if request.group_id else None,
+        },
+    ).execute()
+    paid = result.data
+    if not paid:
+        return []
 
-    if settlement_rows:
-        result = db.table("settlements").insert(settlement_rows).execute()
-        return result.data
+    if request.group_id is not None:
+        group_ids = {str(request.group_id)}
+    else:
+        expenses = (
+            db.table("expenses")
+            .select("group_id")
+            .in_("id", list({s["expense_id"] for s in paid}))
+            .execute()
+        )
+        group_ids = {e["group_id"] for e in expenses.data}
+    for group_id in group_ids:
+        get_event_hub().publish(
+            group_id,
+            "settlements.settled",
+            {"user_ids": [str(user_id), str(request.user_id)]},
+        )
 
-    return []
+    return paid
 
 
 @router.post("/{settlement_id}/mark-paid", response_model=SettlementOut)
@@ -116,7 +236,7 @@ async def mark_paid(
     # Fetch settlement
     settlement = (
         db.table("settlements")
-        .select("*")
+        .select("*, expenses(group_id)")
         .eq("id", str(settlement_id))
         .execute()
     )
@@ -137,4 +257,5 @@ async def mark_paid(
         .execute()
     )
 
+    get_event_hub().publish(s["expenses"]["group_id"], "settlement.paid", result.data[0])
     return result.data[0]
@@ -0,0 +1,79 @@
+import base64
+import json
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from uuid import UUID
+
+from app.config import get_settings
+from app.middleware.auth import get_current_user_id
+from app.db.client import get_supabase_admin
+from app.models.user import UserSearchResult
+from app.services.cache import TTLCache
+
+router = APIRouter()
+
+
+@lru_cache
+def get_search_cache() -> TTLCache:
+    settings = get_settings()
+    return TTLCache(
+        "user_search",
+        settings.user_search_cache_ttl_s,
+        settings.user_search_cache_size,
+    )
+
+
+def _encode_cursor(row: dict) -> str:
+    key = [row["rank"], row["display_name"].lower(), row["id"]]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[float, str, str]:
+    try:
+        rank, name, user_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return float(rank), str(name), str(UUID(user_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/search", response_model=UserSearchResult)
+async def search_users(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=50),
+    cursor: Optional[str] = None,
+    user_id: UUID = Depends(get_current_user_id),
+):
+    """Find users by display name or email prefix, or a fuzzy name match.
+
+    Prefix matches rank first, then names by trigram similarity (queries of
+    three or more characters). Pages are keyset-paginated with ``cursor``.
+    First pages are cached briefly since autocomplete repeats the same
+    prefixes.
+    """
+    query = " ".join(q.lower().split())
+    if not query:
+        raise HTTPException(status_code=422, detail="Query must not be blank")
+
+    cache = get_search_cache()
+    cache_key = (query, limit)
+    if cursor is None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    params = {"p_query": query, "p_limit": limit + 1}
+    if cursor is not None:
+        rank, name, after_id = _decode_cursor(cursor)
+        params.update(p_after_rank=rank, p_after_name=name, p_after_id=after_id)
+
+    rows = get_supabase_admin().rpc("search_users", params).execute().data
+
+    result = {
+        "results": rows[:limit],
+        "next_cursor": _encode_cursor(rows[limit - 1]) if len(rows) > limit else None,
+    }
+    if cursor is None:
+        cache.set(cache_key, result)
+    return result
@@ -0,0 +1,122 @@
+"""Admission control primitives: per-client token buckets and a bounded
+concurrency limiter with a fixed-depth wait queue."""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable
+
+
+class QueueFullError(Exception):
+    """Raised when every slot is busy and the wait queue is at capacity."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Too many concurrent requests")
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    """Token bucket per key: ``burst`` tokens, refilled at ``rate`` per second."""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        max_keys: int = 10_000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._clock = clock
+        # key -> (tokens, last refill time)
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def acquire(self, key: str, cost: float = 1) -> float:
+        """Take ``cost`` tokens for ``key``. Returns 0 on success, else seconds until they are available.
+
+        A bucket never holds more than ``burst`` tokens, so a larger ``cost``
+        raises ValueError; callers must reject such requests up front.
+        """
+        if cost > self.burst:
+            raise ValueError(f"cost {cost} exceeds the bucket size {self.burst}")
+        now = self._clock()
+        tokens, last = self._buckets.get(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+
+        if tokens >= cost:
+            self._buckets[key] = (tokens - cost, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return 0.0
+
+        self._buckets[key] = (tokens, now)
+        return (cost - tokens) / self.rate if self.rate > 0 else math.inf
+
+    def _prune(self, now: float) -> None:
+        # A bucket that has refilled completely holds no state worth keeping
+        full_after = self.burst / self.rate if self.rate > 0 else math.inf
+        self._buckets = {
+            k: v for k, v in self._buckets.items() if now - v[1] < full_after
+        }
+
+
+class ConcurrencyLimiter:
+    """Allow ``limit`` concurrent holders and queue at most ``max_queue`` more.
+
+    Waiters are plain futures on the running loop, so the limiter is not tied
+    to a single event loop. Slots are handed directly to the next waiter on
+    release, which keeps admission FIFO.
+    """
+
+    def __init__(self, limit: int, max_queue: int, expected_seconds: float = 5.0):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        # Moving average of slot hold time, used to suggest Retry-After
+        self._avg_seconds = expected_seconds
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        backlog = (self.active + self.queued) / max(self.limit, 1)
+        return max(1, math.ceil(self._avg_seconds * backlog))
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+        else:
+            if len(self._waiters) >= self.max_queue:
+                raise QueueFullError(self.retry_after())
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was handed over just as we were cancelled
+                    self._release()
+                else:
+                    self._waiters.remove(waiter)
+                raise
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+            self._release()
+
+    def _release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
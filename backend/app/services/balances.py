@@ -0,0 +1,113 @@
+"""A user's balances across all their groups, cached per user.
+
+The ``user_balances`` SQL function does the aggregation in one query. Its
+result is cached per user and indexed by the groups it covers. Every group
+event (a new or edited expense, a payment, a settle-up, an import) drops the
+cached summaries of that group's members. Bridged events from other workers
+count too, so with ``EVENTS_REDIS_URL`` set, no worker serves a summary
+staler than the write. Without it, the TTL bounds what other workers see.
+"""
+from functools import lru_cache
+from typing import Optional
+
+from app.config import get_settings
+from app.services.cache import TTLCache
+from app.services.events import get_event_hub
+
+
+def _by_size(entry: dict) -> tuple:
+    return -abs(entry["amount"]), str(entry.get("name") or entry.get("display_name"))
+
+
+def summarize(rows: list[dict]) -> dict:
+    """Shape ``user_balances`` rows into a ``BalanceSummary``."""
+    groups: dict[str, dict] = {}
+    people: dict[str, dict] = {}
+    you_owe = you_are_owed = 0.0
+    for row in rows:
+        group = groups.setdefault(
+            row["group_id"],
+            {
+                "group_id": row["group_id"],
+                "name": row["group_name"],
+                "amount": 0.0,
+                "counterparties": [],
+            },
+        )
+        if row["counterparty_id"] is None:
+            continue
+        amount = float(row["amount"])
+        counterparty = {
+            "user_id": row["counterparty_id"],
+            "display_name": row["counterparty_name"],
+            "amount": amount,
+        }
+        group["counterparties"].append(counterparty)
+        group["amount"] += amount
+        person = people.setdefault(row["counterparty_id"], {**counterparty, "amount": 0.0})
+        person["amount"] += amount
+        if amount > 0:
+            you_are_owed += amount
+        else:
+            you_owe -= amount
+
+    for entry in [*groups.values(), *people.values()]:
+        entry["amount"] = round(entry["amount"], 2)
+    for group in groups.values():
+        group["counterparties"].sort(key=_by_size)
+    return {
+        "you_owe": round(you_owe, 2),
+        "you_are_owed": round(you_are_owed, 2),
+        "people": sorted((p for p in people.values() if abs(p["amount"]) >= 0.01), key=_by_size),
+        "groups": sorted(groups.values(), key=_by_size),
+    }
+
+
+class BalanceCache:
+    """Per-user summaries, dropped when any of the user's groups changes."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self._cache = TTLCache("balances", ttl, max_entries, on_evict=self._unindex)
+        # group id -> users whose cached summary covers it, kept in step with
+        # the cache so evicted and expired summaries don't linger here
+        self._users_by_group: dict[str, set[str]] = {}
+
+    def get(self, user_id: str) -> Optional[dict]:
+        return self._cache.get(user_id)
+
+    def set(self, user_id: str, summary: dict) -> None:
+        self._cache.set(user_id, summary)
+        for group in summary["groups"]:
+            self._users_by_group.setdefault(str(group["group_id"]), set()).add(user_id)
+
+    def invalidate_group(self, group_id: str) -> None:
+        for user_id in self._users_by_group.pop(group_id, ()):
+            self._cache.invalidate(user_id)
+
+    def on_event(self, event: dict) -> None:
+        self.invalidate_group(event["group_id"])
+        if event["type"] == "member.added":
+            # Their cached summary doesn't cover this group yet
+            self._cache.invalidate(str(event["data"]["user_id"]))
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self._users_by_group.clear()
+
+    def _unindex(self, user_id: str, summary: dict) -> None:
+        for group in summary["groups"]:
+            group_id = str(group["group_id"])
+            users = self._users_by_group.get(group_id)
+            if users is None:
+                continue
+            users.discard(user_id)
+            if not users:
+                del self._users_by_group[group_id]
+
+
+@lru_cache
+def get_balance_cache() -> BalanceCache:
+    settings = get_settings()
+    cache = BalanceCache(settings.balances_cache_ttl_s, settings.balances_cache_size)
+    get_event_hub().add_listener(cache.on_event)
+    return cache
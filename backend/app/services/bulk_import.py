@@ -0,0 +1,244 @@
+"""Bulk import of historical expenses from an NDJSON upload.
+
+The upload is read as a stream, one expense per line, and validated with
+the same models as ``create_expense``. Valid expenses are collected into
+chunks. Each chunk is written by the ``import_expenses`` SQL function,
+which is one round trip and one transaction per chunk. Ids are assigned
+here, so items and assignments can reference their parents in the same
+call. Invalid lines are skipped and reported with their line numbers.
+
+Settlements are derived in memory from each expense's items. The per-row
+group summary triggers are off during the chunk writes, and
+``refresh_group_summary`` recomputes the group's totals and balances once
+at the end.
+"""
+import json
+import uuid
+from typing import AsyncIterator, Optional
+from uuid import UUID
+
+from pydantic import ValidationError
+
+from app.models.expense import ExpenseImport
+from app.services.debt_simplifier import calculate_balances, simplify_debts
+from app.services.events import get_event_hub
+from app.services.splitter import calculate_shares
+from app.services.storage import is_upload_key
+from app.services.thumbnails import get_thumbnail_worker
+
+# Report at most this many line errors; the count covers the rest
+MAX_REPORTED_ERRORS = 100
+
+
+class LineTooLongError(Exception):
+    pass
+
+
+async def iter_lines(
+    chunks: AsyncIterator[bytes], max_line_bytes: int
+) -> AsyncIterator[tuple[int, bytes]]:
+    """Split a byte stream into numbered, non-blank lines without buffering it all."""
+    pending = b""
+    number = 0
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            number += 1
+            if line.strip():
+                yield number, line
+        if len(pending) > max_line_bytes:
+            raise LineTooLongError(f"Line {number + 1} is longer than {max_line_bytes} bytes")
+    if pending.strip():
+        yield number + 1, pending
+
+
+def _error_message(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        first = error.errors()[0]
+        location = ".".join(str(part) for part in first["loc"])
+        return f"{location}: {first['msg']}" if location else first["msg"]
+    return str(error)
+
+
+def build_rows(expense: ExpenseImport, payer_id: str) -> dict[str, list[dict]]:
+    """Rows for one imported expense, keyed by the ``import_expenses`` parameter."""
+    expense_id = str(uuid.uuid4())
+    row = {
+        "id": expense_id,
+        "group_id": str(expense.group_id),
+        "created_by": payer_id,
+        "description": expense.description,
+        "total_amount": expense.total_amount,
+        "tax_amount": expense.tax_amount,
+        "tip_amount": expense.tip_amount,
+        "receipt_image_url": expense.receipt_image_url,
+        "receipt_image_key": expense.receipt_image_key,
+        "status": "settled" if expense.settled else "pending",
+        "settlements_version": 1,  # Generated below, with the expense
+    }
+    if expense.created_at is not None:
+        row["created_at"] = expense.created_at.isoformat()
+
+    items, assignments, items_for_calc = [], [], []
+    for item in expense.items:
+        item_id = str(uuid.uuid4())
+        user_ids = list(dict.fromkeys(str(u) for u in item.assigned_user_ids))
+        items.append(
+            {
+                "id": item_id,
+                "expense_id": expense_id,
+                "item_name": item.item_name,
+                "quantity": item.quantity,
+                "unit_price": item.unit_price,
+                "total_price": item.total_price,
+            }
+        )
+        assignments += [{"receipt_item_id": item_id, "user_id": u} for u in user_ids]
+        items_for_calc.append({"total_price": item.total_price, "assigned_user_ids": user_ids})
+
+    shares = calculate_shares(
+        items=items_for_calc,
+        tax_amount=expense.tax_amount,
+        tip_amount=expense.tip_amount,
+    )
+    balances = calculate_balances(
+        user_shares=[{"user_id": str(s.user_id), "total": s.total} for s in shares],
+        payer_id=payer_id,
+        total_amount=expense.total_amount,
+    )
+    settlements = [
+        {
+            "expense_id": expense_id,
+            "from_user_id": str(d.from_user),
+            "to_user_id": str(d.to_user),
+            "amount": d.amount,
+            "is_paid": expense.settled,
+        }
+        for d in simplify_debts(balances)
+    ]
+    return {
+        "p_expenses": [row],
+        "p_items": items,
+        "p_assignments": assignments,
+        "p_settlements": settlements,
+    }
+
+
+class ImportJob:
+    """Validates lines into chunks and writes each chunk in one call."""
+
+    def __init__(self, db, group_id: UUID, user_id: UUID, member_ids: set[str], chunk_size: int):
+        self.db = db
+        self.group_id = group_id
+        self.user_id = str(user_id)
+        self.member_ids = member_ids
+        self.chunk_size = chunk_size
+        self.imported = 0
+        self.failed = 0
+        self.errors: list[dict] = []
+        self._chunk: dict[str, list[dict]] = self._empty_chunk()
+        self._chunk_expenses = 0
+        self.chunk_start: Optional[int] = None
+
+    @staticmethod
+    def _empty_chunk() -> dict[str, list[dict]]:
+        return {"p_expenses": [], "p_items": [], "p_assignments": [], "p_settlements": []}
+
+    def _fail(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def _parse(self, raw: bytes) -> ExpenseImport:
+        data = json.loads(raw)
+        if not isinstance(data, dict):
+            raise ValueError("Each line must be a JSON object")
+        data.setdefault("group_id", str(self.group_id))
+        expense = ExpenseImport.model_validate(data)
+        if expense.group_id != self.group_id:
+            raise ValueError("group_id does not match the import's group")
+        if expense.receipt_image_key and not is_upload_key(expense.receipt_image_key, self.user_id):
+            raise ValueError("Unknown receipt_image_key")
+
+        users = {str(u) for item in expense.items for u in item.assigned_user_ids}
+        if expense.paid_by is not None:
+            users.add(str(expense.paid_by))
+        outsiders = users - self.member_ids
+        if outsiders:
+            raise ValueError(f"Not group members: {', '.join(sorted(outsiders))}")
+        return expense
+
+    def add(self, line: int, raw: bytes) -> None:
+        try:
+            expense = self._parse(raw)
+        except (ValueError, ValidationError) as e:
+            self._fail(line, _error_message(e))
+            return
+
+        payer = str(expense.paid_by) if expense.paid_by else self.user_id
+        if self.chunk_start is None:
+            self.chunk_start = line
+        for key, rows in build_rows(expense, payer).items():
+            self._chunk[key] += rows
+        self._chunk_expenses += 1
+        if self._chunk_expenses >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._chunk_expenses:
+            return
+        self.db.rpc("import_expenses", self._chunk).execute()
+        for row in self._chunk["p_expenses"]:
+            if row["receipt_image_key"]:
+                get_thumbnail_worker().submit(row["id"], row["receipt_image_key"])
+        self.imported += self._chunk_expenses
+        self._chunk = self._empty_chunk()
+        self._chunk_expenses = 0
+        self.chunk_start = None
+        get_event_hub().publish(
+            self.group_id,
+            "import.progress",
+            {"imported": self.imported, "failed": self.failed},
+        )
+
+    def result(self, error: Optional[str] = None) -> dict:
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "aborted": error,
+        }
+
+
+async def run_import(
+    db,
+    group_id: UUID,
+    user_id: UUID,
+    member_ids: set[str],
+    chunks: AsyncIterator[bytes],
+    chunk_size: int,
+    max_line_bytes: int,
+) -> dict:
+    """Import every valid line of an NDJSON stream into ``group_id``.
+
+    Chunks written before a failure stay; the result says where it stopped.
+    """
+    from postgrest.exceptions import APIError
+
+    job = ImportJob(db, group_id, user_id, member_ids, chunk_size)
+    error = None
+    try:
+        try:
+            async for number, raw in iter_lines(chunks, max_line_bytes):
+                job.add(number, raw)
+        except LineTooLongError as e:
+            error = str(e)
+        job.flush()
+    except APIError as e:
+        error = f"Chunk starting at line {job.chunk_start} was rolled back: {e.message}"
+    finally:
+        if job.imported:
+            db.rpc("refresh_group_summary", {"p_group_id": str(group_id)}).execute()
+            get_event_hub().publish(group_id, "import.finished", {"imported": job.imported})
+    return job.result(error)
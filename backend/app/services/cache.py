@@ -0,0 +1,73 @@
+"""Small in-process caches for hot reads.
+
+Each worker keeps its own copy, so entries are short-lived: a write on one
+worker only invalidates that worker's cache, and the TTL bounds how stale
+the others can be.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from app.services.metrics import CACHE_LOOKUPS
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU cache of at most ``max_entries`` whose entries expire after ``ttl`` seconds."""
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        max_entries: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        # Called with (key, value) whenever an entry leaves the cache other
+        # than through clear(): expiry, LRU overflow, invalidation or overwrite
+        self._on_evict = on_evict
+        # key -> (expires at, value), least recently used first
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key, _MISSING)
+        if entry is not _MISSING and entry[0] > self._clock():
+            self._entries.move_to_end(key)
+            CACHE_LOOKUPS.inc(cache=self.name, result="hit")
+            return entry[1]
+        if entry is not _MISSING:
+            del self._entries[key]
+            self._evicted(key, entry[1])
+        CACHE_LOOKUPS.inc(cache=self.name, result="miss")
+        return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.ttl <= 0:
+            return
+        previous = self._entries.pop(key, _MISSING)
+        if previous is not _MISSING:
+            self._evicted(key, previous[1])
+        self._entries[key] = (self._clock() + self.ttl, value)
+        while len(self._entries) > self.max_entries:
+            evicted_key, (_, evicted) = self._entries.popitem(last=False)
+            self._evicted(evicted_key, evicted)
+
+    def invalidate(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, _MISSING)
+        if entry is not _MISSING:
+            self._evicted(key, entry[1])
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evicted(self, key: Hashable, value: Any) -> None:
+        if self._on_evict is not None:
+            self._on_evict(key, value)
@@ -0,0 +1,112 @@
+"""Circuit breaker for calls to a flaky upstream.
+
+Closed: calls go through, and each outcome is kept in a rolling window.
+Once the window has ``min_calls`` outcomes and at least ``failure_rate`` of
+them failed or took longer than ``slow_call_s``, the breaker opens.
+
+Open: calls fail at once with ``CircuitOpenError`` for ``open_s`` seconds,
+so requests don't tie up workers waiting on a timeout that is coming anyway.
+
+Half-open: after that, one probe call is let through. If it succeeds the
+breaker closes with a fresh window, and if not it opens again.
+"""
+import logging
+import time
+from collections import deque
+from typing import Callable
+
+from app.services.metrics import CIRCUIT_REJECTIONS, CIRCUIT_STATE, CIRCUIT_TRANSITIONS
+
+logger = logging.getLogger("uvicorn.error")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# Exported as the state gauge's value
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        slow_call_s: float = 20.0,
+        open_s: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_s = slow_call_s
+        self.open_s = open_s
+        self._clock = clock
+        self._outcomes: deque[bool] = deque(maxlen=window)  # True = failed
+        self._opened_at = 0.0
+        self._probing = False
+        self.state = CLOSED
+        CIRCUIT_STATE.set(STATE_VALUES[CLOSED], upstream=name)
+
+    def _transition(self, state: str) -> None:
+        previous, self.state = self.state, state
+        self._outcomes.clear()
+        self._probing = False
+        if state == OPEN:
+            self._opened_at = self._clock()
+        CIRCUIT_STATE.set(STATE_VALUES[state], upstream=self.name)
+        CIRCUIT_TRANSITIONS.inc(upstream=self.name, to=state)
+        log = logger.warning if state == OPEN else logger.info
+        log("circuit %s: %s -> %s", self.name, previous, state)
+
+    def retry_after(self) -> float:
+        """Seconds until a call may be let through; 0 if one may now."""
+        if self.state == OPEN:
+            return max(0.0, self._opened_at + self.open_s - self._clock())
+        if self.state == HALF_OPEN and self._probing:
+            # The probe decides soon; don't send clients away for a full period
+            return 1.0
+        return 0.0
+
+    def acquire(self) -> None:
+        """Admit a call, or raise ``CircuitOpenError``.
+
+        Every admitted call must end in ``record`` or ``release``.
+        """
+        if self.state == OPEN and self.retry_after() == 0:
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+        if self.state != CLOSED:
+            CIRCUIT_REJECTIONS.inc(upstream=self.name)
+            raise CircuitOpenError(self.name, max(1.0, self.retry_after()))
+
+    def record(self, ok: bool, seconds: float) -> None:
+        """Report how an admitted call went."""
+        failed = not ok or seconds >= self.slow_call_s
+        if self.state == HALF_OPEN:
+            if self._probing:
+                self._transition(OPEN if failed else CLOSED)
+            return
+        if self.state == OPEN:
+            return  # Started before the breaker opened
+        self._outcomes.append(failed)
+        if (
+            len(self._outcomes) >= self.min_calls
+            and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate
+        ):
+            self._transition(OPEN)
+
+    def release(self) -> None:
+        """Report an admitted call that ended without a verdict (cancelled)."""
+        if self.state == HALF_OPEN:
+            self._probing = False
@@ -0,0 +1,271 @@
+"""Settle a group's debts along relationships that already exist.
+
+``simplify_debts`` pays the largest debtor to the largest creditor. That is
+few transfers, but it can ask someone to pay a person they never shared an
+expense with. Here the debts are a graph instead: people are nodes, and a
+transfer may only use a pair of people that already owe each other in
+either direction. Debtors supply money, creditors demand it, and the
+cheapest flow that settles everyone is found by successive shortest paths.
+
+Each transfer costs ``cost(payer, payee)`` per cent moved, 1 by default, so
+paying a creditor directly beats paying through a middleman. The optimal
+flow is then reduced to a forest: any cycle of transfers can be shifted
+around at no extra cost until one of them is zero. That leaves at most one
+transfer fewer than the number of people, the same bound the greedy pass
+gives. Finding the fewest transfers exactly is NP-hard, so this is not it.
+
+Amounts are worked in whole cents so the totals balance exactly.
+"""
+import heapq
+from collections import defaultdict
+from typing import Callable, Iterable, Optional
+from uuid import UUID
+
+from app.services.debt_simplifier import Debt
+
+CostFn = Callable[[str, str], float]
+
+
+class InfeasibleSettlement(ValueError):
+    """The allowed transfers can't settle everyone's balance."""
+
+
+class _Graph:
+    """Residual graph; arc ``i ^ 1`` is the reverse of arc ``i``."""
+
+    def __init__(self, nodes: int):
+        self.adj: list[list[int]] = [[] for _ in range(nodes)]
+        self.to: list[int] = []
+        self.cap: list[int] = []
+        self.cost: list[float] = []
+
+    def add(self, u: int, v: int, cap: int, cost: float) -> int:
+        arc = len(self.to)
+        self.adj[u].append(arc)
+        self.to.append(v)
+        self.cap.append(cap)
+        self.cost.append(cost)
+        self.adj[v].append(arc + 1)
+        self.to.append(u)
+        self.cap.append(0)
+        self.cost.append(-cost)
+        return arc
+
+
+def _min_cost_flow(graph: _Graph, source: int, sink: int) -> int:
+    """Push as much flow as fits from ``source`` to ``sink``, cheapest first.
+
+    Primal-dual: a Dijkstra pass with potentials finds the shortest distance
+    to every node, then every path of that length is augmented before the
+    next pass. Costs are small, so there are only a few passes.
+    """
+    n = len(graph.adj)
+    adj, to, cap, cost = graph.adj, graph.to, graph.cap, graph.cost
+    potential = [0.0] * n
+    pushed = 0
+    while True:
+        dist = [float("inf")] * n
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for arc in adj[u]:
+                if cap[arc] <= 0:
+                    continue
+                v = to[arc]
+                nd = d + cost[arc] + potential[u] - potential[v]
+                if nd < dist[v] - 1e-9:
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        if dist[sink] == float("inf"):
+            return pushed
+        for v in range(n):
+            if dist[v] < float("inf"):
+                potential[v] += dist[v]
+
+        # Augment along zero reduced-cost arcs only, Dinic style
+        level = [-1] * n
+        level[source] = 0
+        queue = [source]
+        for u in queue:
+            for arc in adj[u]:
+                v = to[arc]
+                if (
+                    cap[arc] > 0
+                    and level[v] < 0
+                    and abs(cost[arc] + potential[u] - potential[v]) < 1e-9
+                ):
+                    level[v] = level[u] + 1
+                    queue.append(v)
+        if level[sink] < 0:
+            continue
+        nxt = [0] * n
+        while True:
+            flow = _augment(graph, source, sink, level, potential, nxt)
+            if not flow:
+                break
+            pushed += flow
+
+
+def _augment(graph: _Graph, source: int, sink: int, level, potential, nxt) -> int:
+    """Find one admissible path and push its bottleneck along it."""
+    adj, to, cap, cost = graph.adj, graph.to, graph.cap, graph.cost
+    path: list[int] = []
+    u = source
+    while u != sink:
+        while nxt[u] < len(adj[u]):
+            arc = adj[u][nxt[u]]
+            v = to[arc]
+            if (
+                cap[arc] > 0
+                and level[v] == level[u] + 1
+                and abs(cost[arc] + potential[u] - potential[v]) < 1e-9
+            ):
+                break
+            nxt[u] += 1
+        else:
+            if u == source:
+                return 0
+            # Dead end: retreat and skip the arc that led here
+            arc = path.pop()
+            u = to[arc ^ 1]
+            nxt[u] += 1
+            continue
+        path.append(adj[u][nxt[u]])
+        u = to[path[-1]]
+    flow = min(cap[arc] for arc in path)
+    for arc in path:
+        cap[arc] -= flow
+        cap[arc ^ 1] += flow
+    return flow
+
+
+def _forest(flows: dict[tuple[str, str], int], cost: CostFn) -> dict[tuple[str, str], int]:
+    """Cancel cycles in the transfers until they form a forest.
+
+    Every transfer in an optimal flow is positive, so each cycle can be
+    shifted either way; one way costs nothing more. Shifting until one of
+    its transfers is zero drops that transfer without changing any balance.
+    """
+    tree: dict[str, dict[str, int]] = defaultdict(dict)  # u -> v -> flow u to v
+
+    def path_between(a: str, b: str) -> Optional[list[str]]:
+        parent = {a: a}
+        queue = [a]
+        for u in queue:
+            if u == b:
+                break
+            for v in tree[u]:
+                if v not in parent:
+                    parent[v] = u
+                    queue.append(v)
+        if b not in parent:
+            return None
+        path = [b]
+        while path[-1] != a:
+            path.append(parent[path[-1]])
+        return path[::-1]
+
+    def set_flow(u: str, v: str, amount: int) -> None:
+        if amount:
+            tree[u][v], tree[v][u] = amount, -amount
+        else:
+            tree[u].pop(v, None)
+            tree[v].pop(u, None)
+
+    for (u, v), amount in flows.items():
+        path = path_between(v, u)
+        if path is None:
+            set_flow(u, v, amount)
+            continue
+        # The cycle runs u -> v along the new transfer, then back to u
+        legs = [(u, v, amount)] + [
+            (a, b, tree[a][b]) for a, b in zip(path, path[1:])
+        ]
+        forward = sum(cost(a, b) if f > 0 else -cost(b, a) for a, b, f in legs)
+        # Shift against the cycle's direction if that way is cheaper, or if
+        # every transfer already runs with it and nothing would drop out
+        sign = -1 if forward > 1e-9 or all(f > 0 for _, _, f in legs) else 1
+        shift = min(abs(f) for _, _, f in legs if (f > 0) != (sign > 0))
+        new_amount = amount + sign * shift
+        for a, b, f in legs[1:]:
+            set_flow(a, b, f + sign * shift)
+        if new_amount:
+            set_flow(u, v, new_amount)
+
+    return {
+        (u, v): amount
+        for u, targets in tree.items()
+        for v, amount in targets.items()
+        if amount > 0
+    }
+
+
+def optimize_debts(
+    debts: Iterable[Debt],
+    cost: Optional[CostFn] = None,
+    allowed_payers: Optional[dict[str, set[str]]] = None,
+) -> list[Debt]:
+    """Settle ``debts`` with transfers between people who already owe each other.
+
+    ``cost(payer, payee)`` is charged per cent sent along a transfer and must
+    not be negative. ``allowed_payers`` maps a user to the only people who
+    may pay them; users missing from it accept anyone they share a debt
+    with. Raises ``InfeasibleSettlement`` if the constraints leave some
+    balance unsettled.
+    """
+    cost = cost or (lambda payer, payee: 1.0)
+    allowed_payers = allowed_payers or {}
+
+    balance: dict[str, int] = defaultdict(int)
+    pairs: set[tuple[str, str]] = set()
+    for debt in debts:
+        a, b = str(debt.from_user), str(debt.to_user)
+        cents = round(debt.amount * 100)
+        if a == b or cents == 0:
+            continue
+        balance[a] -= cents
+        balance[b] += cents
+        pairs.add((a, b))
+        pairs.add((b, a))
+
+    users = sorted(balance)
+    index = {u: i for i, u in enumerate(users)}
+    source, sink = len(users), len(users) + 1
+    graph = _Graph(len(users) + 2)
+    total = sum(-b for b in balance.values() if b < 0)
+
+    for u, b in balance.items():
+        if b < 0:
+            graph.add(source, index[u], -b, 0.0)
+        elif b > 0:
+            graph.add(index[u], sink, b, 0.0)
+
+    arcs: dict[int, tuple[str, str]] = {}
+    for payer, payee in sorted(pairs):
+        allowed = allowed_payers.get(payee)
+        if allowed is not None and payer not in allowed:
+            continue
+        c = cost(payer, payee)
+        if c < 0:
+            raise ValueError(f"Transfer cost {payer} -> {payee} is negative")
+        arcs[graph.add(index[payer], index[payee], total, c)] = (payer, payee)
+
+    if _min_cost_flow(graph, source, sink) < total:
+        raise InfeasibleSettlement("The allowed payers can't settle every balance")
+
+    flows: dict[tuple[str, str], int] = {}
+    for arc, (payer, payee) in arcs.items():
+        sent = graph.cap[arc ^ 1]
+        back = flows.pop((payee, payer), 0)
+        if sent > back:
+            flows[(payer, payee)] = sent - back
+        elif back > sent:
+            flows[(payee, payer)] = back - sent
+
+    return [
+        Debt(from_user=UUID(payer), to_user=UUID(payee), amount=cents / 100)
+        for (payer, payee), cents in sorted(_forest(flows, cost).items())
+    ]
@@ -0,0 +1,186 @@
+"""In-process pub/sub for realtime group events.
+
+Routers publish an event after a write has committed; every open event
+stream for that group gets a copy. Each stream has a bounded queue: a client
+that falls more than ``events_queue_size`` events behind is sent an
+``overflow`` event and disconnected, so one slow phone can't grow memory or
+hold up publishers. It reconnects and refetches, like after any drop.
+
+Events only reach streams on the worker that published them unless a
+bridge is attached. ``RedisBridge`` fans them out over a Redis channel so
+every worker delivers every event (needs the optional ``redis`` package).
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+from app.config import get_settings
+from app.services.metrics import EVENT_SUBSCRIBERS, EVENTS_DROPPED, EVENTS_PUBLISHED
+
+logger = logging.getLogger("uvicorn.error")
+
+OVERFLOW_EVENT = {"type": "overflow"}
+
+
+class Subscription:
+    """One open event stream for a group."""
+
+    def __init__(self, group_id: str, user_id: str, max_queue: int):
+        self.group_id = group_id
+        self.user_id = user_id
+        self.closed = False
+        self._queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self._loop = asyncio.get_running_loop()
+
+    def offer(self, event: dict) -> None:
+        """Queue ``event`` without blocking; safe to call from any thread."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._offer(event)
+        else:
+            self._loop.call_soon_threadsafe(self._offer, event)
+
+    def _offer(self, event: dict) -> None:
+        if self.closed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too far behind: drop the backlog and tell the client to resync
+            self.closed = True
+            EVENTS_DROPPED.inc()
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(OVERFLOW_EVENT)
+
+    async def next_event(self, timeout: float) -> Optional[dict]:
+        """The next event, or None if nothing arrived within ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventHub:
+    """Routes published events to the subscriptions for their group."""
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        # Distinguishes this worker's events when they come back over a bridge
+        self.origin = uuid.uuid4().hex
+        self.bridge: Optional["RedisBridge"] = None
+        self._subscriptions: dict[str, set[Subscription]] = {}
+        # In-process consumers such as cache invalidation; see add_listener
+        self._listeners: list[Callable[[dict], None]] = []
+
+    def subscribe(self, group_id: str, user_id: str) -> Subscription:
+        subscription = Subscription(group_id, user_id, self.max_queue)
+        self._subscriptions.setdefault(group_id, set()).add(subscription)
+        EVENT_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscriptions.get(subscription.group_id)
+        if subscribers is None or subscription not in subscribers:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscriptions[subscription.group_id]
+        EVENT_SUBSCRIBERS.dec()
+
+    def publish(self, group_id: Any, event_type: str, data: Any = None) -> None:
+        """Send an event to the group's streams on every worker."""
+        event = {
+            "type": event_type,
+            "group_id": str(group_id),
+            "data": data,
+            "ts": time.time(),
+        }
+        EVENTS_PUBLISHED.inc(type=event_type)
+        self.deliver(event)
+        if self.bridge is not None:
+            self.bridge.send(event)
+
+    def add_listener(self, listener: Callable[[dict], None]) -> None:
+        """Call ``listener`` with every event this worker sees, bridged ones included."""
+        self._listeners.append(listener)
+
+    def deliver(self, event: dict) -> None:
+        """Hand an event to this worker's listeners and streams only."""
+        for listener in self._listeners:
+            listener(event)
+        for subscription in list(self._subscriptions.get(event["group_id"], ())):
+            subscription.offer(event)
+
+
+class RedisBridge:
+    """Shares events between workers over one Redis pub/sub channel."""
+
+    def __init__(self, hub: EventHub, url: str, channel: str = "snapsplit:events"):
+        self.hub = hub
+        self.url = url
+        self.channel = channel
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+        self._sends: set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(self.url)
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen(pubsub))
+        self.hub.bridge = self
+
+    def send(self, event: dict) -> None:
+        message = json.dumps({**event, "origin": self.hub.origin}, default=str)
+        task = asyncio.create_task(self._publish(message))
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+
+    async def _publish(self, message: str) -> None:
+        try:
+            await self._redis.publish(self.channel, message)
+        except Exception as e:
+            logger.warning("event bridge publish failed: %s", e)
+
+    async def _listen(self, pubsub) -> None:
+        async for message in pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            try:
+                event = json.loads(message["data"])
+            except ValueError:
+                continue
+            if event.pop("origin", None) != self.hub.origin:
+                self.hub.deliver(event)
+
+    async def close(self) -> None:
+        self.hub.bridge = None
+        if self._listener is not None:
+            self._listener.cancel()
+        if self._redis is not None:
+            await self._redis.aclose()
+
+
+@lru_cache
+def get_event_hub() -> EventHub:
+    return EventHub(get_settings().events_queue_size)
+
+
+async def start_event_bridge() -> Optional[RedisBridge]:
+    """Attach the Redis bridge if ``EVENTS_REDIS_URL`` is set."""
+    url = get_settings().events_redis_url
+    if not url:
+        return None
+    bridge = RedisBridge(get_event_hub(), url)
+    await bridge.start()
+    return bridge
@@ -0,0 +1,78 @@
+"""Idempotency keys backed by the ``idempotency_keys`` table.
+
+A key is claimed by inserting its row; the primary key makes the claim
+atomic across workers. The winner runs the write path and stores the
+response on the row, so retries are answered from that row with a single
+select. Rows expire after a TTL and expired claims can be taken over, which
+also frees keys left behind by a crashed request.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+
+def request_fingerprint(payload: Any) -> str:
+    """Stable hash of a request body, to detect a key reused for a different request."""
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _is_unique_violation(error: Exception) -> bool:
+    return getattr(error, "code", None) == "23505"
+
+
+def claim(db, key: str, request_hash: str, ttl_seconds: float) -> Optional[dict]:
+    """Try to claim ``key``.
+
+    Returns None when the caller now owns the key and should do the work.
+    Otherwise returns the existing row: ``response`` is set once the owner
+    has finished, and None while it is still in progress.
+    """
+    from postgrest.exceptions import APIError
+
+    now = datetime.now(timezone.utc)
+    for _ in range(2):
+        try:
+            db.table("idempotency_keys").insert(
+                {
+                    "id": key,
+                    "request_hash": request_hash,
+                    "created_at": now.isoformat(),
+                    "expires_at": (now + timedelta(seconds=ttl_seconds)).isoformat(),
+                }
+            ).execute()
+            return None
+        except APIError as e:
+            if not _is_unique_violation(e):
+                raise
+
+        existing = db.table("idempotency_keys").select("*").eq("id", key).execute()
+        if not existing.data:
+            continue  # Released between our insert and select; try again
+        record = existing.data[0]
+        if datetime.fromisoformat(record["expires_at"]) > now:
+            return record
+
+        # Expired: take it over, conditioned on nobody else having done so
+        db.table("idempotency_keys").delete().eq("id", key).eq(
+            "expires_at", record["expires_at"]
+        ).execute()
+
+    # Another request took the key over each time; report its claim, never
+    # the expired row we failed to take over
+    existing = db.table("idempotency_keys").select("*").eq("id", key).execute()
+    if existing.data and datetime.fromisoformat(existing.data[0]["expires_at"]) > now:
+        return existing.data[0]
+    raise RuntimeError(f"Could not claim idempotency key {key!r}")
+
+
+def save_response(db, key: str, status_code: int, response: Any) -> None:
+    db.table("idempotency_keys").update(
+        {"status_code": status_code, "response": response}
+    ).eq("id", key).execute()
+
+
+def release(db, key: str) -> None:
+    """Drop a claim so the request can be retried (e.g. after a failure)."""
+    db.table("idempotency_keys").delete().eq("id", key).execute()
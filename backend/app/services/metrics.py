@@ -0,0 +1,307 @@
+"""Minimal Prometheus-style metrics registry.
+
+Counters, gauges and histograms are plain in-process objects: recording a
+sample is a dict lookup and an addition, and nothing is formatted until
+``/metrics`` is scraped.
+"""
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts (+Inf last), sum, count]
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels: str) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# HTTP
+HTTP_REQUESTS = REGISTRY.counter(
+    "snapsplit_http_requests_total", "HTTP requests handled.", ("method", "route", "status")
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "snapsplit_http_request_duration_seconds", "HTTP request latency.", ("method", "route")
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "snapsplit_http_requests_in_flight",
+    "HTTP requests currently being served.",
+    ("method", "route"),
+)
+HTTP_COMPRESSED_BYTES = REGISTRY.counter(
+    "snapsplit_http_compressed_bytes_total",
+    "Bytes of compressed response bodies before (raw) and after (sent) compression.",
+    ("encoding", "stage"),
+)
+
+# Database
+DB_QUERIES = REGISTRY.counter(
+    "snapsplit_db_queries_total", "PostgREST queries executed.", ("table", "outcome")
+)
+DB_LATENCY = REGISTRY.histogram(
+    "snapsplit_db_query_duration_seconds", "PostgREST query latency.", ("table",)
+)
+DB_ROUND_TRIPS = REGISTRY.histogram(
+    "snapsplit_db_round_trips_per_request",
+    "PostgREST round trips made while serving one HTTP request.",
+    ("route",),
+    buckets=COUNT_BUCKETS,
+)
+
+# Upstream LLM
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    "snapsplit_upstream_requests_total", "Calls to upstream APIs.", ("upstream", "status")
+)
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "snapsplit_upstream_request_duration_seconds", "Upstream API latency.", ("upstream",)
+)
+CIRCUIT_STATE = REGISTRY.gauge(
+    "snapsplit_circuit_state",
+    "Upstream circuit breaker state: 0 closed, 1 half-open, 2 open.",
+    ("upstream",),
+)
+CIRCUIT_TRANSITIONS = REGISTRY.counter(
+    "snapsplit_circuit_transitions_total",
+    "Upstream circuit breaker state changes, by new state.",
+    ("upstream", "to"),
+)
+CIRCUIT_REJECTIONS = REGISTRY.counter(
+    "snapsplit_circuit_rejections_total",
+    "Upstream calls failed fast because the circuit was open.",
+    ("upstream",),
+)
+RECEIPT_JSON_REPAIRS = REGISTRY.counter(
+    "snapsplit_receipt_json_repairs_total",
+    "Receipt scans that needed a second LLM call to repair malformed JSON.",
+)
+LLM_TOKENS = REGISTRY.counter(
+    "snapsplit_llm_tokens_total", "LLM tokens billed, by upstream and kind.", ("upstream", "kind")
+)
+RECEIPT_SCAN_TOKENS = REGISTRY.histogram(
+    "snapsplit_receipt_scan_tokens",
+    "LLM tokens used by one receipt scan (all strips, hedges and repairs).",
+    ("mode", "kind"),
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+RECEIPT_HEDGES = REGISTRY.counter(
+    "snapsplit_receipt_hedges_total",
+    "Hedged receipt-parser calls: fired to a secondary backend, or won by it.",
+    ("outcome",),
+)
+RECEIPT_TILED_SCANS = REGISTRY.counter(
+    "snapsplit_receipt_tiled_scans_total",
+    "Receipt scans split into overlapping strips because the image was tall.",
+)
+THUMBNAILS = REGISTRY.counter(
+    "snapsplit_receipt_thumbnails_total",
+    "Background receipt thumbnail jobs, by outcome (ok, failed, dropped).",
+    ("outcome",),
+)
+
+# Admission control
+ADMISSION_REJECTIONS = REGISTRY.counter(
+    "snapsplit_admission_rejections_total", "Requests rejected with 429.", ("reason",)
+)
+
+# In-process caches
+CACHE_LOOKUPS = REGISTRY.counter(
+    "snapsplit_cache_lookups_total", "In-process cache lookups.", ("cache", "result")
+)
+
+# Realtime group events
+EVENT_SUBSCRIBERS = REGISTRY.gauge(
+    "snapsplit_event_subscribers", "Open group event streams on this worker."
+)
+EVENTS_PUBLISHED = REGISTRY.counter(
+    "snapsplit_events_published_total", "Group events published, by type.", ("type",)
+)
+EVENTS_DROPPED = REGISTRY.counter(
+    "snapsplit_event_streams_dropped_total",
+    "Event streams closed because the client fell too far behind.",
+)
+
+# Tokens used by the current receipt scan as [prompt, output]; None outside a scan
+_scan_tokens: ContextVar[Optional[list[int]]] = ContextVar("scan_tokens", default=None)
+
+# Round trips made by the current request; None outside a request
+_request_round_trips: ContextVar[Optional[list[int]]] = ContextVar(
+    "request_round_trips", default=None
+)
+
+
+def start_round_trip_count() -> list[int]:
+    cell = [0]
+    _request_round_trips.set(cell)
+    return cell
+
+
+def record_db_query(table: str, duration: float, outcome: str) -> None:
+    DB_QUERIES.inc(table=table, outcome=outcome)
+    DB_LATENCY.observe(duration, table=table)
+    cell = _request_round_trips.get()
+    if cell is not None:
+        cell[0] += 1
+
+
+def record_upstream_call(upstream: str, duration: float, status: str) -> None:
+    UPSTREAM_REQUESTS.inc(upstream=upstream, status=status)
+    UPSTREAM_LATENCY.observe(duration, upstream=upstream)
+
+
+def start_token_count() -> list[int]:
+    cell = [0, 0]
+    _scan_tokens.set(cell)
+    return cell
+
+
+def record_llm_tokens(upstream: str, prompt: int, output: int) -> None:
+    LLM_TOKENS.inc(prompt, upstream=upstream, kind="prompt")
+    LLM_TOKENS.inc(output, upstream=upstream, kind="output")
+    cell = _scan_tokens.get()
+    if cell is not None:
+        cell[0] += prompt
+        cell[1] += output
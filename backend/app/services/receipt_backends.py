@@ -0,0 +1,257 @@
+"""Model endpoints behind ``parse_receipt_image`` and request hedging.
+
+Every backend speaks the Gemini ``generateContent`` protocol, so a backend
+is just a name, a URL and an optional API key. That covers other Gemini
+models as well as the local stand-in server in ``scripts/fake_llm_server.py``.
+
+When more than one backend is configured, a scan goes to the first one and
+is hedged: if no result arrives within that backend's recent p95 latency (or
+it fails), the next backend is tried too. The first valid result wins and
+the other attempts are cancelled, so only the slowest ~5% of scans pay for
+a second call.
+
+Each backend has a circuit breaker. While it is open, calls to that
+backend fail at once, so a hedged scan moves straight to the next backend
+and a single-backend scan fails fast.
+"""
+import asyncio
+import time
+from collections import deque
+from functools import lru_cache
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional, TypeVar
+
+from app.config import get_settings
+from app.services.admission import ConcurrencyLimiter
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.metrics import (
+    RECEIPT_HEDGES,
+    record_llm_tokens,
+    record_upstream_call,
+)
+from app.startup import timed_import
+
+if TYPE_CHECKING:
+    import httpx
+
+T = TypeVar("T")
+
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
+
+_http_client: Optional["httpx.AsyncClient"] = None
+
+
+def get_http_client() -> "httpx.AsyncClient":
+    """Shared client so scans reuse pooled TLS connections to the model hosts."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        httpx = timed_import("httpx")
+        _http_client = httpx.AsyncClient(timeout=60)
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies."""
+
+    def __init__(self, size: int = 200):
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class ReceiptBackend:
+    """A generateContent-compatible model endpoint."""
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        api_key: str = "",
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.latency = LatencyTracker()
+        self.breaker = breaker
+
+    async def generate(self, payload: dict, timeout: float) -> str:
+        """POST a generateContent request and return the first candidate's text.
+
+        Raises ``CircuitOpenError`` without calling out while the breaker is open.
+        """
+        import httpx
+
+        if self.breaker is not None:
+            self.breaker.acquire()
+        params = {"key": self.api_key} if self.api_key else None
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = await get_http_client().post(
+                self.url, params=params, json=payload, timeout=timeout
+            )
+            status = str(response.status_code)
+            response.raise_for_status()
+        except httpx.TimeoutException:
+            status = "timeout"
+            raise
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            record_upstream_call(self.name, elapsed, status)
+            self._record_breaker(status, elapsed)
+
+        self.latency.observe(time.perf_counter() - start)
+        result = response.json()
+        usage = result.get("usageMetadata") or {}
+        record_llm_tokens(
+            self.name,
+            usage.get("promptTokenCount", 0),
+            usage.get("candidatesTokenCount", 0),
+        )
+        return result["candidates"][0]["content"]["parts"][0]["text"].strip()
+
+    def _record_breaker(self, status: str, elapsed: float) -> None:
+        if self.breaker is None:
+            return
+        if status == "cancelled":
+            # A hedge that lost the race says nothing about the backend's health
+            self.breaker.release()
+            return
+        # 4xx means a bad request rather than a struggling upstream, except 429
+        healthy = status.isdigit() and int(status) < 500 and status != "429"
+        self.breaker.record(healthy, elapsed)
+
+    async def warm_up(self) -> None:
+        """Open a pooled connection to the backend's host."""
+        httpx = timed_import("httpx")
+        origin = httpx.URL(self.url).copy_with(path="/", query=None)
+        await get_http_client().get(origin, timeout=10)
+
+
+@lru_cache
+def get_backends() -> list[ReceiptBackend]:
+    """Configured backends in priority order (defaults to Gemini 2.5 Flash)."""
+    settings = get_settings()
+    if not settings.receipt_backends:
+        return [
+            ReceiptBackend(
+                "gemini", GEMINI_API_URL, settings.gemini_api_key, _breaker("gemini")
+            )
+        ]
+    return [
+        ReceiptBackend(
+            b.name,
+            b.url,
+            settings.gemini_api_key if b.api_key is None else b.api_key,
+            _breaker(b.name),
+        )
+        for b in settings.receipt_backends
+    ]
+
+
+@lru_cache
+def get_scan_concurrency_limiter() -> ConcurrencyLimiter:
+    """Global cap on in-flight model calls, shared by every scan endpoint.
+
+    Each call takes its own slot: every strip of a tiled receipt, every
+    hedge and every JSON repair call.
+    """
+    settings = get_settings()
+    return ConcurrencyLimiter(
+        limit=settings.scan_max_concurrency, max_queue=settings.scan_max_queue
+    )
+
+
+def _breaker(name: str) -> Optional[CircuitBreaker]:
+    settings = get_settings()
+    if not settings.receipt_breaker_enabled:
+        return None
+    return CircuitBreaker(
+        name,
+        window=settings.receipt_breaker_window,
+        min_calls=settings.receipt_breaker_min_calls,
+        failure_rate=settings.receipt_breaker_failure_rate,
+        slow_call_s=settings.receipt_breaker_slow_call_s,
+        open_s=settings.receipt_breaker_open_s,
+    )
+
+
+def check_available() -> None:
+    """Fail fast with ``CircuitOpenError`` if every backend's breaker is open."""
+    waits = [b.breaker.retry_after() if b.breaker else 0.0 for b in get_backends()]
+    if min(waits) > 0:
+        raise CircuitOpenError(get_backends()[0].name, max(1.0, min(waits)))
+
+
+def hedge_delay(backend: ReceiptBackend) -> float:
+    """Wait this long for ``backend`` before firing the next one."""
+    settings = get_settings()
+    if len(backend.latency) < settings.receipt_hedge_min_samples:
+        return settings.receipt_hedge_default_delay_s
+    return backend.latency.percentile(0.95)
+
+
+async def run_hedged(
+    attempts: list[Callable[[], Awaitable[T]]],
+    delay: float,
+) -> T:
+    """Run ``attempts`` in order, starting the next one when the running ones
+    haven't produced a result within ``delay`` seconds or have all failed.
+
+    Returns the first successful result and cancels everything still running.
+    If every attempt fails, the first failure is re-raised.
+    """
+    pending = list(attempts)
+    running: dict[asyncio.Task, int] = {}
+    errors: list[BaseException] = []
+
+    def launch() -> None:
+        index = len(attempts) - len(pending)
+        running[asyncio.create_task(pending.pop(0)())] = index
+        if index > 0:
+            RECEIPT_HEDGES.inc(outcome="fired")
+
+    launch()
+    try:
+        while running:
+            done, _ = await asyncio.wait(
+                running,
+                timeout=delay if pending else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                launch()
+                continue
+            for task in done:
+                index = running.pop(task)
+                if task.exception() is None:
+                    if index > 0:
+                        RECEIPT_HEDGES.inc(outcome="hedge_won")
+                    return task.result()
+                errors.append(task.exception())
+            if not running and pending:
+                launch()
+        raise errors[0]
+    finally:
+        for task in running:
+            task.cancel()
@@ -1,9 +1,24 @@
+import asyncio
 import base64
 import json
-import httpx
+from functools import partial
 
 from app.config import get_settings
 from app.models.receipt import ParsedReceiptItem
+from app.services.metrics import (
+    RECEIPT_JSON_REPAIRS,
+    RECEIPT_SCAN_TOKENS,
+    RECEIPT_TILED_SCANS,
+    start_token_count,
+)
+from app.services.receipt_backends import (
+    ReceiptBackend,
+    get_backends,
+    get_scan_concurrency_limiter,
+    hedge_delay,
+    run_hedged,
+)
+from app.services.receipt_tiles import merge_strip_items, split_tall_receipt
 
 
 RECEIPT_PROMPT = """You are a receipt parser. Extract ALL line items with their quantities and prices from this receipt image.
@@ -22,19 +37,103 @@ Example output:
 
 Return ONLY the JSON array. No markdown, no explanation, no code fences."""
 
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
+# Structured-output mode: the model returns parallel arrays constrained by
+# COMPACT_SCHEMA, so keys are written once per receipt instead of once per item.
+COMPACT_PROMPT = """You are a receipt parser. Extract ALL line items from this receipt image.
+Ignore tax, tip, subtotal, and total lines.
+
+Return parallel arrays in receipt order:
+- n: item descriptions
+- q: quantities (1 if not shown)
+- p: line totals"""
+
+COMPACT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "n": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "q": {"type": "ARRAY", "items": {"type": "INTEGER"}},
+        "p": {"type": "ARRAY", "items": {"type": "NUMBER"}},
+    },
+    "required": ["n", "q", "p"],
+    "propertyOrdering": ["n", "q", "p"],
+}
+
+STRIP_NOTE = """
+
+This image is one horizontal section of a longer receipt. Only include lines
+that are fully visible; skip any line cut off at the top or bottom edge."""
+
+
+def decode_compact_items(data: dict) -> list[ParsedReceiptItem]:
+    """Map the compact ``{"n": [...], "q": [...], "p": [...]}`` rows to items."""
+    names, quantities, prices = data["n"], data.get("q") or [], data["p"]
+    if len(names) != len(prices):
+        raise ValueError(
+            f"Compact receipt has {len(names)} names but {len(prices)} prices"
+        )
+    return [
+        ParsedReceiptItem(
+            item_name=name,
+            quantity=quantities[i] if i < len(quantities) else 1,
+            total_price=prices[i],
+        )
+        for i, name in enumerate(names)
+    ]
 
 
 async def parse_receipt_image(image_bytes: bytes) -> list[ParsedReceiptItem]:
-    """Send receipt image directly to Gemini 2.5 Flash and parse items."""
+    """Send receipt image to the configured model backend(s) and parse items.
+
+    Tall receipts are split into overlapping strips that are scanned in
+    parallel, then merged with the overlap duplicates removed.
+    """
+    settings = get_settings()
+    structured = settings.receipt_structured_output
+    prompt = COMPACT_PROMPT if structured else RECEIPT_PROMPT
+    tokens = start_token_count()
+    try:
+        return await _parse_image(image_bytes, prompt, structured)
+    finally:
+        mode = "structured" if structured else "text"
+        RECEIPT_SCAN_TOKENS.observe(tokens[0], mode=mode, kind="prompt")
+        RECEIPT_SCAN_TOKENS.observe(tokens[1], mode=mode, kind="output")
+
+
+async def _parse_image(
+    image_bytes: bytes, prompt: str, structured: bool
+) -> list[ParsedReceiptItem]:
     settings = get_settings()
+    strips = None
+    if settings.scan_tiling_enabled:
+        strips = await asyncio.to_thread(
+            split_tall_receipt,
+            image_bytes,
+            min_aspect=settings.scan_tile_min_aspect,
+            overlap=settings.scan_tile_overlap,
+            max_strips=settings.scan_tile_max_strips,
+        )
+
+    if not strips:
+        return await _parse_single(image_bytes, prompt, structured)
+
+    RECEIPT_TILED_SCANS.inc()
+    results = await asyncio.gather(
+        *(_parse_single(strip, prompt + STRIP_NOTE, structured) for strip in strips)
+    )
+    return merge_strip_items(list(results))
+
+
+async def _parse_single(
+    image_bytes: bytes, prompt: str, structured: bool
+) -> list[ParsedReceiptItem]:
+    """Parse one image, hedging across backends when more than one is configured."""
     base64_image = base64.b64encode(image_bytes).decode("utf-8")
 
     payload = {
         "contents": [
             {
                 "parts": [
-                    {"text": RECEIPT_PROMPT},
+                    {"text": prompt},
                     {
                         "inline_data": {
                             "mime_type": "image/jpeg",
@@ -49,16 +148,37 @@ async def parse_receipt_image(image_bytes: bytes) -> list[ParsedReceiptItem]:
             "maxOutputTokens": 2000,
         },
     }
+    if structured:
+        payload["generationConfig"]["responseMimeType"] = "application/json"
+        payload["generationConfig"]["responseSchema"] = COMPACT_SCHEMA
 
-    async with httpx.AsyncClient(timeout=60) as client:
-        response = await client.post(
-            f"{GEMINI_API_URL}?key={settings.gemini_api_key}",
-            json=payload,
-        )
-        response.raise_for_status()
+    backends = get_backends()
+    if len(backends) == 1 or not get_settings().receipt_hedge_enabled:
+        return await _parse_with(backends[0], payload, structured)
+
+    return await run_hedged(
+        [partial(_parse_with, backend, payload, structured) for backend in backends],
+        delay=hedge_delay(backends[0]),
+    )
+
+
+async def _generate(backend: ReceiptBackend, payload: dict, timeout: float) -> str:
+    """One model call, inside a slot of the global scan concurrency limit.
+
+    Raises ``QueueFullError`` when every slot is busy and the queue is full.
+    """
+    async with get_scan_concurrency_limiter().slot():
+        return await backend.generate(payload, timeout=timeout)
+
+
+async def _parse_with(
+    backend: ReceiptBackend, payload: dict, structured: bool
+) -> list[ParsedReceiptItem]:
+    raw_output = await _generate(backend, payload, timeout=60)
 
-    result = response.json()
-    raw_output = result["candidates"][0]["content"]["parts"][0]["text"].strip()
+    if structured:
+        # The response schema guarantees JSON, so no fence stripping or repair call
+        return decode_compact_items(json.loads(raw_output))
 
     # Clean up potential markdown fences
     if raw_output.startswith("```"):
@@ -70,6 +190,7 @@ async def parse_receipt_image(image_bytes: bytes) -> list[ParsedReceiptItem]:
         items_data = json.loads(raw_output)
     except json.JSONDecodeError:
         # Retry once with a stricter prompt
+        RECEIPT_JSON_REPAIRS.inc()
         retry_payload = {
             "contents": [
                 {
@@ -82,14 +203,7 @@ async def parse_receipt_image(image_bytes: bytes) -> list[ParsedReceiptItem]:
             ],
             "generationConfig": {"temperature": 0},
         }
-        async with httpx.AsyncClient(timeout=30) as client:
-            retry_resp = await client.post(
-                f"{GEMINI_API_URL}?key={settings.gemini_api_key}",
-                json=retry_payload,
-            )
-            retry_resp.raise_for_status()
-        retry_result = retry_resp.json()
-        raw_retry = retry_result["candidates"][0]["content"]["parts"][0]["text"].strip()
+        raw_retry = await _generate(backend, retry_payload, timeout=30)
         items_data = json.loads(raw_retry)
 
     return [ParsedReceiptItem(**item) for item in items_data]
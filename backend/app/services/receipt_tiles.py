@@ -0,0 +1,106 @@
+"""Split tall receipt photos into overlapping strips and merge the results.
+
+Long grocery receipts overflow the model's output budget and are the
+slowest scans. Scanning overlapping horizontal strips in parallel keeps each
+response small; items that fall in an overlap are read twice and removed
+when the strip results are merged.
+
+Pillow is optional: without it every image is scanned in one pass.
+"""
+import io
+import math
+import re
+from difflib import SequenceMatcher
+from typing import Optional
+
+from app.models.receipt import ParsedReceiptItem
+
+
+def split_tall_receipt(
+    image_bytes: bytes,
+    min_aspect: float,
+    overlap: float,
+    max_strips: int,
+) -> Optional[list[bytes]]:
+    """Return JPEG strips for a tall image, or None if it should be scanned whole."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        width, height = image.size
+    except Exception:
+        return None
+
+    if width == 0 or height / width < min_aspect:
+        return None
+
+    # Aim for strips about as tall as 1.5x the width, overlapping by `overlap`
+    target = width * 1.5
+    count = math.ceil((height - overlap * target) / (target * (1 - overlap)))
+    count = max(2, min(max_strips, count))
+    strip_height = height / (count - (count - 1) * overlap)
+    step = strip_height * (1 - overlap)
+
+    image = image.convert("RGB")
+    strips = []
+    for i in range(count):
+        top = round(i * step)
+        bottom = height if i == count - 1 else round(i * step + strip_height)
+        buffer = io.BytesIO()
+        image.crop((0, top, width, bottom)).save(buffer, format="JPEG", quality=90)
+        strips.append(buffer.getvalue())
+    return strips
+
+
+def _normalize_name(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", name.lower()).strip()
+
+
+def _same_item(a: ParsedReceiptItem, b: ParsedReceiptItem) -> bool:
+    if abs(a.total_price - b.total_price) > 0.005 or a.quantity != b.quantity:
+        return False
+    # Tolerate small OCR differences between the two reads of one line
+    return SequenceMatcher(None, _normalize_name(a.item_name), _normalize_name(b.item_name)).ratio() >= 0.8
+
+
+def _overlap_length(
+    previous: list[ParsedReceiptItem],
+    current: list[ParsedReceiptItem],
+    window: int,
+) -> int:
+    """Count leading items of ``current`` that repeat the tail of ``previous`` in order."""
+    tail = previous[-window:]
+    position = 0
+    dropped = 0
+    for item in current:
+        match = next(
+            (i for i in range(position, len(tail)) if _same_item(tail[i], item)),
+            None,
+        )
+        if match is None:
+            break
+        position = match + 1
+        dropped += 1
+    return dropped
+
+
+def merge_strip_items(
+    strips: list[list[ParsedReceiptItem]],
+    window: int = 8,
+) -> list[ParsedReceiptItem]:
+    """Concatenate per-strip items top to bottom, dropping overlap duplicates.
+
+    Only the first items of a strip are compared against the last ``window``
+    items of the strip above it, so identical lines elsewhere on the receipt
+    are kept.
+    """
+    merged: list[ParsedReceiptItem] = []
+    previous: list[ParsedReceiptItem] = []
+    for items in strips:
+        skip = _overlap_length(previous, items, window) if previous else 0
+        merged.extend(items[skip:])
+        previous = items or previous
+    return merged
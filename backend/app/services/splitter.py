@@ -38,8 +38,10 @@ def calculate_shares(
             uid_str = str(uid)
             user_shares[uid_str] = user_shares.get(uid_str, 0) + per_person
 
-    # Calculate total base
-    total_base = sum(user_shares.values())
+    # Calculate total base, left to right like generate_settlements in SQL
+    total_base = 0.0
+    for base_share in user_shares.values():
+        total_base += base_share
     total_overhead = tax_amount + tip_amount
 
     # Build results with proportional tax/tip
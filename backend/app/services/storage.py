@@ -0,0 +1,146 @@
+"""Object storage for receipt images and their thumbnails.
+
+Clients upload receipt images straight to storage with a short-lived
+signed URL, so image bytes never pass through the API on the way in. The
+API only hands out the URL and later refers to the object by its key.
+
+``STORAGE_BACKEND=supabase`` uses Supabase Storage. ``local`` keeps objects
+under ``STORAGE_LOCAL_DIR``, with HMAC-signed URLs served by the receipts
+router. It is a stand-in for tests and development.
+"""
+import hashlib
+import hmac
+import re
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+from app.config import get_settings
+
+# uploads/<user id>/<random id>.<ext>: unguessable, and scoped to the uploader
+UPLOAD_KEY = re.compile(r"^uploads/[0-9a-f-]{36}/[0-9a-f]{32}\.(jpg|png|webp|heic)$")
+IMAGE_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/heic": "heic",
+}
+
+
+class StorageError(Exception):
+    pass
+
+
+def is_upload_key(key: str, user_id: Optional[str] = None) -> bool:
+    """Whether ``key`` names an upload, optionally one made by ``user_id``."""
+    if not UPLOAD_KEY.match(key):
+        return False
+    return user_id is None or key.split("/")[1] == str(user_id)
+
+
+class SupabaseStorage:
+    """One Supabase Storage bucket."""
+
+    def __init__(self, bucket: str):
+        self.bucket = bucket
+
+    def _bucket(self):
+        from app.db.client import get_supabase_admin
+
+        return get_supabase_admin().storage.from_(self.bucket)
+
+    def create_upload_url(self, key: str, content_type: str, ttl: float) -> dict:
+        # Supabase signed upload URLs are valid for two hours; ``ttl`` is advisory
+        signed = self._bucket().create_signed_upload_url(key)
+        return {
+            "url": signed["signed_url"],
+            "method": "PUT",
+            "headers": {"Content-Type": content_type},
+        }
+
+    def download(self, key: str) -> bytes:
+        try:
+            return self._bucket().download(key)
+        except Exception as e:
+            raise StorageError(f"Could not read {key}: {e}") from e
+
+    def upload(self, key: str, data: bytes, content_type: str) -> None:
+        self._bucket().upload(
+            key, data, {"content-type": content_type, "upsert": "true"}
+        )
+
+    def public_url(self, key: str) -> str:
+        return self._bucket().get_public_url(key)
+
+
+class LocalStorage:
+    """A directory standing in for a bucket, behind HMAC-signed URLs."""
+
+    def __init__(self, bucket: str, root: Path, secret: str):
+        self.bucket = bucket
+        self.root = root / bucket
+        self._secret = secret.encode()
+
+    def path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise StorageError(f"Invalid key: {key}")
+        return path
+
+    def signature(self, method: str, key: str, expires: int) -> str:
+        message = f"{method}\n{self.bucket}\n{key}\n{expires}".encode()
+        return hmac.new(self._secret, message, hashlib.sha256).hexdigest()
+
+    def verify(self, method: str, key: str, expires: int, signature: str) -> bool:
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self.signature(method, key, expires), signature)
+
+    def _signed_url(self, method: str, key: str, expires: int) -> str:
+        signature = self.signature(method, key, expires)
+        return (
+            f"{get_settings().storage_local_base_url}/api/receipt/storage/"
+            f"{self.bucket}/{quote(key)}?expires={expires}&signature={signature}"
+        )
+
+    def create_upload_url(self, key: str, content_type: str, ttl: float) -> dict:
+        return {
+            "url": self._signed_url("PUT", key, int(time.time() + ttl)),
+            "method": "PUT",
+            "headers": {"Content-Type": content_type},
+        }
+
+    def download(self, key: str) -> bytes:
+        try:
+            return self.path(key).read_bytes()
+        except OSError as e:
+            raise StorageError(f"Could not read {key}: {e}") from e
+
+    def upload(self, key: str, data: bytes, content_type: str) -> None:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+    def public_url(self, key: str) -> str:
+        # Far-future expiry: stands in for a public bucket
+        return self._signed_url("GET", key, 2**31 - 1)
+
+
+@lru_cache
+def get_storage(bucket: str):
+    settings = get_settings()
+    if settings.storage_backend == "local":
+        return LocalStorage(
+            bucket, Path(settings.storage_local_dir), settings.storage_signing_secret
+        )
+    return SupabaseStorage(bucket)
+
+
+def get_receipt_storage():
+    return get_storage(get_settings().storage_receipt_bucket)
+
+
+def get_thumbnail_storage():
+    return get_storage(get_settings().storage_thumbnail_bucket)
@@ -0,0 +1,110 @@
+"""Background thumbnails of uploaded receipt images for the expense list.
+
+Creating an expense with a ``receipt_image_key`` queues a job. The worker
+task reads the original from storage and writes a small JPEG to the public
+thumbnail bucket. It then stores that URL on the expense. Decoding and
+resizing run in a thread, so the event loop keeps serving requests. The
+queue is bounded. When it is full, the job is dropped and the expense has
+no thumbnail.
+"""
+import asyncio
+import io
+import logging
+from functools import lru_cache
+from typing import Optional
+
+from app.config import get_settings
+from app.db.client import get_supabase_admin
+from app.services.metrics import THUMBNAILS
+from app.services.storage import get_receipt_storage, get_thumbnail_storage
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def make_thumbnail(data: bytes, max_px: int, quality: int) -> bytes:
+    """Downscale an image to fit ``max_px`` square and encode it as JPEG."""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEGs can be decoded at a fraction of full size, which is much faster
+        image.draft("RGB", (max_px, max_px))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((max_px, max_px))
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def thumbnail_key(key: str) -> str:
+    return key.rsplit(".", 1)[0] + ".jpg"
+
+
+def generate_thumbnail(expense_id: str, key: str) -> str:
+    """Thumbnail one receipt image and record its URL on the expense."""
+    settings = get_settings()
+    original = get_receipt_storage().download(key)
+    thumbnail = make_thumbnail(
+        original, settings.thumbnail_max_px, settings.thumbnail_quality
+    )
+    storage = get_thumbnail_storage()
+    storage.upload(thumbnail_key(key), thumbnail, "image/jpeg")
+    url = storage.public_url(thumbnail_key(key))
+    get_supabase_admin().table("expenses").update(
+        {"receipt_thumbnail_url": url}
+    ).eq("id", expense_id).execute()
+    return url
+
+
+class ThumbnailWorker:
+    """Runs thumbnail jobs one at a time on a background task."""
+
+    def __init__(self, max_queue: int):
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, expense_id: str, key: str) -> bool:
+        """Queue a job; False when the worker isn't running or is full."""
+        if self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait((expense_id, key))
+        except asyncio.QueueFull:
+            THUMBNAILS.inc(outcome="dropped")
+            return False
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            expense_id, key = await self._queue.get()
+            try:
+                await asyncio.to_thread(generate_thumbnail, expense_id, key)
+                THUMBNAILS.inc(outcome="ok")
+            except Exception as e:
+                THUMBNAILS.inc(outcome="failed")
+                logger.warning("thumbnail for expense %s failed: %s", expense_id, e)
+            finally:
+                self._queue.task_done()
+
+    async def join(self) -> None:
+        """Wait until every queued job has finished."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._queue = self._task = None
+
+
+@lru_cache
+def get_thumbnail_worker() -> ThumbnailWorker:
+    return ThumbnailWorker(get_settings().thumbnail_queue_size)
@@ -0,0 +1,54 @@
+"""Import timing and optional warm-up for cold starts.
+
+Heavy client libraries (supabase, httpx) are imported on first use. Their
+import cost is recorded here alongside the router imports so the startup
+report shows where boot time goes.
+"""
+import importlib
+import logging
+import time
+
+logger = logging.getLogger("uvicorn.error")
+
+# module name -> seconds spent importing it
+IMPORT_TIMES: dict[str, float] = {}
+
+
+def timed_import(module: str):
+    """Import a module and record how long it took (cached imports cost ~0)."""
+    start = time.perf_counter()
+    mod = importlib.import_module(module)
+    IMPORT_TIMES.setdefault(module, time.perf_counter() - start)
+    return mod
+
+
+def log_startup_report(total: float, budget_ms: float) -> None:
+    """Log per-import timings and warn when startup exceeds the budget."""
+    for module, seconds in sorted(IMPORT_TIMES.items(), key=lambda x: -x[1]):
+        logger.info("startup import %-32s %8.1f ms", module, seconds * 1000)
+    logger.info("startup total %.1f ms (budget %.0f ms)", total * 1000, budget_ms)
+    if budget_ms and total * 1000 > budget_ms:
+        logger.warning(
+            "startup took %.1f ms, over the %.0f ms budget", total * 1000, budget_ms
+        )
+
+
+async def warm_up() -> None:
+    """Open the DB and Gemini connections so the first request isn't the slow one."""
+    from app.db.client import get_supabase_admin
+    from app.services.receipt_backends import get_backends
+
+    start = time.perf_counter()
+    try:
+        get_supabase_admin().table("users").select("id").limit(1).execute()
+    except Exception as e:
+        logger.warning("database warm-up failed: %s", e)
+    logger.info("warm-up database %.1f ms", (time.perf_counter() - start) * 1000)
+
+    for backend in get_backends():
+        start = time.perf_counter()
+        try:
+            await backend.warm_up()
+        except Exception as e:
+            logger.warning("%s warm-up failed: %s", backend.name, e)
+        logger.info("warm-up %s %.1f ms", backend.name, (time.perf_counter() - start) * 1000)
@@ -0,0 +1,73 @@
+"""Benchmark min-cost-flow settlement plans against the greedy pass.
+
+Usage:
+    python scripts/bench_settlements.py --members 100 300 500 --expenses-per-member 5
+
+Builds a random group for each size: every expense has one payer and a few
+people who owe them a share. Then it times ``optimize_debts`` on those debts
+and reports how many transfers it needs next to ``simplify_debts``, and how
+many of the greedy transfers are between people with no debt between them.
+"""
+import argparse
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.debt_optimizer import optimize_debts  # noqa: E402
+from app.services.debt_simplifier import Debt, simplify_debts  # noqa: E402
+
+
+def random_debts(rnd: random.Random, members: int, expenses: int, sharers: int) -> list[Debt]:
+    users = [uuid.UUID(int=rnd.getrandbits(128)) for _ in range(members)]
+    debts = []
+    for _ in range(expenses):
+        payer = rnd.choice(users)
+        for user in rnd.sample(users, sharers):
+            if user != payer:
+                debts.append(Debt(from_user=user, to_user=payer, amount=round(rnd.uniform(1, 80), 2)))
+    return debts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--members", type=int, nargs="+", default=[100, 300, 500])
+    parser.add_argument("--expenses-per-member", type=int, default=5)
+    parser.add_argument("--sharers", type=int, default=4, help="people on each expense")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(
+        f"{'members':>8} {'debts':>7} {'flow ms':>9} {'flow n':>7} "
+        f"{'greedy n':>9} {'greedy new pairs':>17}"
+    )
+    for members in args.members:
+        rnd = random.Random(args.seed + members)
+        debts = random_debts(rnd, members, members * args.expenses_per_member, args.sharers)
+        pairs = {frozenset((d.from_user, d.to_user)) for d in debts}
+
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            planned = optimize_debts(debts)
+            timings.append(time.perf_counter() - start)
+
+        balances: dict[str, float] = {}
+        for d in debts:
+            balances[str(d.from_user)] = balances.get(str(d.from_user), 0) - d.amount
+            balances[str(d.to_user)] = balances.get(str(d.to_user), 0) + d.amount
+        greedy = simplify_debts(balances)
+        strangers = sum(frozenset((d.from_user, d.to_user)) not in pairs for d in greedy)
+
+        print(
+            f"{members:>8} {len(debts):>7} {min(timings) * 1000:>9.1f} "
+            f"{len(planned):>7} {len(greedy):>9} {strangers:>17}"
+        )
+
+
+if __name__ == "__main__":
+    main()
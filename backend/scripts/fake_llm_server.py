@@ -0,0 +1,71 @@
+"""Local stand-in for the Gemini generateContent API.
+
+Usage:
+    python scripts/fake_llm_server.py --port 8090 --delay-ms 800 --slow-fraction 0.05 --slow-ms 8000
+
+Returns a fixed receipt for every request after a configurable delay; a
+fraction of requests can be made slow to reproduce tail latency. Point a
+backend at it with:
+    RECEIPT_BACKENDS=[{"name":"local","url":"http://127.0.0.1:8090/v1beta/models/fake:generateContent","api_key":""}]
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from fastapi import FastAPI
+
+ITEMS = [
+    {"item_name": "Caesar Salad", "quantity": 1, "total_price": 12.50},
+    {"item_name": "IPA Beer", "quantity": 2, "total_price": 16.00},
+    {"item_name": "Margherita Pizza", "quantity": 1, "total_price": 14.00},
+]
+
+
+def create_app(delay: float, slow_fraction: float, slow_delay: float) -> FastAPI:
+    app = FastAPI(title="Fake generateContent")
+
+    @app.get("/")
+    async def root():
+        return {"status": "ok"}
+
+    @app.post("/v1beta/models/{model_action}")
+    async def generate_content(model_action: str, payload: dict):
+        slow = random.random() < slow_fraction
+        await asyncio.sleep(slow_delay if slow else delay)
+        config = payload.get("generationConfig", {})
+        if config.get("responseSchema"):
+            # Structured-output mode: compact parallel arrays
+            text = json.dumps(
+                {
+                    "n": [i["item_name"] for i in ITEMS],
+                    "q": [i["quantity"] for i in ITEMS],
+                    "p": [i["total_price"] for i in ITEMS],
+                }
+            )
+        else:
+            text = json.dumps(ITEMS)
+        return {
+            "candidates": [{"content": {"parts": [{"text": text}]}}],
+            "usageMetadata": {"promptTokenCount": 300, "candidatesTokenCount": len(text) // 4},
+        }
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--delay-ms", type=float, default=500)
+    parser.add_argument("--slow-fraction", type=float, default=0.0)
+    parser.add_argument("--slow-ms", type=float, default=10_000)
+    args = parser.parse_args()
+    app = create_app(args.delay_ms / 1000, args.slow_fraction, args.slow_ms / 1000)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Load-test every router in-process against the fake database.
+
+Usage:
+    python scripts/loadtest.py --requests 2000 --concurrency 50 --latency-ms 5
+
+Seeds the in-memory store, mints JWTs for the seeded users and drives the
+ASGI app through httpx without a network hop. For each endpoint it reports
+DB round trips per request (measured on a serial pass), throughput and
+latency percentiles under concurrent load.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_ANON_KEY", "loadtest")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "loadtest")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "loadtest-secret")
+os.environ["DB_BACKEND"] = "fake"
+
+
+def seed(db, members: int, expenses: int, items: int) -> dict:
+    users = [str(uuid.uuid4()) for _ in range(members)]
+    db.seed(
+        "users",
+        [{"id": u, "email": f"user{i}@example.com", "display_name": f"User {i}"} for i, u in enumerate(users)],
+    )
+    group = db.seed("groups", [{"name": "Load test", "created_by": users[0]}])[0]
+    db.seed(
+        "group_members",
+        [{"group_id": group["id"], "user_id": u, "role": "admin" if i == 0 else "member"} for i, u in enumerate(users)],
+    )
+    expense_ids = []
+    for e in range(expenses):
+        expense = db.seed(
+            "expenses",
+            [{"group_id": group["id"], "created_by": users[e % members], "total_amount": 10.0 * items, "tax_amount": 2.0}],
+        )[0]
+        expense_ids.append(expense["id"])
+        rows = db.seed(
+            "receipt_items",
+            [{"expense_id": expense["id"], "item_name": f"Item {i}", "unit_price": 10.0, "total_price": 10.0} for i in range(items)],
+        )
+        db.seed(
+            "item_assignments",
+            [{"receipt_item_id": r["id"], "user_id": users[(i + k) % members]} for i, r in enumerate(rows) for k in range(2)],
+        )
+    return {"users": users, "group_id": group["id"], "expense_ids": expense_ids}
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def run(args) -> None:
+    import httpx
+    from jose import jwt
+
+    from app.config import get_settings
+    from app.db.client import get_fake_database
+    from app.main import app
+
+    db = get_fake_database()
+    db.latency = args.latency_ms / 1000
+    fixture = seed(db, args.members, args.expenses, args.items)
+
+    user = fixture["users"][0]
+    token = jwt.encode(
+        {"sub": user, "aud": "authenticated"},
+        get_settings().supabase_jwt_secret,
+        algorithm="HS256",
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    group_id = fixture["group_id"]
+    expense_id = fixture["expense_ids"][0]
+    new_expense = {
+        "group_id": group_id,
+        "total_amount": 20.0,
+        "items": [
+            {"item_name": f"Item {i}", "unit_price": 1.0, "total_price": 1.0, "assigned_user_ids": fixture["users"][:2]}
+            for i in range(args.items)
+        ],
+    }
+
+    endpoints = [
+        ("GET /api/auth/me", "GET", "/api/auth/me", None),
+        ("GET /api/groups", "GET", "/api/groups", None),
+        ("GET /api/groups/{id}", "GET", f"/api/groups/{group_id}", None),
+        ("GET /api/expenses/{id}", "GET", f"/api/expenses/{expense_id}", None),
+        ("GET /api/expenses/{id}/shares", "GET", f"/api/expenses/{expense_id}/shares", None),
+        ("GET /api/settlements/expense/{id}", "GET", f"/api/settlements/expense/{expense_id}", None),
+        ("POST /api/expenses", "POST", "/api/expenses", new_expense),
+    ]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", headers=headers) as client:
+        print(f"{'endpoint':38} {'trips':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for name, method, path, body in endpoints:
+            before = db.round_trips
+            await client.request(method, path, json=body)
+            trips = db.round_trips - before
+
+            semaphore = asyncio.Semaphore(args.concurrency)
+            latencies: list[float] = []
+            errors = 0
+
+            async def one() -> None:
+                nonlocal errors
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.request(method, path, json=body)
+                    latencies.append(time.perf_counter() - start)
+                    if response.status_code >= 400:
+                        errors += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(args.requests)))
+            elapsed = time.perf_counter() - started
+
+            print(
+                f"{name:38} {trips:>6} {args.requests / elapsed:>8.0f} "
+                f"{percentile(latencies, 0.50) * 1000:>8.1f} "
+                f"{percentile(latencies, 0.95) * 1000:>8.1f} "
+                f"{percentile(latencies, 0.99) * 1000:>8.1f} {errors:>7}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated PostgREST latency per call")
+    parser.add_argument("--members", type=int, default=6)
+    parser.add_argument("--expenses", type=int, default=50)
+    parser.add_argument("--items", type=int, default=20, help="line items per expense")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
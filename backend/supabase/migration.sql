@@ -252,3 +252,1063 @@ CREATE POLICY "Involved users can update settlements" ON public.settlements
     FOR UPDATE USING (
         from_user_id = auth.uid() OR to_user_id = auth.uid()
     );
+
+-- ============================================
+-- 10. Idempotency keys
+-- ============================================
+-- Claimed by inserting the row (the primary key makes claims atomic); the
+-- stored response is replayed for retries until expires_at. Only the
+-- service role touches this table, so RLS is enabled with no policies.
+CREATE TABLE IF NOT EXISTS public.idempotency_keys (
+    id TEXT PRIMARY KEY,
+    request_hash TEXT NOT NULL DEFAULT '',
+    status_code INTEGER,
+    response JSONB,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON public.idempotency_keys(expires_at);
+
+ALTER TABLE public.idempotency_keys ENABLE ROW LEVEL SECURITY;
+
+-- Expired keys are taken over lazily; purge the rest periodically, e.g. with pg_cron:
+-- SELECT cron.schedule('purge-idempotency-keys', '0 * * * *',
+--     $$DELETE FROM public.idempotency_keys WHERE expires_at < NOW()$$);
+
+-- ============================================
+-- 11. Expense versions
+-- ============================================
+-- Every edit bumps expenses.version (conditioned on the old value, so
+-- concurrent edits conflict instead of interleaving). Settlements record the
+-- version they were generated from; older ones are stale.
+-- settlements_version is the version settlements were last generated for.
+-- It is NULL until then. An expense that needs no transfers has no
+-- settlements, so the row count can't tell whether they were generated.
+ALTER TABLE public.expenses ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE public.settlements ADD COLUMN IF NOT EXISTS expense_version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE public.expenses ADD COLUMN IF NOT EXISTS settlements_version INTEGER;
+
+-- ============================================
+-- 12. Settle up
+-- ============================================
+-- Pays every unpaid settlement between two users (optionally within one
+-- group) and marks expenses with nothing left unpaid as settled, in one
+-- statement. The API checks the caller is one of the two users, so only the
+-- service role may call it.
+CREATE INDEX IF NOT EXISTS idx_settlements_unpaid_pair
+    ON public.settlements(from_user_id, to_user_id) WHERE NOT is_paid;
+
+CREATE OR REPLACE FUNCTION public.settle_up(
+    p_user_a UUID,
+    p_user_b UUID,
+    p_group_id UUID DEFAULT NULL
+)
+RETURNS SETOF public.settlements
+LANGUAGE sql
+AS $$
+    WITH paid AS (
+        UPDATE public.settlements s
+        SET is_paid = TRUE
+        FROM public.expenses e
+        WHERE e.id = s.expense_id
+          AND NOT s.is_paid
+          AND ((s.from_user_id = p_user_a AND s.to_user_id = p_user_b)
+            OR (s.from_user_id = p_user_b AND s.to_user_id = p_user_a))
+          AND (p_group_id IS NULL OR e.group_id = p_group_id)
+        RETURNING s.*
+    ), settled AS (
+        -- CTEs share one snapshot, so rows paid above still read as unpaid here
+        UPDATE public.expenses e
+        SET status = 'settled'
+        WHERE e.id IN (SELECT expense_id FROM paid)
+          AND NOT EXISTS (
+              SELECT 1 FROM public.settlements o
+              WHERE o.expense_id = e.id
+                AND NOT o.is_paid
+                AND o.id NOT IN (SELECT id FROM paid)
+          )
+    )
+    SELECT * FROM paid;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.settle_up(UUID, UUID, UUID) FROM PUBLIC, anon, authenticated;
+
+-- ============================================
+-- 13. Group summaries
+-- ============================================
+-- Home-screen totals kept up to date by triggers, so listing groups reads
+-- one row per group instead of scanning each group's history:
+--   group_summaries          expense count, total spent, unpaid settlements
+--   group_members.net_balance unpaid settlements owed to (+) / by (-) the member
+CREATE TABLE IF NOT EXISTS public.group_summaries (
+    group_id UUID PRIMARY KEY REFERENCES public.groups(id) ON DELETE CASCADE,
+    expense_count INTEGER NOT NULL DEFAULT 0,
+    total_spent NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    unpaid_settlement_count INTEGER NOT NULL DEFAULT 0,
+    unpaid_amount NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE public.group_members ADD COLUMN IF NOT EXISTS net_balance NUMERIC(12, 2) NOT NULL DEFAULT 0;
+
+ALTER TABLE public.group_summaries ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Members can read group summaries" ON public.group_summaries
+    FOR SELECT USING (
+        group_id IN (SELECT group_id FROM public.group_members WHERE user_id = auth.uid())
+    );
+
+CREATE OR REPLACE FUNCTION public.groups_summary_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO public.group_summaries (group_id) VALUES (NEW.id)
+    ON CONFLICT (group_id) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS groups_summary ON public.groups;
+CREATE TRIGGER groups_summary
+    AFTER INSERT ON public.groups
+    FOR EACH ROW EXECUTE FUNCTION public.groups_summary_trigger();
+
+CREATE OR REPLACE FUNCTION public.expenses_summary_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Bulk imports skip per-row upkeep and refresh the summary once at the end
+    IF current_setting('snapsplit.skip_summaries', true) = 'on' THEN
+        RETURN COALESCE(NEW, OLD);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE public.group_summaries
+        SET expense_count = expense_count - 1,
+            total_spent = total_spent - OLD.total_amount,
+            updated_at = NOW()
+        WHERE group_id = OLD.group_id;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        -- BEFORE DELETE: take the expense's unpaid settlements out while they
+        -- still exist; once the cascade runs their expense is already gone
+        UPDATE public.group_summaries g
+        SET unpaid_settlement_count = g.unpaid_settlement_count - s.n,
+            unpaid_amount = g.unpaid_amount - s.total,
+            updated_at = NOW()
+        FROM (
+            SELECT COUNT(*) AS n, COALESCE(SUM(amount), 0) AS total
+            FROM public.settlements
+            WHERE expense_id = OLD.id AND NOT is_paid
+        ) s
+        WHERE g.group_id = OLD.group_id AND s.n > 0;
+
+        UPDATE public.group_members m
+        SET net_balance = m.net_balance - d.delta
+        FROM (
+            SELECT user_id, SUM(delta) AS delta
+            FROM public.settlements,
+                LATERAL (VALUES (to_user_id, amount), (from_user_id, -amount)) v(user_id, delta)
+            WHERE expense_id = OLD.id AND NOT is_paid
+            GROUP BY user_id
+        ) d
+        WHERE m.group_id = OLD.group_id AND m.user_id = d.user_id;
+        RETURN OLD;
+    END IF;
+
+    UPDATE public.group_summaries
+    SET expense_count = expense_count + 1,
+        total_spent = total_spent + NEW.total_amount,
+        updated_at = NOW()
+    WHERE group_id = NEW.group_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS expenses_summary ON public.expenses;
+CREATE TRIGGER expenses_summary
+    AFTER INSERT OR UPDATE OF group_id, total_amount ON public.expenses
+    FOR EACH ROW EXECUTE FUNCTION public.expenses_summary_trigger();
+
+DROP TRIGGER IF EXISTS expenses_summary_delete ON public.expenses;
+CREATE TRIGGER expenses_summary_delete
+    BEFORE DELETE ON public.expenses
+    FOR EACH ROW EXECUTE FUNCTION public.expenses_summary_trigger();
+
+-- Applies one unpaid settlement's contribution (sign = 1 to add, -1 to remove)
+CREATE OR REPLACE FUNCTION public.apply_settlement_summary(s public.settlements, sign INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    gid UUID;
+BEGIN
+    IF s.is_paid THEN
+        RETURN;
+    END IF;
+    -- Missing when the settlement is being removed by its expense's cascade
+    SELECT group_id INTO gid FROM public.expenses WHERE id = s.expense_id;
+    IF gid IS NULL THEN
+        RETURN;
+    END IF;
+
+    UPDATE public.group_summaries
+    SET unpaid_settlement_count = unpaid_settlement_count + sign,
+        unpaid_amount = unpaid_amount + sign * s.amount,
+        updated_at = NOW()
+    WHERE group_id = gid;
+
+    UPDATE public.group_members
+    SET net_balance = net_balance + sign * CASE WHEN user_id = s.to_user_id THEN s.amount ELSE -s.amount END
+    WHERE group_id = gid AND user_id IN (s.from_user_id, s.to_user_id);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION public.settlements_summary_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF current_setting('snapsplit.skip_summaries', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM public.apply_settlement_summary(OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM public.apply_settlement_summary(NEW, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS settlements_summary ON public.settlements;
+CREATE TRIGGER settlements_summary
+    AFTER INSERT OR DELETE OR UPDATE OF is_paid, amount, from_user_id, to_user_id ON public.settlements
+    FOR EACH ROW EXECUTE FUNCTION public.settlements_summary_trigger();
+
+REVOKE EXECUTE ON FUNCTION public.apply_settlement_summary(public.settlements, INTEGER) FROM PUBLIC, anon, authenticated;
+
+-- Recomputes one group's summary and member balances from scratch
+CREATE OR REPLACE FUNCTION public.refresh_group_summary(p_group_id UUID)
+RETURNS VOID AS $$
+    INSERT INTO public.group_summaries AS g
+        (group_id, expense_count, total_spent, unpaid_settlement_count, unpaid_amount)
+    SELECT
+        p_group_id,
+        (SELECT COUNT(*) FROM public.expenses e WHERE e.group_id = p_group_id),
+        (SELECT COALESCE(SUM(e.total_amount), 0) FROM public.expenses e WHERE e.group_id = p_group_id),
+        COUNT(s.id),
+        COALESCE(SUM(s.amount), 0)
+    FROM public.settlements s
+    JOIN public.expenses e ON e.id = s.expense_id
+    WHERE e.group_id = p_group_id AND NOT s.is_paid
+    ON CONFLICT (group_id) DO UPDATE SET
+        expense_count = EXCLUDED.expense_count,
+        total_spent = EXCLUDED.total_spent,
+        unpaid_settlement_count = EXCLUDED.unpaid_settlement_count,
+        unpaid_amount = EXCLUDED.unpaid_amount,
+        updated_at = NOW();
+
+    UPDATE public.group_members m
+    SET net_balance = COALESCE((
+        SELECT SUM(CASE WHEN s.to_user_id = m.user_id THEN s.amount ELSE -s.amount END)
+        FROM public.settlements s JOIN public.expenses e ON e.id = s.expense_id
+        WHERE e.group_id = m.group_id
+          AND NOT s.is_paid
+          AND m.user_id IN (s.from_user_id, s.to_user_id)
+    ), 0)
+    WHERE m.group_id = p_group_id;
+$$ LANGUAGE sql SECURITY DEFINER SET search_path = public;
+
+REVOKE EXECUTE ON FUNCTION public.refresh_group_summary(UUID) FROM PUBLIC, anon, authenticated;
+
+-- Backfill for databases that already have data
+SELECT public.refresh_group_summary(id) FROM public.groups;
+
+-- ============================================
+-- 14. User search
+-- ============================================
+-- Autocomplete for adding members. Trigram GIN indexes serve both the
+-- prefix LIKE and the fuzzy % match, even though the pattern is only known
+-- at run time (a btree prefix index would need a constant pattern).
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_users_display_name_trgm
+    ON public.users USING gin (lower(display_name) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_email_trgm
+    ON public.users USING gin (lower(email) gin_trgm_ops);
+
+-- Prefix matches on name or email rank 1; otherwise names rank by
+-- similarity (queries of 3+ characters, above pg_trgm.similarity_threshold).
+-- Keyset-paginated on (rank DESC, lower(display_name), id): pass the last
+-- row of a page as p_after_*.
+CREATE OR REPLACE FUNCTION public.search_users(
+    p_query TEXT,
+    p_limit INTEGER DEFAULT 20,
+    p_after_rank REAL DEFAULT NULL,
+    p_after_name TEXT DEFAULT NULL,
+    p_after_id UUID DEFAULT NULL
+)
+RETURNS TABLE (id UUID, display_name TEXT, avatar_url TEXT, rank REAL)
+LANGUAGE sql STABLE
+AS $$
+    WITH q AS (
+        SELECT
+            lower(p_query) AS term,
+            replace(replace(replace(lower(p_query), '\', '\\'), '%', '\%'), '_', '\_') || '%' AS prefix
+    ), hits AS (
+        SELECT
+            u.id,
+            u.display_name,
+            u.avatar_url,
+            lower(u.display_name) AS sort_name,
+            CASE
+                WHEN lower(u.display_name) LIKE q.prefix OR lower(u.email) LIKE q.prefix THEN 1.0
+                ELSE similarity(lower(u.display_name), q.term)
+            END::REAL AS rank
+        FROM public.users u, q
+        WHERE lower(u.display_name) LIKE q.prefix
+           OR lower(u.email) LIKE q.prefix
+           OR (length(q.term) >= 3 AND lower(u.display_name) % q.term)
+    )
+    SELECT h.id, h.display_name, h.avatar_url, h.rank
+    FROM hits h
+    WHERE p_after_rank IS NULL
+       OR h.rank < p_after_rank
+       OR (h.rank = p_after_rank AND (h.sort_name, h.id) > (p_after_name, p_after_id))
+    ORDER BY h.rank DESC, h.sort_name, h.id
+    LIMIT p_limit;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.search_users(TEXT, INTEGER, REAL, TEXT, UUID) FROM PUBLIC, anon;
+
+-- ============================================
+-- 15. Ledger export
+-- ============================================
+-- GET /api/groups/{id}/export pages through a group's expenses by
+-- (created_at, id); this index makes each page a range scan.
+CREATE INDEX IF NOT EXISTS idx_expenses_group_created
+    ON public.expenses(group_id, created_at, id);
+
+-- ============================================
+-- 16. Bulk import
+-- ============================================
+-- Writes one chunk of imported expenses in a single transaction. The API
+-- validates rows and assigns ids, so each table is one set-based insert.
+-- Summary triggers are switched off for the transaction; the API calls
+-- refresh_group_summary once when the whole import is done.
+CREATE OR REPLACE FUNCTION public.import_expenses(
+    p_expenses JSONB,
+    p_items JSONB,
+    p_assignments JSONB,
+    p_settlements JSONB
+)
+RETURNS INTEGER AS $$
+BEGIN
+    PERFORM set_config('snapsplit.skip_summaries', 'on', true);
+
+    INSERT INTO public.expenses
+        (id, group_id, created_by, description, total_amount, tax_amount, tip_amount,
+         receipt_image_url, receipt_image_key, status, created_at, settlements_version)
+    SELECT id, group_id, created_by, COALESCE(description, ''), total_amount,
+        COALESCE(tax_amount, 0), COALESCE(tip_amount, 0), receipt_image_url, receipt_image_key,
+        COALESCE(status, 'pending'), COALESCE(created_at, NOW()), settlements_version
+    FROM jsonb_populate_recordset(NULL::public.expenses, p_expenses);
+
+    INSERT INTO public.receipt_items (id, expense_id, item_name, quantity, unit_price, total_price)
+    SELECT id, expense_id, item_name, COALESCE(quantity, 1), COALESCE(unit_price, 0), COALESCE(total_price, 0)
+    FROM jsonb_populate_recordset(NULL::public.receipt_items, p_items);
+
+    INSERT INTO public.item_assignments (receipt_item_id, user_id)
+    SELECT receipt_item_id, user_id
+    FROM jsonb_populate_recordset(NULL::public.item_assignments, p_assignments);
+
+    INSERT INTO public.settlements (expense_id, from_user_id, to_user_id, amount, is_paid)
+    SELECT expense_id, from_user_id, to_user_id, amount, COALESCE(is_paid, FALSE)
+    FROM jsonb_populate_recordset(NULL::public.settlements, p_settlements);
+
+    PERFORM set_config('snapsplit.skip_summaries', 'off', true);
+    RETURN jsonb_array_length(p_expenses);
+END;
+$$ LANGUAGE plpgsql SET search_path = public;
+
+REVOKE EXECUTE ON FUNCTION public.import_expenses(JSONB, JSONB, JSONB, JSONB) FROM PUBLIC, anon, authenticated;
+
+-- ============================================
+-- 17. Receipt image storage
+-- ============================================
+-- Clients upload receipt images straight to the private "receipts" bucket
+-- with signed URLs; the API refers to them by key. Thumbnails for the
+-- expense list go to a public bucket.
+
+ALTER TABLE public.expenses
+    ADD COLUMN IF NOT EXISTS receipt_image_key TEXT,
+    ADD COLUMN IF NOT EXISTS receipt_thumbnail_url TEXT;
+
+INSERT INTO storage.buckets (id, name, public, file_size_limit, allowed_mime_types)
+VALUES
+    ('receipts', 'receipts', false, 10485760,
+     ARRAY['image/jpeg', 'image/png', 'image/webp', 'image/heic']),
+    ('receipt-thumbnails', 'receipt-thumbnails', true, 1048576, ARRAY['image/jpeg'])
+ON CONFLICT (id) DO NOTHING;
+
+-- ============================================
+-- 18. Personal balances
+-- ============================================
+-- What one user owes and is owed across all their groups, per group and
+-- counterparty, in one query. Unpaid settlements are used where they match
+-- the expense's current version. Expenses whose settlements are missing or
+-- stale haven't been (re)generated yet, because that happens lazily on
+-- read. For those, each assignee owes the payer their share, computed here
+-- like splitter.calculate_shares, net of amounts already paid between the
+-- two. The user's other groups come back as rows with a NULL counterparty,
+-- so callers know every group the result covers.
+CREATE INDEX IF NOT EXISTS idx_settlements_unpaid_to
+    ON public.settlements(to_user_id) WHERE NOT is_paid;
+
+CREATE OR REPLACE FUNCTION public.user_balances(p_user_id UUID)
+RETURNS TABLE (
+    group_id UUID,
+    group_name TEXT,
+    counterparty_id UUID,
+    counterparty_name TEXT,
+    amount NUMERIC
+)
+LANGUAGE sql STABLE
+AS $$
+    WITH my_groups AS (
+        SELECT g.id, g.name
+        FROM public.group_members gm
+        JOIN public.groups g ON g.id = gm.group_id
+        WHERE gm.user_id = p_user_id
+    ), current_debts AS (
+        SELECT e.group_id, s.from_user_id, s.to_user_id, s.amount
+        FROM public.settlements s
+        JOIN public.expenses e ON e.id = s.expense_id
+        WHERE NOT s.is_paid
+          AND (s.from_user_id = p_user_id OR s.to_user_id = p_user_id)
+          AND s.expense_version = e.version
+          AND e.group_id IN (SELECT id FROM my_groups)
+    ), pending AS (
+        SELECT e.*
+        FROM public.expenses e
+        WHERE e.group_id IN (SELECT id FROM my_groups)
+          AND NOT EXISTS (
+              SELECT 1 FROM public.settlements s
+              WHERE s.expense_id = e.id AND s.expense_version = e.version
+          )
+    ), base_shares AS (
+        SELECT ri.expense_id, ia.user_id, SUM(ri.total_price / n.assignees) AS base
+        FROM pending e
+        JOIN public.receipt_items ri ON ri.expense_id = e.id
+        JOIN public.item_assignments ia ON ia.receipt_item_id = ri.id
+        JOIN LATERAL (
+            SELECT COUNT(*) AS assignees
+            FROM public.item_assignments x
+            WHERE x.receipt_item_id = ri.id
+        ) n ON true
+        GROUP BY ri.expense_id, ia.user_id
+    ), shares AS (
+        SELECT
+            b.expense_id,
+            b.user_id,
+            round(
+                b.base + COALESCE(
+                    b.base / NULLIF(SUM(b.base) OVER (PARTITION BY b.expense_id), 0), 0
+                ) * (e.tax_amount + e.tip_amount),
+                2
+            ) AS total
+        FROM base_shares b
+        JOIN pending e ON e.id = b.expense_id
+    ), pending_debts AS (
+        SELECT
+            e.group_id,
+            sh.user_id AS from_user_id,
+            e.created_by AS to_user_id,
+            sh.total - COALESCE((
+                SELECT SUM(CASE WHEN s.from_user_id = sh.user_id THEN s.amount ELSE -s.amount END)
+                FROM public.settlements s
+                WHERE s.expense_id = e.id
+                  AND s.is_paid
+                  AND ARRAY[s.from_user_id, s.to_user_id] <@ ARRAY[sh.user_id, e.created_by]
+            ), 0) AS amount
+        FROM shares sh
+        JOIN pending e ON e.id = sh.expense_id
+        WHERE sh.user_id <> e.created_by
+          AND p_user_id IN (sh.user_id, e.created_by)
+    ), debts AS (
+        SELECT * FROM current_debts
+        UNION ALL
+        SELECT * FROM pending_debts
+    ), pairs AS (
+        SELECT
+            d.group_id,
+            CASE WHEN d.from_user_id = p_user_id THEN d.to_user_id ELSE d.from_user_id END
+                AS counterparty_id,
+            SUM(CASE WHEN d.to_user_id = p_user_id THEN d.amount ELSE -d.amount END) AS amount
+        FROM debts d
+        GROUP BY 1, 2
+        HAVING abs(SUM(CASE WHEN d.to_user_id = p_user_id THEN d.amount ELSE -d.amount END)) >= 0.01
+    )
+    SELECT g.id, g.name, p.counterparty_id, u.display_name, COALESCE(p.amount, 0)
+    FROM my_groups g
+    LEFT JOIN pairs p ON p.group_id = g.id
+    LEFT JOIN public.users u ON u.id = p.counterparty_id;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.user_balances(UUID) FROM PUBLIC, anon, authenticated;
+
+-- ============================================
+-- 19. RLS membership helpers
+-- ============================================
+-- The policies in section 9 nest IN (SELECT ...) subqueries, three levels
+-- deep for item_assignments, and group_members' policy reads group_members
+-- under its own RLS. The helpers below are SECURITY DEFINER so they can read
+-- group_members without going through RLS again (that self-reference made
+-- the old group_members policy recurse).
+--
+-- Read policies match rows against the caller's groups, expenses or items,
+-- e.g. group_id = ANY (ARRAY(SELECT public.my_group_ids())). The array is
+-- built once per statement as an InitPlan, and the ANY condition can use the
+-- foreign-key indexes from section 8. That way a read costs about as much as
+-- the caller's own rows, whatever the size of the table. Two other forms
+-- were slower than the old policies at 1000 groups:
+--   * A scalar helper such as is_group_member(group_id) runs its own query
+--     for every row, because SECURITY DEFINER functions are never inlined.
+--   * IN (SELECT ...) turns into a hashed filter over a sequential scan.
+-- Write checks only look at the rows being written, so they keep the scalar
+-- helpers. Policies apply TO authenticated, so anon requests skip them.
+-- auth.uid() is wrapped in a sub-select so it is evaluated once per
+-- statement instead of once per row.
+-- scripts/bench_rls.py compares the old and new policies with EXPLAIN ANALYZE.
+CREATE OR REPLACE FUNCTION public.my_group_ids()
+RETURNS SETOF UUID
+LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public
+AS $$
+    SELECT group_id FROM public.group_members WHERE user_id = auth.uid();
+$$;
+
+CREATE OR REPLACE FUNCTION public.my_expense_ids()
+RETURNS SETOF UUID
+LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public
+AS $$
+    SELECT e.id
+    FROM public.group_members gm
+    JOIN public.expenses e ON e.group_id = gm.group_id
+    WHERE gm.user_id = auth.uid();
+$$;
+
+CREATE OR REPLACE FUNCTION public.my_receipt_item_ids()
+RETURNS SETOF UUID
+LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public
+AS $$
+    SELECT ri.id
+    FROM public.group_members gm
+    JOIN public.expenses e ON e.group_id = gm.group_id
+    JOIN public.receipt_items ri ON ri.expense_id = e.id
+    WHERE gm.user_id = auth.uid();
+$$;
+
+CREATE OR REPLACE FUNCTION public.is_group_member(p_group_id UUID)
+RETURNS BOOLEAN
+LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public
+AS $$
+    SELECT EXISTS (
+        SELECT 1 FROM public.group_members
+        WHERE group_id = p_group_id AND user_id = auth.uid()
+    );
+$$;
+
+CREATE OR REPLACE FUNCTION public.is_group_admin(p_group_id UUID)
+RETURNS BOOLEAN
+LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public
+AS $$
+    SELECT EXISTS (
+        SELECT 1 FROM public.group_members
+        WHERE group_id = p_group_id AND user_id = auth.uid() AND role = 'admin'
+    );
+$$;
+
+CREATE OR REPLACE FUNCTION public.is_expense_member(p_expense_id UUID)
+RETURNS BOOLEAN
+LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public
+AS $$
+    SELECT EXISTS (
+        SELECT 1
+        FROM public.expenses e
+        JOIN public.group_members gm ON gm.group_id = e.group_id
+        WHERE e.id = p_expense_id AND gm.user_id = auth.uid()
+    );
+$$;
+
+CREATE OR REPLACE FUNCTION public.is_receipt_item_member(p_item_id UUID)
+RETURNS BOOLEAN
+LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public
+AS $$
+    SELECT EXISTS (
+        SELECT 1
+        FROM public.receipt_items ri
+        JOIN public.expenses e ON e.id = ri.expense_id
+        JOIN public.group_members gm ON gm.group_id = e.group_id
+        WHERE ri.id = p_item_id AND gm.user_id = auth.uid()
+    );
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.my_group_ids() FROM PUBLIC, anon;
+REVOKE EXECUTE ON FUNCTION public.my_expense_ids() FROM PUBLIC, anon;
+REVOKE EXECUTE ON FUNCTION public.my_receipt_item_ids() FROM PUBLIC, anon;
+REVOKE EXECUTE ON FUNCTION public.is_group_member(UUID) FROM PUBLIC, anon;
+REVOKE EXECUTE ON FUNCTION public.is_group_admin(UUID) FROM PUBLIC, anon;
+REVOKE EXECUTE ON FUNCTION public.is_expense_member(UUID) FROM PUBLIC, anon;
+REVOKE EXECUTE ON FUNCTION public.is_receipt_item_member(UUID) FROM PUBLIC, anon;
+GRANT EXECUTE ON FUNCTION public.my_group_ids() TO authenticated;
+GRANT EXECUTE ON FUNCTION public.my_expense_ids() TO authenticated;
+GRANT EXECUTE ON FUNCTION public.my_receipt_item_ids() TO authenticated;
+GRANT EXECUTE ON FUNCTION public.is_group_member(UUID) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.is_group_admin(UUID) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.is_expense_member(UUID) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.is_receipt_item_member(UUID) TO authenticated;
+
+-- The (group_id, user_id) unique index serves the group lookups. These let
+-- the write checks walk item -> expense -> group from the index alone, and
+-- serve the "involved in" settlement policies from either side.
+CREATE INDEX IF NOT EXISTS idx_expenses_id_group ON public.expenses(id) INCLUDE (group_id);
+CREATE INDEX IF NOT EXISTS idx_receipt_items_id_expense
+    ON public.receipt_items(id) INCLUDE (expense_id);
+CREATE INDEX IF NOT EXISTS idx_settlements_from_user ON public.settlements(from_user_id);
+CREATE INDEX IF NOT EXISTS idx_settlements_to_user ON public.settlements(to_user_id);
+
+DROP POLICY IF EXISTS "Members can read their groups" ON public.groups;
+CREATE POLICY "Members can read their groups" ON public.groups
+    FOR SELECT TO authenticated USING (id = ANY (ARRAY(SELECT public.my_group_ids())));
+
+DROP POLICY IF EXISTS "Authenticated users can create groups" ON public.groups;
+CREATE POLICY "Authenticated users can create groups" ON public.groups
+    FOR INSERT TO authenticated WITH CHECK ((SELECT auth.uid()) = created_by);
+
+DROP POLICY IF EXISTS "Members can see group members" ON public.group_members;
+CREATE POLICY "Members can see group members" ON public.group_members
+    FOR SELECT TO authenticated USING (group_id = ANY (ARRAY(SELECT public.my_group_ids())));
+
+DROP POLICY IF EXISTS "Admins can insert group members" ON public.group_members;
+CREATE POLICY "Admins can insert group members" ON public.group_members
+    FOR INSERT TO authenticated WITH CHECK (
+        user_id = (SELECT auth.uid())  -- Users can add themselves (for accepting invites)
+        OR public.is_group_admin(group_id)
+    );
+
+DROP POLICY IF EXISTS "Admins can delete group members" ON public.group_members;
+CREATE POLICY "Admins can delete group members" ON public.group_members
+    FOR DELETE TO authenticated USING (
+        user_id = (SELECT auth.uid())  -- Users can remove themselves
+        OR public.is_group_admin(group_id)
+    );
+
+DROP POLICY IF EXISTS "Group members can read expenses" ON public.expenses;
+CREATE POLICY "Group members can read expenses" ON public.expenses
+    FOR SELECT TO authenticated USING (group_id = ANY (ARRAY(SELECT public.my_group_ids())));
+
+DROP POLICY IF EXISTS "Group members can create expenses" ON public.expenses;
+CREATE POLICY "Group members can create expenses" ON public.expenses
+    FOR INSERT TO authenticated WITH CHECK (public.is_group_member(group_id));
+
+DROP POLICY IF EXISTS "Group members can read receipt items" ON public.receipt_items;
+CREATE POLICY "Group members can read receipt items" ON public.receipt_items
+    FOR SELECT TO authenticated USING (expense_id = ANY (ARRAY(SELECT public.my_expense_ids())));
+
+DROP POLICY IF EXISTS "Group members can create receipt items" ON public.receipt_items;
+CREATE POLICY "Group members can create receipt items" ON public.receipt_items
+    FOR INSERT TO authenticated WITH CHECK (public.is_expense_member(expense_id));
+
+DROP POLICY IF EXISTS "Group members can read assignments" ON public.item_assignments;
+CREATE POLICY "Group members can read assignments" ON public.item_assignments
+    FOR SELECT TO authenticated USING (
+        receipt_item_id = ANY (ARRAY(SELECT public.my_receipt_item_ids()))
+    );
+
+DROP POLICY IF EXISTS "Group members can create assignments" ON public.item_assignments;
+CREATE POLICY "Group members can create assignments" ON public.item_assignments
+    FOR INSERT TO authenticated WITH CHECK (public.is_receipt_item_member(receipt_item_id));
+
+DROP POLICY IF EXISTS "Group members can delete assignments" ON public.item_assignments;
+CREATE POLICY "Group members can delete assignments" ON public.item_assignments
+    FOR DELETE TO authenticated USING (
+        receipt_item_id = ANY (ARRAY(SELECT public.my_receipt_item_ids()))
+    );
+
+DROP POLICY IF EXISTS "Involved users can read settlements" ON public.settlements;
+CREATE POLICY "Involved users can read settlements" ON public.settlements
+    FOR SELECT TO authenticated USING (
+        from_user_id = (SELECT auth.uid()) OR to_user_id = (SELECT auth.uid())
+    );
+
+DROP POLICY IF EXISTS "Group members can create settlements" ON public.settlements;
+CREATE POLICY "Group members can create settlements" ON public.settlements
+    FOR INSERT TO authenticated WITH CHECK (public.is_expense_member(expense_id));
+
+DROP POLICY IF EXISTS "Involved users can update settlements" ON public.settlements;
+CREATE POLICY "Involved users can update settlements" ON public.settlements
+    FOR UPDATE TO authenticated USING (
+        from_user_id = (SELECT auth.uid()) OR to_user_id = (SELECT auth.uid())
+    );
+
+DROP POLICY IF EXISTS "Members can read group summaries" ON public.group_summaries;
+CREATE POLICY "Members can read group summaries" ON public.group_summaries
+    FOR SELECT TO authenticated USING (group_id = ANY (ARRAY(SELECT public.my_group_ids())));
+
+-- ============================================
+-- 20. Settlement generation
+-- ============================================
+-- Regenerates an expense's settlements for its current version in one call.
+-- This does what the API used to do over several round trips. It takes a
+-- per-expense advisory lock, so concurrent readers wait for the first one
+-- and then return its rows instead of inserting duplicates. Unpaid rows are
+-- replaced. Paid rows are kept, restamped and netted out of the new debts.
+--
+-- The result must match splitter.calculate_shares and
+-- debt_simplifier.simplify_debts to the cent, so the arithmetic copies
+-- Python's. It is done in double precision, in the same order, and
+-- round_float_2 rounds the way Python's round(x, 2) does: half to even, on
+-- the float's exact binary value. Items and assignments are taken in
+-- (created_at, id) order. tests/test_settlement_generation.py holds the
+-- parity suite.
+CREATE OR REPLACE FUNCTION public.round_float_2(x DOUBLE PRECISION)
+RETURNS DOUBLE PRECISION
+LANGUAGE plpgsql IMMUTABLE STRICT
+AS $$
+DECLARE
+    shift INTEGER;
+    d NUMERIC;
+    n NUMERIC;
+    q NUMERIC;
+    r NUMERIC;
+BEGIN
+    IF abs(x) < 0.004 THEN
+        RETURN 0 * x;  -- Keeps the sign of zero, like Python
+    END IF;
+    IF abs(x) >= 4503599627370496 THEN  -- 2^52: already a whole number
+        RETURN x;
+    END IF;
+    -- Scaling by 2^shift leaves a whole number with every mantissa bit kept,
+    -- so n / d is exactly x * 100. Then round that half to even.
+    shift := least(62, 54 - floor(log(2, abs(x)::NUMERIC))::INTEGER);
+    d := (1::BIGINT << shift)::NUMERIC;
+    n := abs((x * (1::BIGINT << shift)::DOUBLE PRECISION)::BIGINT)::NUMERIC * 100;
+    q := div(n, d);
+    r := n - q * d;
+    IF 2 * r > d OR (2 * r = d AND mod(q, 2) = 1) THEN
+        q := q + 1;
+    END IF;
+    RETURN sign(x) * (q / 100)::DOUBLE PRECISION;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.generate_settlements(p_expense_id UUID, p_user_id UUID)
+RETURNS SETOF public.settlements
+LANGUAGE plpgsql
+SECURITY DEFINER SET search_path = public
+AS $$
+DECLARE
+    e public.expenses;
+    created public.settlements;
+    item RECORD;
+    kept RECORD;
+    assignees UUID[];
+    uid UUID;
+    per_person DOUBLE PRECISION;
+    total_base DOUBLE PRECISION := 0;
+    proportion DOUBLE PRECISION;
+    share_users UUID[] := '{}';
+    base DOUBLE PRECISION[] := '{}';
+    bal_users UUID[] := '{}';
+    bal DOUBLE PRECISION[] := '{}';
+    debtors UUID[];
+    debts DOUBLE PRECISION[];
+    creditors UUID[];
+    credits DOUBLE PRECISION[];
+    transfer DOUBLE PRECISION;
+    i INTEGER;
+    j INTEGER;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtextextended('settlements:' || p_expense_id::TEXT, 0));
+
+    SELECT * INTO e FROM public.expenses WHERE id = p_expense_id;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Expense not found' USING ERRCODE = 'P0002';
+    END IF;
+    IF NOT EXISTS (
+        SELECT 1 FROM public.group_members WHERE group_id = e.group_id AND user_id = p_user_id
+    ) THEN
+        RAISE EXCEPTION 'Not a member of this group' USING ERRCODE = '42501';
+    END IF;
+
+    -- Whoever held the lock before us may have just generated them
+    IF e.settlements_version = e.version THEN
+        RETURN QUERY SELECT * FROM public.settlements WHERE expense_id = e.id
+            ORDER BY created_at, id;
+        RETURN;
+    END IF;
+
+    -- calculate_shares: base share per user, in first-seen order
+    FOR item IN
+        SELECT id, total_price FROM public.receipt_items
+        WHERE expense_id = e.id ORDER BY created_at, id
+    LOOP
+        SELECT array_agg(user_id ORDER BY created_at, id) INTO assignees
+        FROM public.item_assignments WHERE receipt_item_id = item.id;
+        CONTINUE WHEN assignees IS NULL;
+        per_person := item.total_price::DOUBLE PRECISION / cardinality(assignees);
+        FOREACH uid IN ARRAY assignees LOOP
+            i := array_position(share_users, uid);
+            IF i IS NULL THEN
+                share_users := share_users || uid;
+                base := base || 0::DOUBLE PRECISION;
+                i := cardinality(share_users);
+            END IF;
+            base[i] := base[i] + per_person;
+        END LOOP;
+    END LOOP;
+    FOR i IN 1..cardinality(share_users) LOOP
+        total_base := total_base + base[i];
+    END LOOP;
+
+    -- calculate_balances: everyone owes their share, the payer is owed the total
+    FOR i IN 1..cardinality(share_users) LOOP
+        proportion := CASE WHEN total_base > 0 THEN base[i] / total_base ELSE 0 END;
+        bal_users := bal_users || share_users[i];
+        bal := bal || (0 - public.round_float_2(
+            base[i]
+            + e.tax_amount::DOUBLE PRECISION * proportion
+            + e.tip_amount::DOUBLE PRECISION * proportion
+        ));
+    END LOOP;
+    i := array_position(bal_users, e.created_by);
+    IF i IS NULL THEN
+        bal_users := bal_users || e.created_by;
+        bal := bal || 0::DOUBLE PRECISION;
+        i := cardinality(bal_users);
+    END IF;
+    bal[i] := bal[i] + e.total_amount::DOUBLE PRECISION;
+
+    -- Paid rows survive; what they moved is netted out of the new debts
+    DELETE FROM public.settlements WHERE expense_id = e.id AND NOT is_paid;
+    UPDATE public.settlements SET expense_version = e.version WHERE expense_id = e.id;
+    FOR kept IN
+        SELECT from_user_id, to_user_id, amount FROM public.settlements
+        WHERE expense_id = e.id ORDER BY created_at, id
+    LOOP
+        FOREACH uid IN ARRAY ARRAY[kept.from_user_id, kept.to_user_id] LOOP
+            IF array_position(bal_users, uid) IS NULL THEN
+                bal_users := bal_users || uid;
+                bal := bal || 0::DOUBLE PRECISION;
+            END IF;
+        END LOOP;
+        i := array_position(bal_users, kept.from_user_id);
+        bal[i] := bal[i] + kept.amount::DOUBLE PRECISION;
+        i := array_position(bal_users, kept.to_user_id);
+        bal[i] := bal[i] - kept.amount::DOUBLE PRECISION;
+    END LOOP;
+
+    -- simplify_debts: largest debtor pays largest creditor; ties keep their order
+    SELECT array_agg(u ORDER BY -b DESC, n), array_agg(-b ORDER BY -b DESC, n)
+    INTO debtors, debts
+    FROM unnest(bal_users, bal) WITH ORDINALITY AS t(u, b, n) WHERE b < -0.01;
+    SELECT array_agg(u ORDER BY b DESC, n), array_agg(b ORDER BY b DESC, n)
+    INTO creditors, credits
+    FROM unnest(bal_users, bal) WITH ORDINALITY AS t(u, b, n) WHERE b > 0.01;
+
+    RETURN QUERY SELECT * FROM public.settlements WHERE expense_id = e.id
+        ORDER BY created_at, id;
+
+    i := 1;
+    j := 1;
+    WHILE i <= coalesce(cardinality(debtors), 0) AND j <= coalesce(cardinality(credits), 0) LOOP
+        transfer := public.round_float_2(least(debts[i], credits[j]));
+        IF transfer > 0.01 THEN
+            INSERT INTO public.settlements
+                (expense_id, from_user_id, to_user_id, amount, is_paid, expense_version)
+            VALUES (e.id, debtors[i], creditors[j], transfer, false, e.version)
+            RETURNING * INTO created;
+            RETURN NEXT created;
+        END IF;
+        debts[i] := public.round_float_2(debts[i] - transfer);
+        credits[j] := public.round_float_2(credits[j] - transfer);
+        IF debts[i] < 0.01 THEN
+            i := i + 1;
+        END IF;
+        IF credits[j] < 0.01 THEN
+            j := j + 1;
+        END IF;
+    END LOOP;
+
+    -- New debts move a settled expense back to pending
+    UPDATE public.expenses
+    SET settlements_version = e.version,
+        status = CASE WHEN created.id IS NOT NULL THEN 'pending' ELSE status END
+    WHERE id = e.id;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.generate_settlements(UUID, UUID) FROM PUBLIC, anon, authenticated;
+
+-- ============================================
+-- 21. Expense updates
+-- ============================================
+-- Applies one PATCH /api/expenses/{id} in a single transaction. The API
+-- reads the expense and its items, works out which rows differ, and sends
+-- only those. New items come with ids assigned by the API, so their
+-- assignments can be inserted in the same call. The version bump runs
+-- first and is conditioned on the version the diff was computed from. If
+-- another edit got there first, it raises 40001 and nothing is written.
+-- Each table is then one set-based statement. The settlements are then
+-- regenerated for the new version, as p_user_id, so the group summaries
+-- never count the old version's unpaid rows.
+CREATE OR REPLACE FUNCTION public.apply_expense_update(
+    p_expense_id UUID,
+    p_user_id UUID,
+    p_version INTEGER,
+    p_fields JSONB,
+    p_removed_items UUID[],
+    p_updated_items JSONB,
+    p_added_items JSONB,
+    p_assignment_deletes UUID[],
+    p_assignment_inserts JSONB
+)
+RETURNS SETOF public.expenses
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+    e public.expenses;
+BEGIN
+    UPDATE public.expenses
+    SET description = COALESCE(p_fields->>'description', description),
+        total_amount = COALESCE((p_fields->>'total_amount')::NUMERIC, total_amount),
+        tax_amount = COALESCE((p_fields->>'tax_amount')::NUMERIC, tax_amount),
+        tip_amount = COALESCE((p_fields->>'tip_amount')::NUMERIC, tip_amount),
+        version = version + 1
+    WHERE id = p_expense_id AND version = p_version
+    RETURNING * INTO e;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Expense was modified by someone else' USING ERRCODE = '40001';
+    END IF;
+
+    -- Assignments go with removed items via ON DELETE CASCADE
+    DELETE FROM public.receipt_items
+    WHERE id = ANY(p_removed_items) AND expense_id = p_expense_id;
+
+    UPDATE public.receipt_items ri
+    SET item_name = u.item_name,
+        quantity = u.quantity,
+        unit_price = u.unit_price,
+        total_price = u.total_price
+    FROM jsonb_populate_recordset(NULL::public.receipt_items, p_updated_items) u
+    WHERE ri.id = u.id AND ri.expense_id = p_expense_id;
+
+    DELETE FROM public.item_assignments ia
+    USING public.receipt_items ri
+    WHERE ia.id = ANY(p_assignment_deletes)
+      AND ri.id = ia.receipt_item_id
+      AND ri.expense_id = p_expense_id;
+
+    INSERT INTO public.receipt_items (id, expense_id, item_name, quantity, unit_price, total_price)
+    SELECT id, p_expense_id, item_name, COALESCE(quantity, 1), COALESCE(unit_price, 0),
+        COALESCE(total_price, 0)
+    FROM jsonb_populate_recordset(NULL::public.receipt_items, p_added_items);
+
+    INSERT INTO public.item_assignments (receipt_item_id, user_id)
+    SELECT receipt_item_id, user_id
+    FROM jsonb_populate_recordset(NULL::public.item_assignments, p_assignment_inserts);
+
+    -- May move a settled expense back to pending
+    PERFORM public.generate_settlements(p_expense_id, p_user_id);
+    SELECT * INTO e FROM public.expenses WHERE id = p_expense_id;
+    RETURN NEXT e;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.apply_expense_update(UUID, UUID, INTEGER, JSONB, UUID[], JSONB, JSONB, UUID[], JSONB)
+    FROM PUBLIC, anon, authenticated;
+
+-- ============================================
+-- 22. Settlements on write
+-- ============================================
+-- The API generates an expense's settlements when it creates or edits the
+-- expense, so the trigger-maintained summaries (section 13) agree with
+-- user_balances (section 18). Expenses written before that still have no
+-- settlements, or ones for an older version. They are generated here, as
+-- any member of the group, which also takes stale unpaid rows out of the
+-- summaries. Those whose settlements are current are only marked.
+UPDATE public.expenses e
+SET settlements_version = e.version
+WHERE e.settlements_version IS NULL
+  AND EXISTS (
+      SELECT 1 FROM public.settlements s
+      WHERE s.expense_id = e.id AND s.expense_version = e.version
+  )
+  AND NOT EXISTS (
+      SELECT 1 FROM public.settlements s
+      WHERE s.expense_id = e.id AND s.expense_version <> e.version
+  );
+
+SELECT count(g.*)
+FROM public.expenses e
+CROSS JOIN LATERAL (
+    SELECT user_id FROM public.group_members
+    WHERE group_id = e.group_id
+    ORDER BY user_id = e.created_by DESC
+    LIMIT 1
+) m
+CROSS JOIN LATERAL public.generate_settlements(e.id, m.user_id) g
+WHERE e.settlements_version IS DISTINCT FROM e.version;
+
+-- ============================================
+-- 23. Expense creation
+-- ============================================
+-- Writes one POST /api/expenses in a single transaction: the expense, its
+-- items and assignments, its settlements and, with an Idempotency-Key, the
+-- stored response (the new expense row). A failure anywhere writes
+-- nothing, so the API can release the key and let the client retry. Items
+-- come with ids assigned by the API. clock_timestamp() keeps them in
+-- request order for generate_settlements.
+CREATE OR REPLACE FUNCTION public.create_expense(
+    p_user_id UUID,
+    p_expense JSONB,
+    p_items JSONB,
+    p_assignments JSONB,
+    p_idempotency_key TEXT DEFAULT NULL
+)
+RETURNS SETOF public.expenses
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+    e public.expenses;
+BEGIN
+    INSERT INTO public.expenses
+        (group_id, created_by, description, total_amount, tax_amount, tip_amount,
+         receipt_image_url, receipt_image_key, status)
+    SELECT group_id, p_user_id, COALESCE(description, ''), total_amount,
+        COALESCE(tax_amount, 0), COALESCE(tip_amount, 0), receipt_image_url,
+        receipt_image_key, 'pending'
+    FROM jsonb_populate_record(NULL::public.expenses, p_expense)
+    RETURNING * INTO e;
+
+    INSERT INTO public.receipt_items
+        (id, expense_id, item_name, quantity, unit_price, total_price, created_at)
+    SELECT id, e.id, item_name, COALESCE(quantity, 1), COALESCE(unit_price, 0),
+        COALESCE(total_price, 0), clock_timestamp()
+    FROM jsonb_populate_recordset(NULL::public.receipt_items, p_items);
+
+    INSERT INTO public.item_assignments (receipt_item_id, user_id, created_at)
+    SELECT receipt_item_id, user_id, clock_timestamp()
+    FROM jsonb_populate_recordset(NULL::public.item_assignments, p_assignments);
+
+    PERFORM public.generate_settlements(e.id, p_user_id);
+
+    IF p_idempotency_key IS NOT NULL THEN
+        UPDATE public.idempotency_keys
+        SET status_code = 201, response = to_jsonb(e)
+        WHERE id = p_idempotency_key;
+    END IF;
+    RETURN NEXT e;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.create_expense(UUID, JSONB, JSONB, JSONB, TEXT)
+    FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,54 @@
+"""Shared fixtures: run the app against the in-process fake database."""
+import os
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test-anon-key")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test-service-key")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "test-jwt-secret")
+os.environ["DB_BACKEND"] = "fake"
+
+import pytest
+from jose import jwt
+
+from app.config import get_settings
+from app.db.client import get_fake_database
+
+
+@pytest.fixture
+def fake_db():
+    db = get_fake_database()
+    db.reset()
+    yield db
+    db.reset()
+
+
+@pytest.fixture(scope="session")
+def pg_dsn() -> str:
+    """A real Postgres with supabase/migration.sql applied, or skip.
+
+    Point TEST_DATABASE_URL at one, e.g. the ``supabase start`` database.
+    """
+    dsn = os.environ.get("TEST_DATABASE_URL")
+    if not dsn:
+        pytest.skip("TEST_DATABASE_URL not set")
+    pytest.importorskip("psycopg")
+    return dsn
+
+
+@pytest.fixture(scope="session")
+def pg(pg_dsn):
+    """One connection for the session; tests roll back what they write."""
+    import psycopg
+
+    with psycopg.connect(pg_dsn) as conn:
+        yield conn
+
+
+def auth_header(user_id: str) -> dict[str, str]:
+    """Mint a Supabase-style access token for the given user."""
+    token = jwt.encode(
+        {"sub": user_id, "aud": "authenticated"},
+        get_settings().supabase_jwt_secret,
+        algorithm="HS256",
+    )
+    return {"Authorization": f"Bearer {token}"}
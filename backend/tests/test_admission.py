@@ -0,0 +1,208 @@
+"""Tests for scan admission control."""
+import asyncio
+import base64
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+from starlette.requests import Request
+
+from app.config import Settings, get_settings
+from app.main import app
+from app.middleware.rate_limit import client_key, get_scan_rate_limiter
+from app.models.receipt import ParsedReceiptItem
+from app.services.admission import ConcurrencyLimiter, QueueFullError, TokenBucketLimiter
+from app.services.receipt_backends import get_scan_concurrency_limiter
+from app.services.receipt_parser import parse_receipt_image
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket:
+    def test_burst_then_refill(self):
+        clock = FakeClock()
+        limiter = TokenBucketLimiter(rate=1.0, burst=2, clock=clock)
+        assert limiter.acquire("a") == 0
+        assert limiter.acquire("a") == 0
+        assert limiter.acquire("a") == pytest.approx(1.0)
+        assert limiter.acquire("b") == 0  # Buckets are per key
+        clock.now = 1.0
+        assert limiter.acquire("a") == 0
+
+    def test_cost_above_burst_is_refused(self):
+        limiter = TokenBucketLimiter(rate=1.0, burst=2, clock=FakeClock())
+        with pytest.raises(ValueError):
+            limiter.acquire("a", cost=3)
+
+
+class TestConcurrencyLimiter:
+    def test_rejects_past_queue_depth(self):
+        async def scenario():
+            limiter = ConcurrencyLimiter(limit=1, max_queue=1)
+            release = asyncio.Event()
+            order = []
+
+            async def hold(name):
+                async with limiter.slot():
+                    order.append(name)
+                    await release.wait()
+
+            first = asyncio.create_task(hold("first"))
+            second = asyncio.create_task(hold("second"))
+            await asyncio.sleep(0)
+            assert limiter.active == 1 and limiter.queued == 1
+
+            with pytest.raises(QueueFullError) as exc:
+                async with limiter.slot():
+                    pass
+            assert exc.value.retry_after >= 1
+
+            release.set()
+            await asyncio.gather(first, second)
+            assert order == ["first", "second"]
+            assert limiter.active == 0 and limiter.queued == 0
+
+        asyncio.run(scenario())
+
+
+def _request(peer: str, forwarded: str | None = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 50000)})
+
+
+class TestClientKey:
+    def test_forwarded_for_is_ignored_without_trusted_proxies(self):
+        request = _request("198.51.100.9", forwarded="203.0.113.7")
+
+        assert client_key(request) == "ip:198.51.100.9"
+
+    def test_takes_the_hop_our_proxy_appended(self, monkeypatch):
+        monkeypatch.setattr(get_settings(), "trusted_proxies", ["10.0.0.0/8"])
+
+        # The client claimed 1.2.3.4; the edge proxy saw 203.0.113.7
+        spoofed = _request("10.0.0.2", forwarded="1.2.3.4, 203.0.113.7, 10.0.0.5")
+        untrusted_peer = _request("198.51.100.9", forwarded="203.0.113.7")
+
+        assert client_key(spoofed) == "ip:203.0.113.7"
+        assert client_key(untrusted_peer) == "ip:198.51.100.9"
+
+
+class TestUpstreamSlots:
+    def test_every_strip_takes_a_slot(self, monkeypatch):
+        class Backend:
+            name = "fake"
+            in_flight = peak = 0
+
+            async def generate(self, payload, timeout):
+                Backend.in_flight += 1
+                Backend.peak = max(Backend.peak, Backend.in_flight)
+                await asyncio.sleep(0.01)
+                Backend.in_flight -= 1
+                strip = base64.b64decode(payload["contents"][0]["parts"][1]["inline_data"]["data"])
+                return f'[{{"item_name": "Item {strip[-1]}", "total_price": {strip[-1]}}}]'
+
+        monkeypatch.setattr(get_settings(), "scan_max_concurrency", 2)
+        monkeypatch.setattr(
+            "app.services.receipt_parser.split_tall_receipt",
+            lambda *args, **kwargs: [bytes([i]) for i in range(1, 7)],
+        )
+        monkeypatch.setattr("app.services.receipt_parser.get_backends", lambda: [Backend()])
+        get_scan_concurrency_limiter.cache_clear()
+
+        items = asyncio.run(parse_receipt_image(b"tall"))
+
+        assert len(items) == 6
+        assert Backend.peak == 2
+        get_scan_concurrency_limiter.cache_clear()
+
+
+class TestScanEndpoint:
+    def test_rate_limited_with_retry_after(self, monkeypatch):
+        async def fake_parse(image_bytes):
+            return [ParsedReceiptItem(item_name="Tea", total_price=2.5)]
+
+        monkeypatch.setattr("app.routers.receipts.parse_receipt_image", fake_parse)
+        get_scan_rate_limiter.cache_clear()
+        client = TestClient(app)
+        files = {"file": ("r.jpg", b"\xff\xd8", "image/jpeg")}
+
+        burst = get_settings().scan_burst
+
+        statuses = [client.post("/api/receipt/scan", files=files) for _ in range(burst + 1)]
+        assert [r.status_code for r in statuses[:burst]] == [200] * burst
+        assert statuses[burst].status_code == 429
+        assert int(statuses[burst].headers["retry-after"]) >= 1
+        get_scan_rate_limiter.cache_clear()
+
+
+class TestBatchScan:
+    def test_concurrent_with_isolated_failures(self, monkeypatch):
+        async def fake_parse(image_bytes):
+            await asyncio.sleep(0.2)
+            if image_bytes == b"bad":
+                raise ValueError("unreadable")
+            return [ParsedReceiptItem(item_name="Tea", total_price=2.5)]
+
+        monkeypatch.setattr("app.routers.receipts.parse_receipt_image", fake_parse)
+        get_scan_rate_limiter.cache_clear()
+        client = TestClient(app)
+        files = [("files", (f"r{i}.jpg", b"ok", "image/jpeg")) for i in range(4)]
+        files.append(("files", ("bad.jpg", b"bad", "image/jpeg")))
+        files.append(("files", ("notes.txt", b"hi", "text/plain")))
+
+        start = time.perf_counter()
+        response = client.post("/api/receipt/scan/batch", files=files)
+        elapsed = time.perf_counter() - start
+
+        results = response.json()["results"]
+        assert [r["index"] for r in results] == list(range(6))
+        assert all(r["items"] and r["error"] is None for r in results[:4])
+        assert "unreadable" in results[4]["error"]
+        assert results[5]["error"] == "File must be an image"
+        # Five scans at 0.2s each, run with a batch concurrency of 5
+        assert elapsed < 0.6
+        get_scan_rate_limiter.cache_clear()
+
+    def test_every_image_is_charged(self, monkeypatch):
+        async def fake_parse(image_bytes):
+            return [ParsedReceiptItem(item_name="Tea", total_price=2.5)]
+
+        monkeypatch.setattr("app.routers.receipts.parse_receipt_image", fake_parse)
+        get_scan_rate_limiter.cache_clear()
+        client = TestClient(app)
+        max_files = get_settings().scan_batch_max_files
+        image = ("r.jpg", b"ok", "image/jpeg")
+
+        too_big = client.post("/api/receipt/scan/batch", files=[("files", image)] * (max_files + 1))
+        full = client.post("/api/receipt/scan/batch", files=[("files", image)] * max_files)
+        single = client.post("/api/receipt/scan", files={"file": image})
+
+        assert too_big.status_code == 413
+        assert full.status_code == 200  # The oversized batch wasn't charged
+        assert single.status_code == 429
+        get_scan_rate_limiter.cache_clear()
+
+    def test_ten_receipts_fit_the_default_limits(self, monkeypatch):
+        async def fake_parse(image_bytes):
+            return [ParsedReceiptItem(item_name="Tea", total_price=2.5)]
+
+        monkeypatch.setattr("app.routers.receipts.parse_receipt_image", fake_parse)
+        get_scan_rate_limiter.cache_clear()
+        files = [("files", (f"r{i}.jpg", b"ok", "image/jpeg")) for i in range(10)]
+
+        response = TestClient(app).post("/api/receipt/scan/batch", files=files)
+
+        assert response.status_code == 200
+        assert all(r["items"] for r in response.json()["results"])
+        get_scan_rate_limiter.cache_clear()
+
+    def test_batch_cap_larger_than_burst_is_rejected(self):
+        with pytest.raises(ValidationError):
+            Settings(scan_burst=5, scan_batch_max_files=10)
@@ -0,0 +1,151 @@
+"""Tests for GET /api/auth/me/balances."""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.balances import BalanceCache, get_balance_cache
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+BOB = "00000000-0000-0000-0000-000000000002"
+CAROL = "00000000-0000-0000-0000-000000000003"
+
+
+@pytest.fixture
+def groups(fake_db):
+    get_balance_cache().clear()
+    fake_db.seed(
+        "users",
+        [
+            {"id": uid, "email": f"{name}@example.com", "display_name": name}
+            for uid, name in ((ALICE, "Alice"), (BOB, "Bob"), (CAROL, "Carol"))
+        ],
+    )
+    trip, flat = fake_db.seed(
+        "groups", [{"name": "Trip", "created_by": ALICE}, {"name": "Flat", "created_by": BOB}]
+    )
+    fake_db.seed(
+        "group_members",
+        [{"group_id": trip["id"], "user_id": uid} for uid in (ALICE, BOB, CAROL)]
+        + [{"group_id": flat["id"], "user_id": uid} for uid in (ALICE, BOB)],
+    )
+    yield trip["id"], flat["id"]
+    get_balance_cache().clear()
+
+
+def _expense(client: TestClient, payer: str, group_id: str, amount: float, users: list[str], tip=0.0):
+    return client.post(
+        "/api/expenses",
+        json={
+            "group_id": group_id,
+            "total_amount": amount + tip,
+            "tip_amount": tip,
+            "items": [
+                {"item_name": "Stuff", "unit_price": amount, "total_price": amount, "assigned_user_ids": users}
+            ],
+        },
+        headers=auth_header(payer),
+    ).json()["id"]
+
+
+def _balances(client: TestClient, user: str = ALICE) -> dict:
+    response = client.get("/api/auth/me/balances", headers=auth_header(user))
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+class TestBalances:
+    def test_totals_per_group_and_person(self, groups):
+        trip, flat = groups
+        client = TestClient(app)
+        # Alice paid 33 (30 + 3 tip) for all three; Bob paid 12 split with Alice
+        _expense(client, ALICE, trip, 30.0, [ALICE, BOB, CAROL], tip=3.0)
+        _expense(client, BOB, flat, 12.0, [ALICE, BOB])
+
+        summary = _balances(client)
+
+        assert (summary["you_owe"], summary["you_are_owed"]) == (6.0, 22.0)
+        assert [(p["display_name"], p["amount"]) for p in summary["people"]] == [
+            ("Carol", 11.0),
+            ("Bob", 5.0),
+        ]
+        assert [(g["name"], g["amount"]) for g in summary["groups"]] == [("Trip", 22.0), ("Flat", -6.0)]
+
+    def test_generated_settlements_give_the_same_answer(self, groups, fake_db):
+        trip, _ = groups
+        client = TestClient(app)
+        expense_id = _expense(client, ALICE, trip, 30.0, [ALICE, BOB, CAROL], tip=3.0)
+        before = _balances(client)
+        get_balance_cache().clear()
+
+        client.get(f"/api/settlements/expense/{expense_id}", headers=auth_header(ALICE))
+
+        assert fake_db.rows("settlements")
+        assert _balances(client) == before
+
+    def test_cached_until_a_payment_in_the_group(self, groups, fake_db):
+        trip, _ = groups
+        client = TestClient(app)
+        expense_id = _expense(client, ALICE, trip, 30.0, [ALICE, BOB, CAROL])
+        settlements = client.get(
+            f"/api/settlements/expense/{expense_id}", headers=auth_header(BOB)
+        ).json()
+        assert _balances(client)["you_are_owed"] == 20.0
+        fake_db.round_trips = 0
+
+        assert _balances(client)["you_are_owed"] == 20.0
+        assert fake_db.round_trips == 0
+
+        bob_owes = next(s for s in settlements if s["from_user_id"] == BOB)
+        client.post(f"/api/settlements/{bob_owes['id']}/mark-paid", headers=auth_header(BOB))
+
+        assert _balances(client)["you_are_owed"] == 10.0
+
+    def test_stale_settlements_are_netted_against_payments(self, groups):
+        trip, _ = groups
+        client = TestClient(app)
+        expense_id = _expense(client, ALICE, trip, 30.0, [ALICE, BOB, CAROL])
+        settlements = client.get(
+            f"/api/settlements/expense/{expense_id}", headers=auth_header(BOB)
+        ).json()
+        bob_owes = next(s for s in settlements if s["from_user_id"] == BOB)
+        client.post(f"/api/settlements/{bob_owes['id']}/mark-paid", headers=auth_header(BOB))
+        # Bob paid 10, then the bill turns out to be 60: he owes another 10
+        client.patch(
+            f"/api/expenses/{expense_id}",
+            json={"total_amount": 60.0, "tip_amount": 30.0},
+            headers=auth_header(ALICE),
+        )
+
+        people = {p["display_name"]: p["amount"] for p in _balances(client)["people"]}
+
+        assert people == {"Bob": 10.0, "Carol": 20.0}
+
+
+def _summary(*group_ids: str) -> dict:
+    return {"groups": [{"group_id": group_id} for group_id in group_ids]}
+
+
+class TestBalanceCache:
+    def test_group_index_stays_bounded_past_max_entries(self):
+        cache = BalanceCache(ttl=60, max_entries=2)
+        for n in range(50):
+            cache.set(f"user-{n}", _summary(f"group-{n}", "shared"))
+
+        assert len(cache._users_by_group) == 3
+        assert cache._users_by_group["shared"] == {"user-48", "user-49"}
+        assert cache._users_by_group["group-49"] == {"user-49"}
+        assert "group-0" not in cache._users_by_group
+
+    def test_index_follows_expiry_and_refreshed_summaries(self):
+        now = [0.0]
+        cache = BalanceCache(ttl=60, max_entries=10)
+        cache._cache._clock = lambda: now[0]
+        cache.set("alice", _summary("trip", "flat"))
+        cache.set("alice", _summary("trip"))
+        assert cache._users_by_group == {"trip": {"alice"}}
+
+        now[0] = 61.0
+        assert cache.get("alice") is None
+        assert cache._users_by_group == {}
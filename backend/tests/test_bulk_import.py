@@ -0,0 +1,153 @@
+"""Tests for POST /api/groups/{id}/import."""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import get_settings
+from app.main import app
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+BOB = "00000000-0000-0000-0000-000000000002"
+MALLORY = "00000000-0000-0000-0000-000000000009"
+
+
+@pytest.fixture
+def group_id(fake_db):
+    fake_db.seed(
+        "users",
+        [{"id": uid, "email": f"{uid}@example.com"} for uid in (ALICE, BOB, MALLORY)],
+    )
+    group = fake_db.seed("groups", [{"name": "Trip", "created_by": ALICE}])[0]
+    fake_db.seed(
+        "group_members",
+        [{"group_id": group["id"], "user_id": uid} for uid in (ALICE, BOB)],
+    )
+    return group["id"]
+
+
+@pytest.fixture
+def chunk_size(monkeypatch):
+    monkeypatch.setattr(get_settings(), "import_chunk_size", 2)
+
+
+def _line(amount: float, **extra) -> dict:
+    return {
+        "description": f"Dinner {amount}",
+        "total_amount": amount,
+        "items": [
+            {"item_name": "Food", "unit_price": amount, "total_price": amount, "assigned_user_ids": [ALICE, BOB]}
+        ],
+    } | extra
+
+
+def _import(client: TestClient, group_id: str, lines: list, user: str = ALICE):
+    body = "\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines)
+    return client.post(
+        f"/api/groups/{group_id}/import",
+        content=body.encode(),
+        headers=auth_header(user) | {"Content-Type": "application/x-ndjson"},
+    )
+
+
+class TestBulkImport:
+    def test_chunks_are_one_call_each_and_summary_refreshes_once(self, fake_db, group_id, chunk_size):
+        client = TestClient(app)
+        fake_db.round_trips = 0
+
+        response = _import(client, group_id, [_line(10.0), _line(20.0), _line(30.0, settled=True)])
+
+        assert response.status_code == 200, response.text
+        assert response.json() == {"imported": 3, "failed": 0, "errors": [], "aborted": None}
+        # Members, two chunks, one summary refresh
+        assert fake_db.round_trips == 4
+        assert len(fake_db.rows("item_assignments")) == 6
+        assert {(s["amount"], s["is_paid"]) for s in fake_db.rows("settlements")} == {
+            (5.0, False),
+            (10.0, False),
+            (15.0, True),
+        }
+        summary = fake_db.rows("group_summaries")[0]
+        assert (summary["expense_count"], summary["total_spent"]) == (3, 60.0)
+        assert (summary["unpaid_settlement_count"], summary["unpaid_amount"]) == (2, 15.0)
+
+    def test_invalid_lines_are_reported_and_skipped(self, fake_db, group_id):
+        response = _import(
+            TestClient(app),
+            group_id,
+            [
+                _line(10.0, paid_by=BOB, created_at="2024-03-01T12:00:00Z"),
+                "{not json",
+                {"description": "No total"},
+                _line(5.0, paid_by=MALLORY),
+                "",
+                _line(8.0),
+            ],
+        )
+
+        body = response.json()
+        assert (body["imported"], body["failed"]) == (2, 3)
+        assert [e["line"] for e in body["errors"]] == [2, 3, 4]
+        assert "Not group members" in body["errors"][2]["error"]
+        expense = next(e for e in fake_db.rows("expenses") if e["total_amount"] == 10.0)
+        assert expense["created_by"] == BOB
+        assert expense["created_at"].startswith("2024-03-01")
+
+    def test_receipt_images_are_kept(self, fake_db, group_id, monkeypatch):
+        class Worker:
+            submitted = []
+
+            def submit(self, expense_id, key):
+                self.submitted.append((expense_id, key))
+
+        monkeypatch.setattr("app.services.bulk_import.get_thumbnail_worker", Worker)
+        key = f"uploads/{ALICE}/{'a' * 32}.jpg"
+        bobs_key = f"uploads/{BOB}/{'b' * 32}.jpg"
+
+        response = _import(
+            TestClient(app),
+            group_id,
+            [
+                _line(10.0, receipt_image_key=key, receipt_image_url="https://example.com/r.jpg"),
+                _line(20.0, receipt_image_key=bobs_key),
+            ],
+        )
+
+        body = response.json()
+        assert (body["imported"], body["failed"]) == (1, 1)
+        assert body["errors"][0] == {"line": 2, "error": "Unknown receipt_image_key"}
+        expense = fake_db.rows("expenses")[0]
+        assert (expense["receipt_image_key"], expense["receipt_image_url"]) == (
+            key,
+            "https://example.com/r.jpg",
+        )
+        assert Worker.submitted == [(expense["id"], key)]
+
+    def test_failed_chunk_rolls_back_and_stops(self, fake_db, group_id, chunk_size, monkeypatch):
+        from app.db import fake
+
+        original = fake.RPC_FUNCTIONS["import_expenses"]
+
+        def import_with_duplicate(db, params):
+            # The second chunk violates a unique constraint after its expenses are in
+            if db.rows("expenses"):
+                params = params | {"p_assignments": params["p_assignments"] * 2}
+            return original(db, params)
+
+        monkeypatch.setitem(fake.RPC_FUNCTIONS, "import_expenses", import_with_duplicate)
+
+        response = _import(TestClient(app), group_id, [_line(10.0), _line(20.0), "", _line(30.0)])
+
+        body = response.json()
+        assert body["imported"] == 2
+        assert body["aborted"].startswith("Chunk starting at line 4 was rolled back")
+        assert sorted(e["total_amount"] for e in fake_db.rows("expenses")) == [10.0, 20.0]
+        assert len(fake_db.rows("item_assignments")) == 4
+        assert fake_db.rows("group_summaries")[0]["expense_count"] == 2
+
+    def test_non_member_cannot_import(self, group_id):
+        response = _import(TestClient(app), group_id, [_line(10.0)], user=MALLORY)
+
+        assert response.status_code == 403
@@ -0,0 +1,113 @@
+"""Tests for the receipt upstream circuit breaker."""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.middleware.rate_limit import get_scan_rate_limiter
+from app.services.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+from app.services.metrics import REGISTRY
+from app.services.receipt_backends import get_backends
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _breaker(clock: FakeClock, name: str = "test") -> CircuitBreaker:
+    return CircuitBreaker(
+        name, window=4, min_calls=4, failure_rate=0.5, slow_call_s=5, open_s=30, clock=clock
+    )
+
+
+def _call(breaker: CircuitBreaker, ok: bool = True, seconds: float = 1.0) -> None:
+    breaker.acquire()
+    breaker.record(ok, seconds)
+
+
+class TestCircuitBreaker:
+    def test_opens_on_failures_and_slow_calls(self):
+        breaker = _breaker(FakeClock())
+        _call(breaker)
+        _call(breaker)
+        _call(breaker, ok=False)
+        assert breaker.state == CLOSED
+
+        _call(breaker, seconds=8.0)
+
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError) as exc:
+            breaker.acquire()
+        assert exc.value.retry_after == 30
+
+    def test_half_open_lets_one_probe_through(self):
+        clock = FakeClock()
+        breaker = _breaker(clock)
+        for _ in range(4):
+            _call(breaker, ok=False)
+        clock.now = 30.0
+
+        breaker.acquire()
+        assert breaker.state == HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.acquire()
+
+        breaker.record(True, 1.0)
+        assert breaker.state == CLOSED
+        _call(breaker, ok=False)  # Fresh window: one failure doesn't reopen
+        assert breaker.state == CLOSED
+
+    def test_failed_probe_reopens_and_cancelled_probe_is_retried(self):
+        clock = FakeClock()
+        breaker = _breaker(clock)
+        for _ in range(4):
+            _call(breaker, ok=False)
+        clock.now = 30.0
+
+        breaker.acquire()
+        breaker.release()
+        breaker.acquire()
+        breaker.record(False, 1.0)
+
+        assert breaker.state == OPEN
+        assert breaker.retry_after() == 30
+
+    def test_transitions_are_exported(self):
+        breaker = _breaker(FakeClock(), name="exported")
+        for _ in range(4):
+            _call(breaker, ok=False)
+
+        metrics = REGISTRY.render()
+        assert 'snapsplit_circuit_state{upstream="exported"} 2' in metrics
+        assert 'snapsplit_circuit_transitions_total{upstream="exported",to="open"} 1' in metrics
+
+
+class TestScanFastFail:
+    def test_open_circuit_returns_503_without_calling_out(self, monkeypatch):
+        async def never(*args, **kwargs):
+            raise AssertionError("parser should not be called")
+
+        monkeypatch.setattr("app.routers.receipts.parse_receipt_image", never)
+        get_scan_rate_limiter.cache_clear()
+        get_backends.cache_clear()
+        breaker = get_backends()[0].breaker
+        for _ in range(breaker.min_calls):
+            _call(breaker, ok=False)
+
+        response = TestClient(app).post(
+            "/api/receipt/scan", files={"file": ("r.jpg", b"\xff\xd8", "image/jpeg")}
+        )
+
+        assert response.status_code == 503
+        assert 1 <= int(response.headers["retry-after"]) <= breaker.open_s
+        get_backends.cache_clear()
+        get_scan_rate_limiter.cache_clear()
@@ -0,0 +1,41 @@
+"""Tests for negotiated response compression."""
+import gzip
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.middleware.compression import choose_encoding
+
+
+def _raw_get(client: TestClient, path: str, encoding: str):
+    # Stream so the client doesn't decode the body for us
+    with client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+        return response, b"".join(response.iter_raw())
+
+
+class TestCompression:
+    def test_large_response_is_gzipped(self):
+        client = TestClient(app)
+
+        response, body = _raw_get(client, "/openapi.json", "gzip")
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert int(response.headers["content-length"]) == len(body)
+        plain = client.get("/openapi.json", headers={"Accept-Encoding": "identity"}).content
+        assert gzip.decompress(body) == plain
+        assert len(body) < len(plain)
+
+    def test_small_response_is_sent_as_is(self):
+        response, body = _raw_get(TestClient(app), "/health", "gzip")
+
+        assert "content-encoding" not in response.headers
+        assert body == b'{"status":"ok"}'
+
+    def test_negotiation(self):
+        assert choose_encoding("gzip, br", brotli_available=True) == "br"
+        assert choose_encoding("gzip, br", brotli_available=False) == "gzip"
+        assert choose_encoding("br;q=0.5, gzip", brotli_available=True) == "gzip"
+        assert choose_encoding("*", brotli_available=False) == "gzip"
+        assert choose_encoding("gzip;q=0, identity", brotli_available=True) is None
+        assert choose_encoding("", brotli_available=True) is None
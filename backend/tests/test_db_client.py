@@ -0,0 +1,71 @@
+"""Tests for the instrumented database client and per-request round trips."""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from postgrest.exceptions import APIError
+
+from app.db.client import get_supabase_admin
+from app.main import app
+from app.middleware import metrics as metrics_middleware
+from app.services.metrics import DB_QUERIES, start_round_trip_count
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+
+
+class TestRoundTrips:
+    def test_one_per_executed_query(self, fake_db):
+        db = get_supabase_admin()
+        trips = start_round_trip_count()
+
+        query = db.table("groups").select("id").eq("name", "Trip").limit(1)
+        assert trips == [0]  # Building a query sends nothing
+        query.execute()
+        query.execute()
+        db.rpc("user_balances", {"p_user_id": ALICE}).execute()
+
+        assert trips == [3]
+
+    def test_failed_query_counts_as_an_error(self, fake_db):
+        db = get_supabase_admin()
+        trips = start_round_trip_count()
+        errors = DB_QUERIES.value(table="rpc:generate_settlements", outcome="error")
+
+        with pytest.raises(APIError):
+            db.rpc("generate_settlements", {"p_expense_id": ALICE, "p_user_id": ALICE}).execute()
+
+        assert trips == [1]
+        assert DB_QUERIES.value(table="rpc:generate_settlements", outcome="error") == errors + 1
+
+    def test_each_request_starts_from_zero(self, fake_db, monkeypatch):
+        observed = []
+        monkeypatch.setattr(
+            metrics_middleware.DB_ROUND_TRIPS,
+            "observe",
+            lambda value, **labels: observed.append((labels["route"], value)),
+        )
+        client = TestClient(app)
+
+        client.get("/api/groups", headers=auth_header(ALICE))
+        client.get("/api/groups", headers=auth_header(ALICE))
+
+        assert observed == [("/api/groups", 1), ("/api/groups", 1)]
+
+
+def test_fake_database_is_not_imported_in_production():
+    env = {**os.environ, "DB_BACKEND": "supabase"}
+    code = "import sys, app.main; print('app.db.fake' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).parents[1],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,147 @@
+"""Tests for min-cost-flow settlement plans."""
+import random
+from uuid import UUID
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.debt_optimizer import InfeasibleSettlement, optimize_debts
+from app.services.debt_simplifier import Debt
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+BOB = "00000000-0000-0000-0000-000000000002"
+CHARLIE = "00000000-0000-0000-0000-000000000003"
+DIANA = "00000000-0000-0000-0000-000000000004"
+
+
+def _net(debts: list[Debt]) -> dict[str, int]:
+    balances: dict[str, int] = {}
+    for d in debts:
+        cents = round(d.amount * 100)
+        balances[str(d.from_user)] = balances.get(str(d.from_user), 0) - cents
+        balances[str(d.to_user)] = balances.get(str(d.to_user), 0) + cents
+    return {uid: b for uid, b in balances.items() if b}
+
+
+def _pairs(debts: list[Debt]) -> set[tuple[str, str]]:
+    return {(str(d.from_user), str(d.to_user)) for d in debts}
+
+
+class TestOptimizeDebts:
+    def test_only_pays_people_with_a_shared_debt(self):
+        # Alice never shared anything with Charlie, so Bob passes it on
+        debts = [Debt(ALICE, BOB, 10.0), Debt(BOB, CHARLIE, 10.0)]
+
+        plan = optimize_debts(debts)
+
+        assert _pairs(plan) == {(ALICE, BOB), (BOB, CHARLIE)}
+        assert _net(plan) == _net(debts)
+
+    def test_prefers_the_direct_route(self):
+        debts = [Debt(ALICE, BOB, 10.0), Debt(BOB, CHARLIE, 10.0), Debt(ALICE, CHARLIE, 1.0)]
+
+        plan = optimize_debts(debts)
+
+        assert plan == [Debt(UUID(ALICE), UUID(CHARLIE), 11.0)]
+
+    def test_costs_steer_the_route(self):
+        debts = [Debt(ALICE, BOB, 10.0), Debt(BOB, CHARLIE, 10.0), Debt(ALICE, CHARLIE, 1.0)]
+        costs = {(ALICE, CHARLIE): 5.0}
+
+        plan = optimize_debts(debts, cost=lambda payer, payee: costs.get((payer, payee), 1.0))
+
+        assert _pairs(plan) == {(ALICE, BOB), (BOB, CHARLIE)}
+        assert _net(plan) == _net(debts)
+
+    def test_allowed_payers_are_honoured(self):
+        debts = [Debt(ALICE, BOB, 10.0), Debt(BOB, CHARLIE, 10.0), Debt(ALICE, CHARLIE, 1.0)]
+
+        plan = optimize_debts(debts, allowed_payers={CHARLIE: {BOB}})
+
+        assert all(str(d.from_user) == BOB for d in plan if str(d.to_user) == CHARLIE)
+        assert _net(plan) == _net(debts)
+
+    def test_infeasible_constraints_raise(self):
+        with pytest.raises(InfeasibleSettlement):
+            optimize_debts([Debt(ALICE, BOB, 10.0)], allowed_payers={BOB: {CHARLIE}})
+
+    def test_large_group_settles_as_a_forest(self):
+        rnd = random.Random(7)
+        users = [str(UUID(int=i + 1)) for i in range(60)]
+        debts = []
+        for _ in range(300):
+            payer = rnd.choice(users)
+            for user in rnd.sample(users, 4):
+                if user != payer:
+                    debts.append(Debt(user, payer, round(rnd.uniform(1, 50), 2)))
+
+        plan = optimize_debts(debts)
+
+        assert _net(plan) == _net(debts)
+        assert _pairs(plan) <= _pairs(debts) | {(b, a) for a, b in _pairs(debts)}
+        assert len(plan) < len(users)
+
+
+class TestPlanEndpoint:
+    @pytest.fixture
+    def group(self, fake_db):
+        fake_db.seed(
+            "users", [{"id": uid, "email": f"{uid}@example.com"} for uid in (ALICE, BOB, CHARLIE, DIANA)]
+        )
+        group = fake_db.seed("groups", [{"name": "Trip", "created_by": ALICE}])[0]
+        fake_db.seed(
+            "group_members", [{"group_id": group["id"], "user_id": uid} for uid in (ALICE, BOB, CHARLIE)]
+        )
+        dinner, taxi = fake_db.seed(
+            "expenses",
+            [
+                {"group_id": group["id"], "created_by": BOB, "total_amount": 10.0},
+                {"group_id": group["id"], "created_by": CHARLIE, "total_amount": 10.0},
+            ],
+        )
+        fake_db.seed(
+            "settlements",
+            [
+                {"expense_id": dinner["id"], "from_user_id": ALICE, "to_user_id": BOB, "amount": 10.0},
+                {"expense_id": taxi["id"], "from_user_id": BOB, "to_user_id": CHARLIE, "amount": 10.0},
+                # Paid already, so it's left out of the plan
+                {
+                    "expense_id": taxi["id"],
+                    "from_user_id": BOB,
+                    "to_user_id": CHARLIE,
+                    "amount": 4.0,
+                    "is_paid": True,
+                },
+            ],
+        )
+        return group
+
+    def test_modes(self, group):
+        client = TestClient(app)
+        url = f"/api/settlements/group/{group['id']}/plan"
+
+        greedy = client.post(url, json={"mode": "greedy"}, headers=auth_header(ALICE)).json()
+        flow = client.post(url, json={}, headers=auth_header(ALICE)).json()
+
+        assert [(t["from_user_id"], t["to_user_id"], t["amount"]) for t in greedy["transfers"]] == [
+            (ALICE, CHARLIE, 10.0)
+        ]
+        assert sorted((t["from_user_id"], t["to_user_id"], t["amount"]) for t in flow["transfers"]) == [
+            (ALICE, BOB, 10.0),
+            (BOB, CHARLIE, 10.0),
+        ]
+
+    def test_infeasible_is_422_and_outsiders_403(self, group):
+        client = TestClient(app)
+        url = f"/api/settlements/group/{group['id']}/plan"
+
+        infeasible = client.post(
+            url, json={"allowed_payers": {CHARLIE: [ALICE]}}, headers=auth_header(ALICE)
+        )
+        outsider = client.post(url, json={}, headers=auth_header(DIANA))
+
+        assert infeasible.status_code == 422
+        assert outsider.status_code == 403
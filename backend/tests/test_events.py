@@ -0,0 +1,105 @@
+"""Tests for the realtime group event hub and stream."""
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routers.groups import _event_stream
+from app.services.events import EventHub, get_event_hub
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+BOB = "00000000-0000-0000-0000-000000000002"
+
+
+class TestEventHub:
+    def test_publish_reaches_only_that_group(self):
+        async def scenario():
+            hub = EventHub()
+            mine = hub.subscribe("g1", ALICE)
+            other = hub.subscribe("g2", ALICE)
+
+            hub.publish("g1", "expense.created", {"id": "e1"})
+
+            event = await mine.next_event(1)
+            assert event["type"] == "expense.created" and event["data"] == {"id": "e1"}
+            assert await other.next_event(0.01) is None
+
+        asyncio.run(scenario())
+
+    def test_slow_subscriber_is_dropped_with_overflow(self):
+        async def scenario():
+            hub = EventHub(max_queue=2)
+            slow = hub.subscribe("g1", ALICE)
+            for i in range(3):
+                hub.publish("g1", "expense.created", {"id": i})
+
+            assert slow.closed
+            assert (await slow.next_event(1))["type"] == "overflow"
+            assert await slow.next_event(0.01) is None
+
+        asyncio.run(scenario())
+
+
+class TestEventStream:
+    def test_stream_ends_when_subscriber_is_removed(self):
+        async def scenario():
+            hub = get_event_hub()
+            subscription = hub.subscribe("g1", BOB)
+            stream = _event_stream(subscription, heartbeat=0.01)
+
+            assert "event: ready" in await stream.__anext__()
+            assert await stream.__anext__() == ": ping\n\n"
+            hub.publish("g1", "member.removed", {"user_id": BOB})
+            assert "event: member.removed" in await stream.__anext__()
+
+            chunks = [chunk async for chunk in stream]
+            assert chunks == []
+            assert "g1" not in hub._subscriptions
+
+        asyncio.run(scenario())
+
+    def test_add_member_publishes_to_open_streams(self, fake_db):
+        fake_db.seed(
+            "users",
+            [
+                {"id": ALICE, "email": "alice@example.com"},
+                {"id": BOB, "email": "bob@example.com"},
+            ],
+        )
+        group = fake_db.seed("groups", [{"name": "Trip", "created_by": ALICE}])[0]
+        fake_db.seed(
+            "group_members", [{"group_id": group["id"], "user_id": ALICE, "role": "admin"}]
+        )
+        client = TestClient(app)
+
+        async def scenario():
+            hub = get_event_hub()
+            subscription = hub.subscribe(group["id"], ALICE)
+            try:
+                # The app runs on the test client's own loop, in another thread
+                response = await asyncio.to_thread(
+                    client.post,
+                    f"/api/groups/{group['id']}/members",
+                    json={"user_id": BOB},
+                    headers=auth_header(ALICE),
+                )
+                assert response.status_code == 201
+                event = await subscription.next_event(1)
+                assert event["type"] == "member.added"
+                assert event["data"]["user_id"] == BOB
+            finally:
+                hub.unsubscribe(subscription)
+
+        asyncio.run(scenario())
+
+    def test_non_member_cannot_subscribe(self, fake_db):
+        fake_db.seed("users", [{"id": ALICE, "email": "alice@example.com"}])
+        group = fake_db.seed("groups", [{"name": "Trip", "created_by": ALICE}])[0]
+
+        response = TestClient(app).get(
+            f"/api/groups/{group['id']}/events", headers=auth_header(BOB)
+        )
+
+        assert response.status_code == 403
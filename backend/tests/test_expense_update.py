@@ -0,0 +1,277 @@
+"""Tests for PATCH /api/expenses/{id}."""
+import pytest
+from fastapi.testclient import TestClient
+from postgrest.exceptions import APIError
+
+from app.db.client import get_supabase_admin
+from app.main import app
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+BOB = "00000000-0000-0000-0000-000000000002"
+CAROL = "00000000-0000-0000-0000-000000000003"
+
+
+def _seed_expense(fake_db) -> tuple[str, list[str]]:
+    """Alice paid 30: pizza (Alice+Bob), beer (Carol), salad (Alice)."""
+    fake_db.seed(
+        "users",
+        [
+            {"id": uid, "email": f"{uid}@example.com"}
+            for uid in (ALICE, BOB, CAROL)
+        ],
+    )
+    group = fake_db.seed("groups", [{"name": "Dinner", "created_by": ALICE}])[0]
+    fake_db.seed(
+        "group_members",
+        [{"group_id": group["id"], "user_id": uid} for uid in (ALICE, BOB, CAROL)],
+    )
+    expense = fake_db.seed(
+        "expenses",
+        [{"group_id": group["id"], "created_by": ALICE, "total_amount": 30.0}],
+    )[0]
+    items = fake_db.seed(
+        "receipt_items",
+        [
+            {"expense_id": expense["id"], "item_name": name, "unit_price": price, "total_price": price}
+            for name, price in (("Pizza", 20.0), ("Beer", 6.0), ("Salad", 4.0))
+        ],
+    )
+    fake_db.seed(
+        "item_assignments",
+        [
+            {"receipt_item_id": items[0]["id"], "user_id": ALICE},
+            {"receipt_item_id": items[0]["id"], "user_id": BOB},
+            {"receipt_item_id": items[1]["id"], "user_id": CAROL},
+            {"receipt_item_id": items[2]["id"], "user_id": ALICE},
+        ],
+    )
+    return expense["id"], [item["id"] for item in items]
+
+
+def _assigned(fake_db, item_id: str) -> set[str]:
+    return {
+        a["user_id"]
+        for a in fake_db.rows("item_assignments")
+        if a["receipt_item_id"] == item_id
+    }
+
+
+class TestUpdateExpense:
+    def test_reassignment_writes_only_changed_rows(self, fake_db):
+        expense_id, (pizza, beer, salad) = _seed_expense(fake_db)
+        fake_db.round_trips = 0
+
+        response = TestClient(app).patch(
+            f"/api/expenses/{expense_id}",
+            json={"items_updated": [{"id": beer, "assigned_user_ids": [BOB]}]},
+            headers=auth_header(ALICE),
+        )
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body["expense"]["version"] == 2
+        # Alice's share is untouched, so only Bob and Carol are reported
+        totals = {s["user_id"]: s["total"] for s in body["changed_shares"]}
+        assert totals == {BOB: 16.0, CAROL: 0}
+        assert _assigned(fake_db, beer) == {BOB}
+        assert _assigned(fake_db, pizza) == {ALICE, BOB}
+        # expense, membership, items, then one apply_expense_update
+        assert fake_db.round_trips == 4
+
+    def test_add_update_and_remove_items(self, fake_db):
+        expense_id, (pizza, beer, salad) = _seed_expense(fake_db)
+
+        response = TestClient(app).patch(
+            f"/api/expenses/{expense_id}",
+            json={
+                "tax_amount": 3.0,
+                "items_added": [
+                    {"item_name": "Cake", "unit_price": 5.0, "total_price": 5.0, "assigned_user_ids": [CAROL]}
+                ],
+                "items_updated": [{"id": pizza, "total_price": 22.0}],
+                "items_removed": [salad],
+            },
+            headers=auth_header(ALICE),
+        )
+
+        assert response.status_code == 200
+        items = {i["item_name"]: i for i in fake_db.rows("receipt_items")}
+        assert set(items) == {"Pizza", "Beer", "Cake"}
+        assert items["Pizza"]["total_price"] == 22.0
+        assert _assigned(fake_db, items["Cake"]["id"]) == {CAROL}
+        # The removed item's assignment went with it
+        assert len(fake_db.rows("item_assignments")) == 4
+        assert fake_db.rows("expenses")[0]["tax_amount"] == 3.0
+
+    def test_stale_expected_version_conflicts(self, fake_db):
+        expense_id, _ = _seed_expense(fake_db)
+        client = TestClient(app)
+
+        client.patch(f"/api/expenses/{expense_id}", json={"description": "a"}, headers=auth_header(ALICE))
+        response = client.patch(
+            f"/api/expenses/{expense_id}",
+            json={"description": "b", "expected_version": 1},
+            headers=auth_header(BOB),
+        )
+
+        assert response.status_code == 409
+        assert fake_db.rows("expenses")[0]["description"] == "a"
+
+    def test_unknown_item_is_rejected(self, fake_db):
+        expense_id, _ = _seed_expense(fake_db)
+
+        response = TestClient(app).patch(
+            f"/api/expenses/{expense_id}",
+            json={"items_removed": [ALICE]},
+            headers=auth_header(ALICE),
+        )
+
+        assert response.status_code == 404
+        assert fake_db.rows("expenses")[0]["version"] == 1
+
+
+def _update_params(expense_id: str, **overrides) -> dict:
+    return {
+        "p_expense_id": expense_id,
+        "p_user_id": ALICE,
+        "p_version": 1,
+        "p_fields": {},
+        "p_removed_items": [],
+        "p_updated_items": [],
+        "p_added_items": [],
+        "p_assignment_deletes": [],
+        "p_assignment_inserts": [],
+        **overrides,
+    }
+
+
+class TestApplyExpenseUpdate:
+    def test_failed_write_rolls_back_the_version_bump(self, fake_db):
+        expense_id, (pizza, beer, salad) = _seed_expense(fake_db)
+        params = _update_params(
+            expense_id,
+            p_fields={"description": "Edited"},
+            p_removed_items=[salad],
+            # Alice is already on the pizza, so this insert fails
+            p_assignment_inserts=[{"receipt_item_id": pizza, "user_id": ALICE}],
+        )
+
+        with pytest.raises(APIError) as exc:
+            get_supabase_admin().rpc("apply_expense_update", params).execute()
+
+        assert exc.value.code == "23505"
+        expense = fake_db.rows("expenses")[0]
+        assert (expense["version"], expense["description"]) == (1, "")
+        assert len(fake_db.rows("receipt_items")) == 3
+        assert _assigned(fake_db, salad) == {ALICE}
+
+    def test_stale_version_writes_nothing(self, fake_db):
+        expense_id, (pizza, beer, salad) = _seed_expense(fake_db)
+        params = _update_params(expense_id, p_version=2, p_removed_items=[salad])
+
+        with pytest.raises(APIError) as exc:
+            get_supabase_admin().rpc("apply_expense_update", params).execute()
+
+        assert exc.value.code == "40001"
+        assert len(fake_db.rows("receipt_items")) == 3
+
+
+class TestApplyExpenseUpdatePostgres:
+    """The SQL function itself; needs TEST_DATABASE_URL."""
+
+    JSONB_PARAMS = {"p_fields", "p_updated_items", "p_added_items", "p_assignment_inserts"}
+
+    @pytest.fixture
+    def cur(self, pg):
+        with pg.cursor() as cur:
+            try:
+                yield cur
+            finally:
+                pg.rollback()
+
+    @pytest.fixture
+    def ids(self, cur) -> dict[str, str]:
+        """Alice paid 30 for a pizza that is assigned to her."""
+        for uid in (ALICE, BOB):
+            cur.execute("INSERT INTO auth.users (id, email) VALUES (%s, %s)", (uid, f"{uid}@example.com"))
+        cur.execute(
+            "INSERT INTO public.groups (name, created_by) VALUES ('Dinner', %s) RETURNING id", (ALICE,)
+        )
+        group_id = cur.fetchone()[0]
+        cur.execute(
+            "INSERT INTO public.group_members (group_id, user_id) VALUES (%s, %s), (%s, %s)",
+            (group_id, ALICE, group_id, BOB),
+        )
+        cur.execute(
+            "INSERT INTO public.expenses (group_id, created_by, total_amount)"
+            " VALUES (%s, %s, 30) RETURNING id::text",
+            (group_id, ALICE),
+        )
+        expense_id = cur.fetchone()[0]
+        cur.execute(
+            "INSERT INTO public.receipt_items (expense_id, item_name, total_price)"
+            " VALUES (%s, 'Pizza', 20) RETURNING id::text",
+            (expense_id,),
+        )
+        pizza = cur.fetchone()[0]
+        cur.execute(
+            "INSERT INTO public.item_assignments (receipt_item_id, user_id)"
+            " VALUES (%s, %s) RETURNING id::text",
+            (pizza, ALICE),
+        )
+        return {"expense": expense_id, "pizza": pizza, "assignment": cur.fetchone()[0]}
+
+    def _apply(self, cur, params: dict) -> tuple:
+        from psycopg.types.json import Jsonb
+
+        cur.execute(
+            "SELECT version, description FROM public.apply_expense_update("
+            "%(p_expense_id)s, %(p_user_id)s, %(p_version)s, %(p_fields)s, %(p_removed_items)s::uuid[],"
+            " %(p_updated_items)s, %(p_added_items)s, %(p_assignment_deletes)s::uuid[],"
+            " %(p_assignment_inserts)s)",
+            {k: Jsonb(v) if k in self.JSONB_PARAMS else v for k, v in params.items()},
+        )
+        return cur.fetchone()
+
+    def test_applies_the_diff(self, cur, ids):
+        cake = "00000000-0000-0000-0000-0000000000ca"
+        item = {"item_name": "Pizza", "quantity": 1, "unit_price": 0, "total_price": 22.0}
+
+        result = self._apply(
+            cur,
+            _update_params(
+                ids["expense"],
+                p_fields={"description": "Edited", "tax_amount": 3.0},
+                p_updated_items=[{"id": ids["pizza"], **item}],
+                p_added_items=[{**item, "id": cake, "item_name": "Cake", "total_price": 5.0}],
+                p_assignment_deletes=[ids["assignment"]],
+                p_assignment_inserts=[
+                    {"receipt_item_id": ids["pizza"], "user_id": BOB},
+                    {"receipt_item_id": cake, "user_id": ALICE},
+                ],
+            ),
+        )
+
+        assert result == (2, "Edited")
+        cur.execute(
+            "SELECT ri.item_name, ri.total_price::float8, ia.user_id::text"
+            " FROM public.receipt_items ri"
+            " JOIN public.item_assignments ia ON ia.receipt_item_id = ri.id"
+            " WHERE ri.expense_id = %s ORDER BY ri.item_name",
+            (ids["expense"],),
+        )
+        assert cur.fetchall() == [("Cake", 5.0, ALICE), ("Pizza", 22.0, BOB)]
+        cur.execute(
+            "SELECT from_user_id::text, to_user_id::text, amount::float8, expense_version"
+            " FROM public.settlements WHERE expense_id = %s",
+            (ids["expense"],),
+        )
+        assert cur.fetchall() == [(BOB, ALICE, 24.44, 2)]
+
+    def test_stale_version_raises(self, cur, ids):
+        import psycopg
+
+        with pytest.raises(psycopg.errors.SerializationFailure):
+            self._apply(cur, _update_params(ids["expense"], p_version=7))
@@ -0,0 +1,81 @@
+"""Tests for GET /api/groups/{id}/export."""
+import csv
+import io
+import json
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+BOB = "00000000-0000-0000-0000-000000000002"
+
+
+def _seed_ledger(fake_db, expenses: int) -> str:
+    fake_db.seed(
+        "users",
+        [
+            {"id": ALICE, "email": "alice@example.com"},
+            {"id": BOB, "email": "bob@example.com"},
+        ],
+    )
+    group = fake_db.seed("groups", [{"name": "Trip", "created_by": ALICE}])[0]
+    fake_db.seed("group_members", [{"group_id": group["id"], "user_id": ALICE}])
+    # Same timestamp for all, like rows written by one bulk insert
+    rows = fake_db.seed(
+        "expenses",
+        [
+            {"group_id": group["id"], "created_by": ALICE, "total_amount": 10, "created_at": "2025-01-01T00:00:00+00:00"}
+            for _ in range(expenses)
+        ],
+    )
+    for expense in rows:
+        item = fake_db.seed(
+            "receipt_items",
+            [{"expense_id": expense["id"], "item_name": "Pizza, large", "total_price": 10}],
+        )[0]
+        fake_db.seed("item_assignments", [{"receipt_item_id": item["id"], "user_id": BOB}])
+        fake_db.seed(
+            "settlements",
+            [{"expense_id": expense["id"], "from_user_id": BOB, "to_user_id": ALICE, "amount": 10}],
+        )
+    return group["id"]
+
+
+class TestExport:
+    def test_csv_pages_through_every_expense_once(self, fake_db, monkeypatch):
+        monkeypatch.setattr("app.routers.groups.EXPORT_PAGE_SIZE", 2)
+        group_id = _seed_ledger(fake_db, expenses=5)
+        fake_db.round_trips = 0
+
+        response = TestClient(app).get(f"/api/groups/{group_id}/export", headers=auth_header(ALICE))
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        expense_ids = [r["id"] for r in rows if r["record"] == "expense"]
+        assert len(expense_ids) == len(set(expense_ids)) == 5
+        assert [r["record"] for r in rows].count("assignment") == 5
+        assert rows[1]["item_name"] == "Pizza, large"
+        # Membership check plus three pages
+        assert fake_db.round_trips == 4
+
+    def test_ndjson(self, fake_db):
+        group_id = _seed_ledger(fake_db, expenses=1)
+
+        response = TestClient(app).get(
+            f"/api/groups/{group_id}/export", params={"format": "ndjson"}, headers=auth_header(ALICE)
+        )
+
+        records = [json.loads(line) for line in response.text.splitlines()]
+        assert [r["record"] for r in records] == ["expense", "item", "assignment", "settlement"]
+        assert records[3]["amount"] == 10
+
+    def test_non_member_is_rejected(self, fake_db):
+        group_id = _seed_ledger(fake_db, expenses=1)
+
+        response = TestClient(app).get(f"/api/groups/{group_id}/export", headers=auth_header(BOB))
+
+        assert response.status_code == 403
@@ -0,0 +1,91 @@
+"""Tests for the in-process PostgREST stand-in."""
+import pytest
+from fastapi.testclient import TestClient
+from postgrest.exceptions import APIError
+
+from app.db.fake import FakeClient, FakeDatabase
+from app.main import app
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+BOB = "00000000-0000-0000-0000-000000000002"
+
+
+class TestQueryBuilder:
+    def test_insert_applies_defaults(self):
+        db = FakeClient(FakeDatabase())
+        row = db.table("expenses").insert({"group_id": "g", "created_by": ALICE}).execute().data[0]
+        assert row["status"] == "pending"
+        assert row["id"] and row["created_at"]
+
+    def test_filters_and_order(self):
+        db = FakeClient(FakeDatabase())
+        db.table("groups").insert(
+            [{"name": "a", "created_at": "1"}, {"name": "b", "created_at": "2"}, {"name": "c", "created_at": "3"}]
+        ).execute()
+        result = (
+            db.table("groups")
+            .select("name")
+            .in_("name", ["a", "c"])
+            .order("created_at", desc=True)
+            .execute()
+        )
+        assert result.data == [{"name": "c"}, {"name": "a"}]
+
+    def test_embedded_one_to_many_and_many_to_one(self):
+        db = FakeClient(FakeDatabase())
+        db.db.seed("users", [{"id": ALICE, "email": "a@x", "display_name": "Alice"}])
+        item = db.table("receipt_items").insert({"expense_id": "e", "item_name": "x"}).execute().data[0]
+        db.table("item_assignments").insert({"receipt_item_id": item["id"], "user_id": ALICE}).execute()
+
+        items = db.table("receipt_items").select("*, item_assignments(user_id)").execute().data
+        assert items[0]["item_assignments"] == [{"user_id": ALICE}]
+
+        assignments = db.table("item_assignments").select("id, users(display_name)").execute().data
+        assert assignments[0]["users"] == {"display_name": "Alice"}
+
+    def test_round_trips_and_unique(self):
+        db = FakeClient(FakeDatabase())
+        db.table("group_members").insert({"group_id": "g", "user_id": ALICE}).execute()
+        with pytest.raises(APIError, match="duplicate key"):
+            db.table("group_members").insert({"group_id": "g", "user_id": ALICE}).execute()
+        assert db.db.round_trips == 2
+
+
+class TestRoutersAgainstFake:
+    def test_expense_flow(self, fake_db):
+        fake_db.seed(
+            "users",
+            [
+                {"id": ALICE, "email": "alice@example.com", "display_name": "Alice"},
+                {"id": BOB, "email": "bob@example.com", "display_name": "Bob"},
+            ],
+        )
+        client = TestClient(app)
+
+        group = client.post("/api/groups", json={"name": "Trip"}, headers=auth_header(ALICE)).json()
+        client.post(
+            f"/api/groups/{group['id']}/members",
+            json={"user_id": BOB},
+            headers=auth_header(ALICE),
+        )
+        detail = client.get(f"/api/groups/{group['id']}", headers=auth_header(BOB)).json()
+        assert {m["user"]["display_name"] for m in detail["members"]} == {"Alice", "Bob"}
+
+        expense = client.post(
+            "/api/expenses",
+            json={
+                "group_id": group["id"],
+                "total_amount": 40.0,
+                "items": [{"item_name": "Pizza", "unit_price": 40.0, "total_price": 40.0, "assigned_user_ids": [ALICE, BOB]}],
+            },
+            headers=auth_header(ALICE),
+        ).json()
+
+        settlements = client.get(
+            f"/api/settlements/expense/{expense['id']}", headers=auth_header(BOB)
+        ).json()
+        assert len(settlements) == 1
+        assert settlements[0]["from_user_id"] == BOB
+        assert settlements[0]["amount"] == 20.0
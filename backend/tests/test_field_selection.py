@@ -0,0 +1,83 @@
+"""Tests for ``fields=`` projections on read endpoints."""
+from fastapi.testclient import TestClient
+
+from app.main import app
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+BOB = "00000000-0000-0000-0000-000000000002"
+
+
+def _seed(fake_db) -> tuple[str, str]:
+    fake_db.seed(
+        "users",
+        [{"id": uid, "email": f"{uid}@example.com", "display_name": uid[-1]} for uid in (ALICE, BOB)],
+    )
+    group = fake_db.seed("groups", [{"name": "Trip", "created_by": ALICE}])[0]
+    fake_db.seed(
+        "group_members",
+        [{"group_id": group["id"], "user_id": uid} for uid in (ALICE, BOB)],
+    )
+    expense = TestClient(app).post(
+        "/api/expenses",
+        json={
+            "group_id": group["id"],
+            "description": "Dinner",
+            "total_amount": 20.0,
+            "items": [
+                {"item_name": "Pasta", "unit_price": 20.0, "total_price": 20.0, "assigned_user_ids": [ALICE, BOB]}
+            ],
+        },
+        headers=auth_header(ALICE),
+    ).json()
+    return group["id"], expense["id"]
+
+
+class TestFieldSelection:
+    def test_group_list_returns_only_requested_fields(self, fake_db):
+        _seed(fake_db)
+
+        response = TestClient(app).get(
+            "/api/groups", params={"fields": "id,name"}, headers=auth_header(ALICE)
+        )
+
+        assert response.status_code == 200
+        assert [set(g) for g in response.json()] == [{"id", "name"}]
+
+    def test_unrequested_embeds_are_not_queried(self, fake_db):
+        group_id, expense_id = _seed(fake_db)
+        client = TestClient(app)
+        fake_db.round_trips = 0
+
+        group = client.get(
+            f"/api/groups/{group_id}", params={"fields": "name"}, headers=auth_header(ALICE)
+        ).json()
+        expense = client.get(
+            f"/api/expenses/{expense_id}",
+            params={"fields": "description,total_amount"},
+            headers=auth_header(ALICE),
+        ).json()
+
+        assert group == {"name": "Trip"}
+        assert expense == {"description": "Dinner", "total_amount": 20.0}
+        # Membership check and one row each; no member or item queries
+        assert fake_db.round_trips == 4
+
+    def test_settlement_fields(self, fake_db):
+        _, expense_id = _seed(fake_db)
+        client = TestClient(app)
+        url = f"/api/settlements/expense/{expense_id}"
+        full = client.get(url, headers=auth_header(BOB)).json()
+
+        trimmed = client.get(url, params={"fields": "amount,is_paid"}, headers=auth_header(BOB))
+
+        assert trimmed.json() == [{"amount": s["amount"], "is_paid": s["is_paid"]} for s in full]
+
+    def test_unknown_field_is_rejected(self, fake_db):
+        response = TestClient(app).get(
+            "/api/groups", params={"fields": "id,password"}, headers=auth_header(ALICE)
+        )
+
+        assert response.status_code == 400
+        assert "password" in response.json()["detail"]
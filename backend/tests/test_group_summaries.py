@@ -0,0 +1,132 @@
+"""Tests for trigger-maintained group summaries and list_groups."""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.db.client import get_supabase_admin
+from app.main import app
+from app.services.balances import get_balance_cache
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+BOB = "00000000-0000-0000-0000-000000000002"
+
+
+@pytest.fixture(autouse=True)
+def _clear_balance_cache():
+    get_balance_cache().clear()
+    yield
+    get_balance_cache().clear()
+
+
+def _seed_group(fake_db) -> str:
+    fake_db.seed(
+        "users",
+        [
+            {"id": ALICE, "email": "alice@example.com"},
+            {"id": BOB, "email": "bob@example.com"},
+        ],
+    )
+    group = fake_db.seed("groups", [{"name": "Trip", "created_by": ALICE}])[0]
+    fake_db.seed(
+        "group_members",
+        [
+            {"group_id": group["id"], "user_id": ALICE, "role": "admin"},
+            {"group_id": group["id"], "user_id": BOB},
+        ],
+    )
+    return group["id"]
+
+
+def _create_expense(client: TestClient, group_id: str, amount: float) -> str:
+    expense = client.post(
+        "/api/expenses",
+        json={
+            "group_id": group_id,
+            "total_amount": amount,
+            "items": [
+                {"item_name": "Dinner", "unit_price": amount, "total_price": amount, "assigned_user_ids": [ALICE, BOB]}
+            ],
+        },
+        headers=auth_header(ALICE),
+    ).json()
+    return expense["id"]
+
+
+class TestGroupSummaries:
+    def test_list_groups_returns_summary_in_one_query(self, fake_db):
+        group_id = _seed_group(fake_db)
+        client = TestClient(app)
+        _create_expense(client, group_id, 30.0)
+        _create_expense(client, group_id, 10.0)
+        fake_db.round_trips = 0
+
+        alice = client.get("/api/groups", headers=auth_header(ALICE)).json()
+        bob = client.get("/api/groups", headers=auth_header(BOB)).json()
+
+        assert fake_db.round_trips == 2
+        assert alice[0]["summary"] == {
+            "expense_count": 2,
+            "total_spent": 40.0,
+            "unpaid_settlement_count": 2,
+            "unpaid_amount": 20.0,
+            "my_balance": 20.0,
+        }
+        assert bob[0]["summary"]["my_balance"] == -20.0
+
+    def test_paying_and_deleting_update_the_summary(self, fake_db):
+        group_id = _seed_group(fake_db)
+        client = TestClient(app)
+        first = _create_expense(client, group_id, 30.0)
+        second = _create_expense(client, group_id, 10.0)
+
+        client.post(
+            "/api/settlements/settle-up",
+            json={"user_id": ALICE, "group_id": group_id},
+            headers=auth_header(BOB),
+        )
+        _create_expense(client, group_id, 8.0)
+        get_supabase_admin().table("expenses").delete().in_("id", [first, second]).execute()
+
+        summary = fake_db.rows("group_summaries")[0]
+        assert summary["expense_count"] == 1
+        assert summary["total_spent"] == 8.0
+        assert (summary["unpaid_settlement_count"], summary["unpaid_amount"]) == (1, 4.0)
+        balances = {m["user_id"]: m["net_balance"] for m in fake_db.rows("group_members")}
+        assert balances == {ALICE: 4.0, BOB: -4.0}
+
+    def test_summary_agrees_with_personal_balances(self, fake_db):
+        group_id = _seed_group(fake_db)
+        client = TestClient(app)
+        _create_expense(client, group_id, 20.0)
+
+        summary = client.get("/api/groups", headers=auth_header(ALICE)).json()[0]["summary"]
+        balances = client.get("/api/auth/me/balances", headers=auth_header(ALICE)).json()
+
+        assert (summary["my_balance"], summary["unpaid_amount"]) == (10.0, 10.0)
+        assert balances["groups"][0]["amount"] == summary["my_balance"]
+
+    def test_edit_replaces_the_old_versions_settlements(self, fake_db):
+        group_id = _seed_group(fake_db)
+        client = TestClient(app)
+        expense_id = _create_expense(client, group_id, 20.0)
+        detail = client.get(f"/api/expenses/{expense_id}", headers=auth_header(ALICE)).json()
+
+        client.patch(
+            f"/api/expenses/{expense_id}",
+            json={"items_updated": [{"id": detail["items"][0]["id"], "assigned_user_ids": [BOB]}]},
+            headers=auth_header(ALICE),
+        )
+
+        summary = client.get("/api/groups", headers=auth_header(ALICE)).json()[0]["summary"]
+        balances = client.get("/api/auth/me/balances", headers=auth_header(ALICE)).json()
+        assert (summary["unpaid_settlement_count"], summary["unpaid_amount"]) == (1, 20.0)
+        assert summary["my_balance"] == balances["groups"][0]["amount"] == 20.0
+
+    def test_group_without_expenses_has_zero_summary(self, fake_db):
+        _seed_group(fake_db)
+
+        groups = TestClient(app).get("/api/groups", headers=auth_header(BOB)).json()
+
+        assert groups[0]["summary"]["expense_count"] == 0
+        assert groups[0]["summary"]["my_balance"] == 0
@@ -0,0 +1,220 @@
+"""Tests for Idempotency-Key handling."""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.db.client import get_supabase_admin
+from app.db import fake
+from app.db.fake import FakeClient
+from app.main import app
+from app.services import idempotency
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+BOB = "00000000-0000-0000-0000-000000000002"
+
+
+def _pizza(group_id: str) -> dict:
+    return {
+        "group_id": group_id,
+        "total_amount": 20.0,
+        "items": [{"item_name": "Pizza", "unit_price": 20.0, "total_price": 20.0, "assigned_user_ids": [ALICE, BOB]}],
+    }
+
+
+def _seed_group(fake_db) -> str:
+    fake_db.seed(
+        "users",
+        [
+            {"id": ALICE, "email": "alice@example.com", "display_name": "Alice"},
+            {"id": BOB, "email": "bob@example.com", "display_name": "Bob"},
+        ],
+    )
+    group = fake_db.seed("groups", [{"name": "Trip", "created_by": ALICE}])[0]
+    fake_db.seed(
+        "group_members",
+        [
+            {"group_id": group["id"], "user_id": ALICE, "role": "admin"},
+            {"group_id": group["id"], "user_id": BOB},
+        ],
+    )
+    return group["id"]
+
+
+class TestClaim:
+    def test_second_claim_sees_owner_then_response(self, fake_db):
+        db = get_supabase_admin()
+        assert idempotency.claim(db, "k", "h", 60) is None
+        assert idempotency.claim(db, "k", "h", 60)["response"] is None
+        idempotency.save_response(db, "k", 201, {"ok": True})
+        assert idempotency.claim(db, "k", "h", 60)["response"] == {"ok": True}
+
+    def test_expired_claim_is_taken_over(self, fake_db):
+        db = get_supabase_admin()
+        assert idempotency.claim(db, "k", "h", -1) is None
+        assert idempotency.claim(db, "k", "h", 60) is None
+
+    def test_lost_takeover_never_returns_the_expired_row(self, fake_db):
+        class LosesEveryTakeover:
+            """The expired row is never deleted, as if others kept winning."""
+
+            def table(self, name):
+                query = FakeClient(fake_db).table(name)
+                query.delete = lambda **_: query  # Stays a select
+                return query
+
+        db = get_supabase_admin()
+        idempotency.claim(db, "k", "h", -1)
+        idempotency.save_response(db, "k", 201, {"stale": True})
+
+        with pytest.raises(RuntimeError):
+            idempotency.claim(LosesEveryTakeover(), "k", "h", 60)
+
+
+class TestCreateExpense:
+    def test_retry_replays_original_response(self, fake_db):
+        group_id = _seed_group(fake_db)
+        client = TestClient(app)
+        body = {
+            "group_id": group_id,
+            "total_amount": 20.0,
+            "items": [{"item_name": "Pizza", "unit_price": 20.0, "total_price": 20.0, "assigned_user_ids": [ALICE, BOB]}],
+        }
+        headers = {**auth_header(ALICE), "Idempotency-Key": "retry-1"}
+
+        first = client.post("/api/expenses", json=body, headers=headers)
+        trips = fake_db.round_trips
+        second = client.post("/api/expenses", json=body, headers=headers)
+
+        assert first.status_code == second.status_code == 201
+        assert first.json() == second.json()
+        assert second.headers["idempotent-replayed"] == "true"
+        assert fake_db.round_trips - trips == 2  # Failed claim insert + one select
+        assert len(fake_db.rows("expenses")) == 1
+        assert len(fake_db.rows("receipt_items")) == 1
+
+    def test_key_reuse_with_different_body_is_rejected(self, fake_db):
+        group_id = _seed_group(fake_db)
+        client = TestClient(app)
+        headers = {**auth_header(ALICE), "Idempotency-Key": "retry-2"}
+        client.post("/api/expenses", json={"group_id": group_id, "total_amount": 5.0}, headers=headers)
+        response = client.post("/api/expenses", json={"group_id": group_id, "total_amount": 6.0}, headers=headers)
+        assert response.status_code == 422
+
+    def test_failed_request_releases_key(self, fake_db):
+        group_id = _seed_group(fake_db)
+        client = TestClient(app)
+        headers = {**auth_header("00000000-0000-0000-0000-0000000000ff"), "Idempotency-Key": "retry-3"}
+        response = client.post("/api/expenses", json={"group_id": group_id, "total_amount": 5.0}, headers=headers)
+        assert response.status_code == 403
+        assert fake_db.rows("idempotency_keys") == []
+
+    def test_failed_write_releases_key_and_retry_creates_once(self, fake_db, monkeypatch):
+        real = fake._generate_settlements
+
+        def fail_once(db, params):
+            monkeypatch.setattr(fake, "_generate_settlements", real)
+            raise fake._api_error("57014", "canceling statement due to statement timeout")
+
+        # Fails after the expense, items and assignments were inserted
+        monkeypatch.setattr(fake, "_generate_settlements", fail_once)
+        group_id = _seed_group(fake_db)
+        client = TestClient(app, raise_server_exceptions=False)
+        headers = {**auth_header(ALICE), "Idempotency-Key": "retry-4"}
+
+        failed = client.post("/api/expenses", json=_pizza(group_id), headers=headers)
+        assert failed.status_code == 500
+        assert fake_db.rows("expenses") == fake_db.rows("idempotency_keys") == []
+
+        retried = client.post("/api/expenses", json=_pizza(group_id), headers=headers)
+        assert retried.status_code == 201
+        assert len(fake_db.rows("expenses")) == len(fake_db.rows("receipt_items")) == 1
+
+    def test_lost_response_keeps_key_claimed(self, fake_db, monkeypatch):
+        real = fake.RPC_FUNCTIONS["create_expense"]
+
+        def commit_then_lose_response(db, params):
+            real(db, params)
+            raise ConnectionError("connection reset after commit")
+
+        monkeypatch.setitem(fake.RPC_FUNCTIONS, "create_expense", commit_then_lose_response)
+        group_id = _seed_group(fake_db)
+        client = TestClient(app, raise_server_exceptions=False)
+        headers = {**auth_header(ALICE), "Idempotency-Key": "retry-5"}
+
+        assert client.post("/api/expenses", json=_pizza(group_id), headers=headers).status_code == 500
+        monkeypatch.setitem(fake.RPC_FUNCTIONS, "create_expense", real)
+        retried = client.post("/api/expenses", json=_pizza(group_id), headers=headers)
+
+        # The write committed and saved its response, so the retry replays it
+        assert retried.status_code == 201
+        assert retried.headers["idempotent-replayed"] == "true"
+        assert len(fake_db.rows("expenses")) == 1
+
+
+class TestCreateExpensePostgres:
+    """The create_expense SQL function; needs TEST_DATABASE_URL."""
+
+    @pytest.fixture
+    def cur(self, pg):
+        with pg.cursor() as cur:
+            try:
+                yield cur
+            finally:
+                pg.rollback()
+
+    @pytest.fixture
+    def group_id(self, cur) -> str:
+        for uid in (ALICE, BOB):
+            cur.execute("INSERT INTO auth.users (id, email) VALUES (%s, %s)", (uid, f"{uid}@example.com"))
+        cur.execute(
+            "INSERT INTO public.groups (name, created_by) VALUES ('Trip', %s) RETURNING id::text", (ALICE,)
+        )
+        group_id = cur.fetchone()[0]
+        cur.execute(
+            "INSERT INTO public.group_members (group_id, user_id) VALUES (%s, %s), (%s, %s)",
+            (group_id, ALICE, group_id, BOB),
+        )
+        cur.execute(
+            "INSERT INTO public.idempotency_keys (id, expires_at) VALUES ('k', NOW() + interval '1 hour')"
+        )
+        return group_id
+
+    def _create(self, cur, group_id: str, assignee: str):
+        from psycopg.types.json import Jsonb
+
+        item = "00000000-0000-0000-0000-0000000000aa"
+        cur.execute(
+            "SELECT id::text FROM public.create_expense(%s, %s, %s, %s, 'k')",
+            (
+                ALICE,
+                Jsonb({"group_id": group_id, "total_amount": 20.0}),
+                Jsonb([{"id": item, "item_name": "Pizza", "total_price": 20.0}]),
+                Jsonb([{"receipt_item_id": item, "user_id": u} for u in (ALICE, assignee)]),
+            ),
+        )
+        return cur.fetchone()[0]
+
+    def test_writes_settlements_and_response(self, cur, group_id):
+        expense_id = self._create(cur, group_id, BOB)
+
+        cur.execute(
+            "SELECT from_user_id::text, amount::float8 FROM public.settlements WHERE expense_id = %s",
+            (expense_id,),
+        )
+        assert cur.fetchall() == [(BOB, 10.0)]
+        cur.execute("SELECT status_code, response->>'id' FROM public.idempotency_keys WHERE id = 'k'")
+        assert cur.fetchone() == (201, expense_id)
+
+    def test_failed_assignment_writes_nothing(self, cur, group_id):
+        import psycopg
+
+        cur.execute("SAVEPOINT before_create")
+        with pytest.raises(psycopg.errors.ForeignKeyViolation):
+            self._create(cur, group_id, "00000000-0000-0000-0000-0000000000ff")
+        cur.execute("ROLLBACK TO SAVEPOINT before_create")
+
+        cur.execute("SELECT count(*) FROM public.expenses WHERE group_id = %s", (group_id,))
+        assert cur.fetchone() == (0,)
+        cur.execute("SELECT response FROM public.idempotency_keys WHERE id = 'k'")
+        assert cur.fetchone() == (None,)
@@ -0,0 +1,60 @@
+"""Tests for the metrics registry and /metrics endpoint."""
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routers import groups
+from app.services.metrics import HTTP_IN_FLIGHT, Registry
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+
+
+class TestRegistry:
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        hist = registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+        hist.observe(0.05, route="/a")
+        hist.observe(0.5, route="/a")
+        hist.observe(5, route="/a")
+        text = registry.render()
+        assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in text
+        assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in text
+        assert 'latency_seconds_count{route="/a"} 3' in text
+
+    def test_counter_labels(self):
+        registry = Registry()
+        counter = registry.counter("hits_total", "Hits.", ("status",))
+        counter.inc(status="200")
+        counter.inc(2, status="200")
+        assert counter.value(status="200") == 3
+        assert 'hits_total{status="200"} 3' in registry.render()
+
+
+class TestMetricsEndpoint:
+    def test_records_route_template_and_round_trips(self, fake_db):
+        client = TestClient(app)
+        client.get("/api/groups", headers=auth_header(ALICE))
+        text = client.get("/metrics").text
+        assert 'snapsplit_http_requests_total{method="GET",route="/api/groups",status="200"}' in text
+        assert 'snapsplit_db_round_trips_per_request_bucket{route="/api/groups",le="1.0"}' in text
+        assert 'snapsplit_db_queries_total{table="group_members",outcome="ok"}' in text
+
+    def test_in_flight_is_labelled_by_route(self, fake_db, monkeypatch):
+        seen = []
+        real = groups.get_supabase_admin
+
+        def admin():
+            seen.append(HTTP_IN_FLIGHT.value(method="GET", route="/api/groups"))
+            return real()
+
+        monkeypatch.setattr(groups, "get_supabase_admin", admin)
+        client = TestClient(app)
+        client.get("/api/groups", headers=auth_header(ALICE))
+        client.get(f"/api/expenses/{ALICE}", headers=auth_header(ALICE))
+
+        assert seen == [1]
+        text = client.get("/metrics").text
+        assert 'snapsplit_http_requests_in_flight{method="GET",route="/api/groups"} 0' in text
+        assert 'snapsplit_http_requests_in_flight{method="GET",route="/api/expenses/{expense_id}"} 0' in text
@@ -0,0 +1,74 @@
+"""Tests for the on-demand profiling middleware."""
+import pstats
+
+from fastapi.testclient import TestClient
+
+from app.config import get_settings
+from app.main import app
+from tests.conftest import auth_header
+
+
+ADMIN = "00000000-0000-0000-0000-00000000000a"
+ALICE = "00000000-0000-0000-0000-000000000001"
+
+
+def _enable(monkeypatch, tmp_path, **overrides):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "profile_admin_ids", [ADMIN])
+    monkeypatch.setattr(settings, "profile_dir", str(tmp_path))
+    for key, value in overrides.items():
+        monkeypatch.setattr(settings, key, value)
+
+
+class TestProfiling:
+    def test_admin_gets_pstats(self, fake_db, monkeypatch, tmp_path):
+        _enable(monkeypatch, tmp_path)
+        client = TestClient(app)
+        response = client.get(
+            "/api/groups", headers={**auth_header(ADMIN), "X-Profile": "cprofile"}
+        )
+        profile_id = response.headers["x-profile-id"]
+        assert profile_id.endswith(".pstats")
+        stats = pstats.Stats(str(tmp_path / profile_id))
+        assert any("list_groups" in func[2] for func in stats.stats)
+
+    def test_sampler_writes_folded_stacks(self, fake_db, monkeypatch, tmp_path):
+        _enable(monkeypatch, tmp_path)
+        fake_db.latency = 0.02
+        client = TestClient(app)
+        response = client.get(
+            "/api/groups", headers={**auth_header(ADMIN), "X-Profile": "sample"}
+        )
+        fake_db.latency = 0
+        folded = (tmp_path / response.headers["x-profile-id"]).read_text()
+        assert "fake.py:execute" in folded
+
+    def test_non_admin_is_not_profiled(self, fake_db, monkeypatch, tmp_path):
+        _enable(monkeypatch, tmp_path)
+        client = TestClient(app)
+        response = client.get(
+            "/api/groups", headers={**auth_header(ALICE), "X-Profile": "cprofile"}
+        )
+        assert response.status_code == 200
+        assert "x-profile-id" not in response.headers
+        assert not list(tmp_path.iterdir())
+
+    def test_sampled_request_gets_no_profile_id(self, fake_db, monkeypatch, tmp_path):
+        _enable(monkeypatch, tmp_path, profile_sample_rate=1.0)
+        client = TestClient(app)
+        response = client.get("/api/groups", headers=auth_header(ALICE))
+        assert response.status_code == 200
+        assert "x-profile-id" not in response.headers
+        assert [p.suffix for p in tmp_path.iterdir()] == [".pstats"]
+
+    def test_keeps_only_the_newest_profiles(self, fake_db, monkeypatch, tmp_path):
+        _enable(monkeypatch, tmp_path, profile_max_files=2)
+        (tmp_path / "notes.txt").write_text("not a profile")
+        client = TestClient(app)
+        ids = [
+            client.get(
+                "/api/groups", headers={**auth_header(ADMIN), "X-Profile": "cprofile"}
+            ).headers["x-profile-id"]
+            for _ in range(4)
+        ]
+        assert {p.name for p in tmp_path.iterdir()} == {"notes.txt", *ids[2:]}
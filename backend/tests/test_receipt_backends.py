@@ -0,0 +1,68 @@
+"""Tests for hedged receipt-parser backend calls."""
+import asyncio
+
+import pytest
+
+from app.services.receipt_backends import LatencyTracker, run_hedged
+
+
+def attempt(name: str, delay: float, log: list, fail: bool = False):
+    async def run():
+        log.append(f"start {name}")
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            log.append(f"cancel {name}")
+            raise
+        if fail:
+            raise RuntimeError(name)
+        return name
+
+    return run
+
+
+class TestRunHedged:
+    def test_fast_primary_never_fires_hedge(self):
+        log = []
+        result = asyncio.run(
+            run_hedged([attempt("a", 0.01, log), attempt("b", 0.01, log)], delay=0.2)
+        )
+        assert result == "a"
+        assert log == ["start a"]
+
+    def test_slow_primary_is_hedged_and_cancelled(self):
+        log = []
+
+        async def scenario():
+            result = await run_hedged(
+                [attempt("a", 1.0, log), attempt("b", 0.02, log)], delay=0.05
+            )
+            await asyncio.sleep(0)  # Let the cancellation land
+            return result
+
+        assert asyncio.run(scenario()) == "b"
+        assert log == ["start a", "start b", "cancel a"]
+
+    def test_failed_primary_fails_over_immediately(self):
+        log = []
+        result = asyncio.run(
+            run_hedged([attempt("a", 0.0, log, fail=True), attempt("b", 0.01, log)], delay=10)
+        )
+        assert result == "b"
+
+    def test_all_failures_raise_first(self):
+        log = []
+        with pytest.raises(RuntimeError, match="a"):
+            asyncio.run(
+                run_hedged(
+                    [attempt("a", 0.0, log, fail=True), attempt("b", 0.0, log, fail=True)],
+                    delay=10,
+                )
+            )
+
+
+def test_latency_tracker_p95():
+    tracker = LatencyTracker()
+    for i in range(100):
+        tracker.observe(i / 100)
+    assert tracker.percentile(0.95) == pytest.approx(0.95)
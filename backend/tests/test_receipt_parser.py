@@ -0,0 +1,72 @@
+"""Tests for receipt parsing modes."""
+import asyncio
+import json
+
+import pytest
+
+from app.config import get_settings
+from app.services import receipt_parser
+from app.services.metrics import record_llm_tokens
+from app.services.receipt_parser import decode_compact_items, parse_receipt_image
+
+
+class StubBackend:
+    name = "stub"
+
+    def __init__(self, responses: list[str]):
+        self.responses = responses
+        self.payloads: list[dict] = []
+
+    async def generate(self, payload: dict, timeout: float) -> str:
+        self.payloads.append(payload)
+        record_llm_tokens(self.name, 300, 20)
+        return self.responses[len(self.payloads) - 1]
+
+
+@pytest.fixture
+def stub_backend(monkeypatch):
+    def install(responses, structured):
+        backend = StubBackend(responses)
+        monkeypatch.setattr(receipt_parser, "get_backends", lambda: [backend])
+        monkeypatch.setattr(get_settings(), "receipt_structured_output", structured)
+        return backend
+
+    return install
+
+
+class TestCompactRows:
+    def test_decode(self):
+        items = decode_compact_items({"n": ["Salad", "Beer"], "q": [1, 2], "p": [12.5, 16.0]})
+        assert [(i.item_name, i.quantity, i.total_price) for i in items] == [
+            ("Salad", 1, 12.5),
+            ("Beer", 2, 16.0),
+        ]
+
+    def test_missing_quantities_default_to_one(self):
+        items = decode_compact_items({"n": ["Salad"], "q": [], "p": [12.5]})
+        assert items[0].quantity == 1
+
+    def test_length_mismatch_is_rejected(self):
+        with pytest.raises(ValueError):
+            decode_compact_items({"n": ["Salad", "Beer"], "q": [1, 2], "p": [12.5]})
+
+
+class TestParseModes:
+    def test_structured_mode_sends_schema_and_skips_repair(self, stub_backend):
+        backend = stub_backend([json.dumps({"n": ["Tea"], "q": [1], "p": [2.5]})], structured=True)
+        items = asyncio.run(parse_receipt_image(b"img"))
+        assert items[0].item_name == "Tea"
+        config = backend.payloads[0]["generationConfig"]
+        assert config["responseMimeType"] == "application/json"
+        assert config["responseSchema"]["properties"]["n"]["type"] == "ARRAY"
+        assert len(backend.payloads) == 1
+
+    def test_text_mode_repairs_malformed_json(self, stub_backend):
+        backend = stub_backend(
+            ["[{'item_name': 'Tea'}", json.dumps([{"item_name": "Tea", "total_price": 2.5}])],
+            structured=False,
+        )
+        items = asyncio.run(parse_receipt_image(b"img"))
+        assert items[0].total_price == 2.5
+        assert len(backend.payloads) == 2
+        assert "responseSchema" not in backend.payloads[0]["generationConfig"]
@@ -0,0 +1,67 @@
+"""Tests for tall-receipt strip splitting and merging."""
+import io
+
+import pytest
+
+from app.models.receipt import ParsedReceiptItem
+from app.services.receipt_tiles import merge_strip_items, split_tall_receipt
+
+
+def item(name: str, price: float, quantity: int = 1) -> ParsedReceiptItem:
+    return ParsedReceiptItem(item_name=name, quantity=quantity, total_price=price)
+
+
+class TestMergeStripItems:
+    def test_drops_overlap_duplicates(self):
+        strips = [
+            [item("Milk", 1.99), item("Bread", 2.49), item("Eggs", 3.10)],
+            [item("Bread", 2.49), item("Eggs", 3.10), item("Apples", 4.00)],
+            [item("Apples", 4.00), item("Coffee", 7.50)],
+        ]
+        merged = merge_strip_items(strips)
+        assert [i.item_name for i in merged] == ["Milk", "Bread", "Eggs", "Apples", "Coffee"]
+
+    def test_tolerates_ocr_noise_and_dropped_edge_lines(self):
+        strips = [
+            [item("Bananas", 1.20), item("Yoghurt 500g", 2.00)],
+            # The model skipped the cut-off Bananas line and misread one character
+            [item("Yoghurt 5O0g", 2.00), item("Cheese", 5.25)],
+        ]
+        merged = merge_strip_items(strips)
+        assert [i.item_name for i in merged] == ["Bananas", "Yoghurt 500g", "Cheese"]
+
+    def test_keeps_repeated_items_outside_overlap(self):
+        strips = [
+            [item("Water", 0.99), item("Chips", 1.50)],
+            [item("Soap", 2.00), item("Water", 0.99)],
+        ]
+        merged = merge_strip_items(strips)
+        assert [i.item_name for i in merged] == ["Water", "Chips", "Soap", "Water"]
+
+    def test_different_prices_are_not_merged(self):
+        strips = [[item("Beer", 4.00)], [item("Beer", 8.00, quantity=2)]]
+        assert len(merge_strip_items(strips)) == 2
+
+
+class TestSplitTallReceipt:
+    def _image(self, width: int, height: int) -> bytes:
+        Image = pytest.importorskip("PIL.Image")
+        buffer = io.BytesIO()
+        Image.new("RGB", (width, height), "white").save(buffer, format="JPEG")
+        return buffer.getvalue()
+
+    def test_short_receipt_is_not_split(self):
+        assert split_tall_receipt(self._image(400, 800), 2.5, 0.15, 6) is None
+
+    def test_tall_receipt_strips_overlap_and_cover_image(self):
+        from PIL import Image
+
+        strips = split_tall_receipt(self._image(400, 3000), 2.5, 0.15, 6)
+        assert strips is not None and 2 <= len(strips) <= 6
+        heights = [Image.open(io.BytesIO(s)).size[1] for s in strips]
+        step = heights[0] * 0.85
+        assert sum(heights) > 3000  # Overlap means strips cover more than the image
+        assert abs(step * (len(strips) - 1) + heights[-1] - 3000) <= len(strips)
+
+    def test_non_image_bytes_fall_back(self):
+        assert split_tall_receipt(b"not an image", 2.5, 0.15, 6) is None
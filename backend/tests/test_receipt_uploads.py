@@ -0,0 +1,135 @@
+"""Tests for direct-to-storage receipt uploads and background thumbnails."""
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+from pydantic import ValidationError
+
+from app.config import Settings, get_settings
+from app.main import app
+from app.middleware.rate_limit import get_scan_rate_limiter
+from app.models.receipt import ParsedReceiptItem
+from app.services.storage import LocalStorage, get_storage
+from app.services.thumbnails import get_thumbnail_worker
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+BOB = "00000000-0000-0000-0000-000000000002"
+
+
+@pytest.fixture
+def local_storage(tmp_path, monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "storage_backend", "local")
+    monkeypatch.setattr(settings, "storage_local_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "storage_signing_secret", "test-signing-secret")
+    get_storage.cache_clear()
+    yield tmp_path
+    get_storage.cache_clear()
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(out, "JPEG")
+    return out.getvalue()
+
+
+def _upload(client: TestClient, data: bytes, user: str = ALICE) -> str:
+    ticket = client.post(
+        "/api/receipt/uploads", json={"content_type": "image/jpeg"}, headers=auth_header(user)
+    ).json()
+    response = client.request(ticket["method"], ticket["url"], content=data, headers=ticket["headers"])
+    assert response.status_code == 204
+    return ticket["key"]
+
+
+class TestReceiptUploads:
+    def test_scan_reads_the_uploaded_image(self, local_storage, monkeypatch):
+        scanned = []
+
+        async def fake_parse(image_bytes):
+            scanned.append(image_bytes)
+            return [ParsedReceiptItem(item_name="Tea", total_price=2.5)]
+
+        monkeypatch.setattr("app.routers.receipts.parse_receipt_image", fake_parse)
+        get_scan_rate_limiter.cache_clear()
+        client = TestClient(app)
+        image = _jpeg(40, 80)
+        key = _upload(client, image)
+
+        response = client.post("/api/receipt/scan", data={"storage_key": key})
+
+        assert response.status_code == 200
+        assert response.json()["items"][0]["item_name"] == "Tea"
+        assert scanned == [image]
+        get_scan_rate_limiter.cache_clear()
+
+    def test_tampered_upload_url_is_rejected(self, local_storage):
+        client = TestClient(app)
+        ticket = client.post(
+            "/api/receipt/uploads", json={"content_type": "image/png"}, headers=auth_header(ALICE)
+        ).json()
+
+        response = client.put(ticket["url"].replace(ALICE, BOB), content=b"x")
+
+        assert response.status_code == 403
+        assert not any(local_storage.rglob("*.png"))
+
+    def test_urls_are_not_signed_with_the_jwt_secret(self, local_storage):
+        settings = get_settings()
+        client = TestClient(app)
+        ticket = client.post(
+            "/api/receipt/uploads", json={"content_type": "image/png"}, headers=auth_header(ALICE)
+        ).json()
+        url, _, query = ticket["url"].partition("?")
+        key = url.split(f"/{settings.storage_receipt_bucket}/", 1)[1]
+        expires = int(query.split("expires=")[1].split("&")[0])
+        forged = LocalStorage(
+            settings.storage_receipt_bucket, local_storage, settings.supabase_jwt_secret
+        ).signature("PUT", key, expires)
+
+        response = client.put(f"{url}?expires={expires}&signature={forged}", content=b"x")
+
+        assert response.status_code == 403
+
+    def test_local_storage_needs_a_signing_secret(self):
+        with pytest.raises(ValidationError, match="STORAGE_SIGNING_SECRET"):
+            Settings(storage_backend="local", storage_signing_secret="")
+
+    def test_expense_gets_a_thumbnail_in_the_background(self, local_storage, fake_db):
+        fake_db.seed("users", [{"id": ALICE, "email": "a@example.com"}])
+        group = fake_db.seed("groups", [{"name": "Trip", "created_by": ALICE}])[0]
+        fake_db.seed("group_members", [{"group_id": group["id"], "user_id": ALICE}])
+
+        with TestClient(app) as client:
+            key = _upload(client, _jpeg(1200, 3000))
+            expense = client.post(
+                "/api/expenses",
+                json={"group_id": group["id"], "total_amount": 5.0, "receipt_image_key": key},
+                headers=auth_header(ALICE),
+            ).json()
+            client.portal.call(get_thumbnail_worker().join)
+
+            stored = fake_db.rows("expenses")[0]
+            thumbnail = client.get(stored["receipt_thumbnail_url"])
+
+        assert expense["receipt_image_key"] == key
+        assert thumbnail.headers["content-type"] == "image/jpeg"
+        assert Image.open(io.BytesIO(thumbnail.content)).size == (128, 320)
+
+    def test_expense_rejects_someone_elses_upload(self, local_storage, fake_db):
+        fake_db.seed("users", [{"id": ALICE, "email": "a@example.com"}])
+        group = fake_db.seed("groups", [{"name": "Trip", "created_by": ALICE}])[0]
+        fake_db.seed("group_members", [{"group_id": group["id"], "user_id": ALICE}])
+        client = TestClient(app)
+        key = _upload(client, _jpeg(10, 10), user=BOB)
+
+        response = client.post(
+            "/api/expenses",
+            json={"group_id": group["id"], "total_amount": 5.0, "receipt_image_key": key},
+            headers=auth_header(ALICE),
+        )
+
+        assert response.status_code == 400
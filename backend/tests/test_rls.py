@@ -0,0 +1,138 @@
+"""Row level security under the section 19 policies.
+
+Runs against a real Postgres with supabase/migration.sql applied and skips
+without TEST_DATABASE_URL. Each test reads and writes as the
+``authenticated`` role with a Supabase-style JWT claim, then rolls back.
+"""
+import json
+import uuid
+
+import pytest
+
+
+MEMBER = str(uuid.uuid4())
+FRIEND = str(uuid.uuid4())
+OUTSIDER = str(uuid.uuid4())
+
+READS = {
+    "groups": "SELECT count(*) FROM public.groups WHERE id = %(group)s",
+    "group_members": "SELECT count(*) FROM public.group_members WHERE group_id = %(group)s",
+    "expenses": "SELECT count(*) FROM public.expenses WHERE id = %(expense)s",
+    "receipt_items": "SELECT count(*) FROM public.receipt_items WHERE expense_id = %(expense)s",
+    "item_assignments": "SELECT count(*) FROM public.item_assignments WHERE receipt_item_id = %(item)s",
+    "settlements": "SELECT count(*) FROM public.settlements WHERE expense_id = %(expense)s",
+    "group_summaries": "SELECT count(*) FROM public.group_summaries WHERE group_id = %(group)s",
+}
+
+
+@pytest.fixture
+def cur(pg):
+    with pg.cursor() as cur:
+        try:
+            yield cur
+        finally:
+            pg.rollback()
+
+
+@pytest.fixture
+def ids(cur) -> dict[str, uuid.UUID]:
+    """One group with ``MEMBER`` and ``FRIEND`` in it, and an expense."""
+    for user in (MEMBER, FRIEND, OUTSIDER):
+        cur.execute(
+            "INSERT INTO auth.users (id, email) VALUES (%s, %s)", (user, f"{user}@example.com")
+        )
+    cur.execute(
+        "INSERT INTO public.groups (name, created_by) VALUES ('RLS', %s) RETURNING id",
+        (MEMBER,),
+    )
+    group = cur.fetchone()[0]
+    cur.execute(
+        "INSERT INTO public.group_members (group_id, user_id, role)"
+        " VALUES (%s, %s, 'admin'), (%s, %s, 'member')",
+        (group, MEMBER, group, FRIEND),
+    )
+    cur.execute(
+        "INSERT INTO public.expenses (group_id, created_by, total_amount)"
+        " VALUES (%s, %s, 20) RETURNING id",
+        (group, MEMBER),
+    )
+    expense = cur.fetchone()[0]
+    cur.execute(
+        "INSERT INTO public.receipt_items (expense_id, item_name, total_price)"
+        " VALUES (%s, 'Pizza', 20) RETURNING id",
+        (expense,),
+    )
+    item = cur.fetchone()[0]
+    cur.execute(
+        "INSERT INTO public.item_assignments (receipt_item_id, user_id) VALUES (%s, %s)",
+        (item, MEMBER),
+    )
+    cur.execute(
+        "INSERT INTO public.settlements (expense_id, from_user_id, to_user_id, amount)"
+        " VALUES (%s, %s, %s, 10)",
+        (expense, FRIEND, MEMBER),
+    )
+    return {"group": group, "expense": expense, "item": item}
+
+
+def _become(cur, user_id: str) -> None:
+    cur.execute("SET LOCAL ROLE authenticated")
+    cur.execute(
+        "SELECT set_config('request.jwt.claims', %s, true)",
+        (json.dumps({"sub": user_id, "role": "authenticated"}),),
+    )
+
+
+def _visible(cur, ids: dict) -> dict[str, int]:
+    counts = {}
+    for table, query in READS.items():
+        cur.execute(query, ids)
+        counts[table] = cur.fetchone()[0]
+    return counts
+
+
+class TestPolicies:
+    def test_member_reads_the_group(self, cur, ids):
+        _become(cur, MEMBER)
+
+        assert all(_visible(cur, ids).values())
+
+    def test_non_member_reads_nothing(self, cur, ids):
+        _become(cur, OUTSIDER)
+
+        assert _visible(cur, ids) == dict.fromkeys(READS, 0)
+
+    @pytest.mark.parametrize(
+        "query",
+        [
+            "INSERT INTO public.expenses (group_id, created_by, total_amount)"
+            " VALUES (%(group)s, %(user)s, 5)",
+            "INSERT INTO public.receipt_items (expense_id, item_name, total_price)"
+            " VALUES (%(expense)s, 'Cola', 5)",
+            "INSERT INTO public.item_assignments (receipt_item_id, user_id)"
+            " VALUES (%(item)s, %(user)s)",
+            "INSERT INTO public.settlements (expense_id, from_user_id, to_user_id, amount)"
+            " VALUES (%(expense)s, %(user)s, %(user)s, 5)",
+        ],
+    )
+    def test_non_member_writes_are_rejected(self, cur, ids, query):
+        import psycopg
+
+        _become(cur, OUTSIDER)
+
+        with pytest.raises(psycopg.errors.InsufficientPrivilege):
+            cur.execute(query, {**ids, "user": OUTSIDER})
+
+    def test_non_member_deletes_nothing(self, cur, ids):
+        _become(cur, OUTSIDER)
+
+        cur.execute(
+            "DELETE FROM public.item_assignments WHERE receipt_item_id = %(item)s", ids
+        )
+
+        assert cur.rowcount == 0
+
+    def test_anon_reads_nothing(self, cur, ids):
+        cur.execute("SET LOCAL ROLE anon")
+
+        assert _visible(cur, ids) == dict.fromkeys(READS, 0)
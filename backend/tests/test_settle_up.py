@@ -0,0 +1,95 @@
+"""Tests for POST /api/settlements/settle-up."""
+from fastapi.testclient import TestClient
+
+from app.main import app
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+BOB = "00000000-0000-0000-0000-000000000002"
+CAROL = "00000000-0000-0000-0000-000000000003"
+
+
+def _seed(fake_db) -> dict:
+    fake_db.seed(
+        "users",
+        [{"id": uid, "email": f"{uid}@example.com"} for uid in (ALICE, BOB, CAROL)],
+    )
+    trip, flat = fake_db.seed(
+        "groups",
+        [{"name": "Trip", "created_by": ALICE}, {"name": "Flat", "created_by": ALICE}],
+    )
+    fake_db.seed(
+        "group_members",
+        [
+            {"group_id": g["id"], "user_id": uid}
+            for g in (trip, flat)
+            for uid in (ALICE, BOB, CAROL)
+        ],
+    )
+    dinner, taxi, rent = fake_db.seed(
+        "expenses",
+        [
+            {"group_id": trip["id"], "created_by": ALICE, "total_amount": 30},
+            {"group_id": trip["id"], "created_by": BOB, "total_amount": 20},
+            {"group_id": flat["id"], "created_by": ALICE, "total_amount": 900},
+        ],
+    )
+    fake_db.seed(
+        "settlements",
+        [
+            {"expense_id": dinner["id"], "from_user_id": BOB, "to_user_id": ALICE, "amount": 10},
+            {"expense_id": dinner["id"], "from_user_id": CAROL, "to_user_id": ALICE, "amount": 10},
+            {"expense_id": taxi["id"], "from_user_id": ALICE, "to_user_id": BOB, "amount": 10},
+            {"expense_id": rent["id"], "from_user_id": BOB, "to_user_id": ALICE, "amount": 300},
+        ],
+    )
+    return {"trip": trip["id"], "dinner": dinner["id"], "taxi": taxi["id"], "rent": rent["id"]}
+
+
+def _status(fake_db, expense_id: str) -> str:
+    return next(e["status"] for e in fake_db.rows("expenses") if e["id"] == expense_id)
+
+
+class TestSettleUp:
+    def test_pays_both_directions_in_one_call(self, fake_db):
+        ids = _seed(fake_db)
+        fake_db.round_trips = 0
+
+        response = TestClient(app).post(
+            "/api/settlements/settle-up",
+            json={"user_id": BOB, "group_id": ids["trip"]},
+            headers=auth_header(ALICE),
+        )
+
+        assert response.status_code == 200
+        assert sorted(s["amount"] for s in response.json()) == [10, 10]
+        # Membership check plus the settle_up call
+        assert fake_db.round_trips == 2
+        # Taxi had only the Alice/Bob settlement; dinner still waits on Carol
+        assert _status(fake_db, ids["taxi"]) == "settled"
+        assert _status(fake_db, ids["dinner"]) == "pending"
+        # Outside the group, nothing changed
+        assert _status(fake_db, ids["rent"]) == "pending"
+
+    def test_without_group_covers_every_group(self, fake_db):
+        ids = _seed(fake_db)
+        client = TestClient(app)
+
+        first = client.post(
+            "/api/settlements/settle-up", json={"user_id": ALICE}, headers=auth_header(BOB)
+        )
+        again = client.post(
+            "/api/settlements/settle-up", json={"user_id": ALICE}, headers=auth_header(BOB)
+        )
+
+        assert len(first.json()) == 3
+        assert again.json() == []
+        assert _status(fake_db, ids["rent"]) == "settled"
+
+    def test_cannot_settle_with_yourself(self, fake_db):
+        response = TestClient(app).post(
+            "/api/settlements/settle-up", json={"user_id": ALICE}, headers=auth_header(ALICE)
+        )
+
+        assert response.status_code == 422
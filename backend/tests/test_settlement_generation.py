@@ -0,0 +1,298 @@
+"""Tests for server-side settlement generation and its parity with Python.
+
+``generate_settlements`` reimplements calculate_shares, calculate_balances
+and simplify_debts in SQL and must agree with them to the cent. The parity
+cases run against the fake database's port of the function. When
+TEST_DATABASE_URL points at a database with supabase/migration.sql applied
+(and psycopg is installed), they also run against the real function.
+"""
+import random
+import threading
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.db.client import get_supabase_admin
+from app.main import app
+from app.services.debt_simplifier import calculate_balances, simplify_debts
+from app.services.splitter import calculate_shares
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+BOB = "00000000-0000-0000-0000-000000000002"
+OUTSIDER = "00000000-0000-0000-0000-0000000000ff"
+
+
+def random_expense(rnd: random.Random) -> dict:
+    """Users, items, tax/tip and earlier payments, built to hit rounding ties."""
+    users = [str(uuid.UUID(int=rnd.getrandbits(128))) for _ in range(rnd.randint(2, 7))]
+    prices = [
+        rnd.choice([rnd.randint(1, 9999) / 100, 0.25, 0.05, 10.01, 2.675, 1.005, 0.125])
+        for _ in range(rnd.randint(1, 10))
+    ]
+    items = [
+        (price, rnd.sample(users, rnd.randint(0, len(users)))) for price in prices
+    ]
+    paid = []
+    if rnd.random() < 0.3:
+        debtor, payer = rnd.sample(users, 2)
+        paid.append((debtor, payer, rnd.randint(1, 3000) / 100))
+    return {
+        "users": users,
+        "payer": rnd.choice(users),
+        "items": items,
+        "tax": rnd.choice([0.0, rnd.randint(0, 999) / 100, 1.0]),
+        "tip": rnd.choice([0.0, rnd.randint(0, 1999) / 100]),
+        "total": round(sum(prices) + rnd.randint(0, 500) / 100, 2),
+        "paid": paid,
+    }
+
+
+def python_settlements(expense: dict, items: list[tuple], paid: list[tuple]) -> list[tuple]:
+    """What the API computed before: shares, balances net of payments, greedy."""
+    shares = calculate_shares(
+        [{"total_price": price, "assigned_user_ids": users} for price, users in items],
+        tax_amount=expense["tax"],
+        tip_amount=expense["tip"],
+    )
+    balances = calculate_balances(
+        user_shares=[{"user_id": str(s.user_id), "total": s.total} for s in shares],
+        payer_id=expense["payer"],
+        total_amount=expense["total"],
+    )
+    for from_user, to_user, amount in paid:
+        balances[from_user] = balances.get(from_user, 0) + amount
+        balances[to_user] = balances.get(to_user, 0) - amount
+    return [(str(d.from_user), str(d.to_user), d.amount) for d in simplify_debts(balances)]
+
+
+def _seed(fake_db, expense: dict) -> str:
+    fake_db.seed("users", [{"id": u, "email": f"{u}@example.com"} for u in expense["users"]])
+    group = fake_db.seed("groups", [{"name": "Parity", "created_by": expense["payer"]}])[0]
+    fake_db.seed("group_members", [{"group_id": group["id"], "user_id": u} for u in expense["users"]])
+    row = fake_db.seed(
+        "expenses",
+        [
+            {
+                "group_id": group["id"],
+                "created_by": expense["payer"],
+                "total_amount": expense["total"],
+                "tax_amount": expense["tax"],
+                "tip_amount": expense["tip"],
+                # Edited since the paid rows (version 1) were generated
+                "version": 2,
+            }
+        ],
+    )[0]
+    for price, users in expense["items"]:
+        item = fake_db.seed(
+            "receipt_items",
+            [{"expense_id": row["id"], "item_name": "Item", "total_price": price}],
+        )[0]
+        fake_db.seed("item_assignments", [{"receipt_item_id": item["id"], "user_id": u} for u in users])
+    fake_db.seed(
+        "settlements",
+        [
+            {"expense_id": row["id"], "from_user_id": f, "to_user_id": t, "amount": a, "is_paid": True}
+            for f, t, a in expense["paid"]
+        ],
+    )
+    return row["id"]
+
+
+def _in_created_order(fake_db, expense_id: str) -> tuple[list[tuple], list[tuple]]:
+    """Items and paid rows in the (created_at, id) order the function uses."""
+    order = lambda r: (r["created_at"], r["id"])  # noqa: E731
+    assignments = sorted(fake_db.rows("item_assignments"), key=order)
+    items = [
+        (
+            item["total_price"],
+            [a["user_id"] for a in assignments if a["receipt_item_id"] == item["id"]],
+        )
+        for item in sorted(fake_db.rows("receipt_items"), key=order)
+        if item["expense_id"] == expense_id
+    ]
+    paid = [
+        (s["from_user_id"], s["to_user_id"], s["amount"])
+        for s in sorted(fake_db.rows("settlements"), key=order)
+        if s["expense_id"] == expense_id and s["is_paid"]
+    ]
+    return items, paid
+
+
+class TestParity:
+    @pytest.mark.parametrize("seed", range(300))
+    def test_matches_python(self, fake_db, seed):
+        expense = random_expense(random.Random(seed))
+        expense_id = _seed(fake_db, expense)
+        items, paid = _in_created_order(fake_db, expense_id)
+
+        rows = get_supabase_admin().rpc(
+            "generate_settlements", {"p_expense_id": expense_id, "p_user_id": expense["payer"]}
+        ).execute().data
+
+        generated = [
+            (s["from_user_id"], s["to_user_id"], s["amount"]) for s in rows if not s["is_paid"]
+        ]
+        assert generated == python_settlements(expense, items, paid)
+        assert len(rows) - len(generated) == len(expense["paid"])
+
+
+def _seed_pg(cur, expense: dict) -> str:
+    for u in expense["users"]:
+        cur.execute("INSERT INTO auth.users (id, email) VALUES (%s, %s)", (u, f"{u}@example.com"))
+    cur.execute(
+        "INSERT INTO public.groups (name, created_by) VALUES ('Parity', %s) RETURNING id",
+        (expense["payer"],),
+    )
+    group_id = cur.fetchone()[0]
+    for u in expense["users"]:
+        cur.execute(
+            "INSERT INTO public.group_members (group_id, user_id) VALUES (%s, %s)", (group_id, u)
+        )
+    cur.execute(
+        "INSERT INTO public.expenses"
+        " (group_id, created_by, total_amount, tax_amount, tip_amount, version)"
+        " VALUES (%s, %s, %s, %s, %s, 2) RETURNING id",
+        (group_id, expense["payer"], expense["total"], expense["tax"], expense["tip"]),
+    )
+    expense_id = cur.fetchone()[0]
+    for price, users in expense["items"]:
+        cur.execute(
+            "INSERT INTO public.receipt_items (expense_id, item_name, total_price)"
+            " VALUES (%s, 'Item', %s) RETURNING id",
+            (expense_id, price),
+        )
+        item_id = cur.fetchone()[0]
+        for u in users:
+            cur.execute(
+                "INSERT INTO public.item_assignments (receipt_item_id, user_id) VALUES (%s, %s)",
+                (item_id, u),
+            )
+    for f, t, a in expense["paid"]:
+        cur.execute(
+            "INSERT INTO public.settlements (expense_id, from_user_id, to_user_id, amount, is_paid)"
+            " VALUES (%s, %s, %s, %s, true)",
+            (expense_id, f, t, a),
+        )
+    return expense_id
+
+
+class TestPostgresParity:
+    """Same cases against the SQL function, inside a rolled-back transaction."""
+
+    @pytest.mark.parametrize("seed", range(300))
+    def test_matches_python(self, pg, seed):
+        expense = random_expense(random.Random(seed))
+        try:
+            with pg.cursor() as cur:
+                expense_id = _seed_pg(cur, expense)
+
+                cur.execute(
+                    "SELECT ri.total_price::float8,"
+                    " coalesce(array_agg(ia.user_id::text ORDER BY ia.created_at, ia.id)"
+                    "   FILTER (WHERE ia.id IS NOT NULL), '{}')"
+                    " FROM public.receipt_items ri"
+                    " LEFT JOIN public.item_assignments ia ON ia.receipt_item_id = ri.id"
+                    " WHERE ri.expense_id = %s GROUP BY ri.id ORDER BY ri.created_at, ri.id",
+                    (expense_id,),
+                )
+                items = [(price, users) for price, users in cur.fetchall()]
+                cur.execute(
+                    "SELECT from_user_id::text, to_user_id::text, amount::float8 FROM public.settlements"
+                    " WHERE expense_id = %s ORDER BY created_at, id",
+                    (expense_id,),
+                )
+                paid = cur.fetchall()
+
+                cur.execute(
+                    "SELECT from_user_id::text, to_user_id::text, amount::float8"
+                    " FROM public.generate_settlements(%s, %s) WHERE NOT is_paid",
+                    (expense_id, expense["payer"]),
+                )
+                generated = cur.fetchall()
+        finally:
+            pg.rollback()
+
+        assert generated == python_settlements(expense, items, paid)
+
+    def test_concurrent_calls_generate_once(self, pg_dsn):
+        """A second caller waits on the advisory lock, then reuses the rows."""
+        import psycopg
+
+        expense = random_expense(random.Random(1))
+        expense["items"] = [(20.0, expense["users"][:2])]
+        with psycopg.connect(pg_dsn, autocommit=True) as setup:
+            expense_id = _seed_pg(setup.cursor(), expense)
+        call = (
+            "SELECT id FROM public.generate_settlements(%s, %s) WHERE NOT is_paid ORDER BY id"
+        )
+        try:
+            with psycopg.connect(pg_dsn) as first, psycopg.connect(pg_dsn) as second:
+                first_ids = first.execute(call, (expense_id, expense["payer"])).fetchall()
+                result = {}
+                waiter = threading.Thread(
+                    target=lambda: result.update(
+                        ids=second.execute(call, (expense_id, expense["payer"])).fetchall()
+                    )
+                )
+                waiter.start()
+                waiter.join(0.5)
+                assert waiter.is_alive()  # Blocked until the first transaction ends
+                first.commit()
+                waiter.join(5)
+                second.commit()
+            with psycopg.connect(pg_dsn) as check:
+                stored = check.execute(
+                    "SELECT count(*) FROM public.settlements WHERE expense_id = %s AND NOT is_paid",
+                    (expense_id,),
+                ).fetchone()[0]
+        finally:
+            with psycopg.connect(pg_dsn, autocommit=True) as cleanup:
+                cleanup.execute(
+                    "DELETE FROM auth.users WHERE id = ANY(%s::uuid[])", (expense["users"],)
+                )
+
+        assert first_ids and result["ids"] == first_ids
+        assert stored == len(first_ids)
+
+
+class TestGetSettlements:
+    @pytest.fixture
+    def expense_id(self, fake_db) -> str:
+        return _seed(
+            fake_db,
+            {
+                "users": [ALICE, BOB],
+                "payer": ALICE,
+                "items": [(20.0, [ALICE, BOB])],
+                "tax": 0.0,
+                "tip": 0.0,
+                "total": 20.0,
+                "paid": [],
+            },
+        )
+
+    def test_generation_is_one_call(self, fake_db, expense_id):
+        client = TestClient(app)
+
+        first = client.get(f"/api/settlements/expense/{expense_id}", headers=auth_header(BOB))
+        trips = fake_db.round_trips
+        second = client.get(f"/api/settlements/expense/{expense_id}", headers=auth_header(BOB))
+
+        assert trips == 2  # The version check, then generate_settlements
+        assert fake_db.round_trips - trips == 1
+        assert first.json() == second.json()
+        assert [(s["from_user_id"], s["amount"]) for s in first.json()] == [(BOB, 10.0)]
+
+    def test_errors(self, fake_db, expense_id):
+        client = TestClient(app)
+
+        missing = client.get(f"/api/settlements/expense/{uuid.uuid4()}", headers=auth_header(BOB))
+        outsider = client.get(f"/api/settlements/expense/{expense_id}", headers=auth_header(OUTSIDER))
+
+        assert missing.status_code == 404
+        assert outsider.status_code == 403
+        assert fake_db.rows("settlements") == []
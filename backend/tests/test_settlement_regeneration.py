@@ -0,0 +1,111 @@
+"""Tests for version-aware settlement regeneration."""
+from fastapi.testclient import TestClient
+
+from app.db import fake
+from app.main import app
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+BOB = "00000000-0000-0000-0000-000000000002"
+CAROL = "00000000-0000-0000-0000-000000000003"
+
+
+def _seed_expense(fake_db) -> tuple[str, str]:
+    """Alice paid 30: pizza 20 (Alice+Bob), beer 10 (Carol)."""
+    fake_db.seed(
+        "users",
+        [{"id": uid, "email": f"{uid}@example.com"} for uid in (ALICE, BOB, CAROL)],
+    )
+    group = fake_db.seed("groups", [{"name": "Dinner", "created_by": ALICE}])[0]
+    fake_db.seed(
+        "group_members",
+        [{"group_id": group["id"], "user_id": uid} for uid in (ALICE, BOB, CAROL)],
+    )
+    expense = fake_db.seed(
+        "expenses",
+        [{"group_id": group["id"], "created_by": ALICE, "total_amount": 30.0}],
+    )[0]
+    pizza, beer = fake_db.seed(
+        "receipt_items",
+        [
+            {"expense_id": expense["id"], "item_name": "Pizza", "total_price": 20.0},
+            {"expense_id": expense["id"], "item_name": "Beer", "total_price": 10.0},
+        ],
+    )
+    fake_db.seed(
+        "item_assignments",
+        [
+            {"receipt_item_id": pizza["id"], "user_id": ALICE},
+            {"receipt_item_id": pizza["id"], "user_id": BOB},
+            {"receipt_item_id": beer["id"], "user_id": CAROL},
+        ],
+    )
+    return expense["id"], beer["id"]
+
+
+def _debts(settlements: list[dict]) -> set[tuple]:
+    return {(s["from_user_id"], s["to_user_id"], s["amount"], s["is_paid"]) for s in settlements}
+
+
+class TestSettlementRegeneration:
+    def test_current_settlements_are_one_select(self, fake_db):
+        expense_id, _ = _seed_expense(fake_db)
+        client = TestClient(app)
+        client.get(f"/api/settlements/expense/{expense_id}", headers=auth_header(BOB))
+        fake_db.round_trips = 0
+
+        response = client.get(f"/api/settlements/expense/{expense_id}", headers=auth_header(BOB))
+
+        assert _debts(response.json()) == {(BOB, ALICE, 10.0, False), (CAROL, ALICE, 10.0, False)}
+        assert fake_db.round_trips == 1
+
+    def test_expense_without_debts_is_generated_once(self, fake_db, monkeypatch):
+        _seed_expense(fake_db)
+        # Alice paid for her own coffee: nobody owes anything
+        group_id = fake_db.rows("groups")[0]["id"]
+        expense_id = fake_db.seed(
+            "expenses", [{"group_id": group_id, "created_by": ALICE, "total_amount": 4.0}]
+        )[0]["id"]
+        coffee = fake_db.seed(
+            "receipt_items", [{"expense_id": expense_id, "item_name": "Coffee", "total_price": 4.0}]
+        )[0]
+        fake_db.seed("item_assignments", [{"receipt_item_id": coffee["id"], "user_id": ALICE}])
+        calls = []
+        real = fake.RPC_FUNCTIONS["generate_settlements"]
+        monkeypatch.setitem(
+            fake.RPC_FUNCTIONS,
+            "generate_settlements",
+            lambda db, params: calls.append(params) or real(db, params),
+        )
+        client = TestClient(app)
+
+        first = client.get(f"/api/settlements/expense/{expense_id}", headers=auth_header(BOB))
+        fake_db.round_trips = 0
+        second = client.get(f"/api/settlements/expense/{expense_id}", headers=auth_header(BOB))
+
+        assert first.json() == second.json() == []
+        assert len(calls) == 1
+        assert fake_db.round_trips == 1
+
+    def test_edit_regenerates_and_nets_out_paid_amounts(self, fake_db):
+        expense_id, beer = _seed_expense(fake_db)
+        client = TestClient(app)
+        settlements = client.get(
+            f"/api/settlements/expense/{expense_id}", headers=auth_header(BOB)
+        ).json()
+        bob_owes = next(s for s in settlements if s["from_user_id"] == BOB)
+        client.post(f"/api/settlements/{bob_owes['id']}/mark-paid", headers=auth_header(BOB))
+
+        # Bob had the beer, not Carol: he now owes 20 in total and paid 10
+        client.patch(
+            f"/api/expenses/{expense_id}",
+            json={"items_updated": [{"id": beer, "assigned_user_ids": [BOB]}]},
+            headers=auth_header(ALICE),
+        )
+        response = client.get(f"/api/settlements/expense/{expense_id}", headers=auth_header(CAROL))
+
+        assert response.status_code == 200
+        assert _debts(response.json()) == {(BOB, ALICE, 10.0, True), (BOB, ALICE, 10.0, False)}
+        assert {s["expense_version"] for s in response.json()} == {2}
+        assert _debts(fake_db.rows("settlements")) == _debts(response.json())
@@ -0,0 +1,72 @@
+"""Tests for GET /api/users/search."""
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routers.users import get_search_cache
+from tests.conftest import auth_header
+
+
+ALICE = "00000000-0000-0000-0000-000000000001"
+
+
+@pytest.fixture
+def users(fake_db):
+    get_search_cache().clear()
+    names = ["Alice", "Alicia Keys", "Bob", "Malice Cooper", "Alfred", "Bobby Tables"]
+    fake_db.seed(
+        "users",
+        [{"id": ALICE, "email": "me@example.com", "display_name": "Me"}]
+        + [
+            {"id": str(uuid.uuid4()), "email": f"{n.split()[0].lower()}@example.com", "display_name": n}
+            for n in names
+        ],
+    )
+    yield
+    get_search_cache().clear()
+
+
+def _search(client: TestClient, **params) -> dict:
+    response = client.get("/api/users/search", params=params, headers=auth_header(ALICE))
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+class TestUserSearch:
+    def test_prefix_and_fuzzy_matches(self, users):
+        client = TestClient(app)
+        prefix = [u["display_name"] for u in _search(client, q="alic")["results"]]
+        typo = [u["display_name"] for u in _search(client, q="malise cooper")["results"]]
+
+        assert prefix == ["Alice", "Alicia Keys"]
+        assert typo == ["Malice Cooper"]
+
+    def test_pages_cover_all_matches_once(self, users):
+        client = TestClient(app)
+        seen, cursor = [], None
+        while True:
+            params = {"q": "b", "limit": 1} | ({"cursor": cursor} if cursor else {})
+            page = _search(client, **params)
+            seen += [u["display_name"] for u in page["results"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        assert seen == ["Bob", "Bobby Tables"]
+
+    def test_first_page_is_cached(self, users, fake_db):
+        client = TestClient(app)
+        first = _search(client, q="  AL ")
+        trips = fake_db.round_trips
+
+        assert _search(client, q="al") == first
+        assert fake_db.round_trips == trips
+
+    def test_invalid_cursor_is_rejected(self, users):
+        response = TestClient(app).get(
+            "/api/users/search", params={"q": "al", "cursor": "nope"}, headers=auth_header(ALICE)
+        )
+
+        assert response.status_code == 400